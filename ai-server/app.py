@@ -1,4 +1,88 @@
-import tensorflow as tf
-print("TensorFlow built with CUDA:", tf.test.is_built_with_cuda())
-print("Num GPUs Available:", len(tf.config.list_physical_devices('GPU')))
-print(tf.config.list_physical_devices('GPU'))
+import os
+import logging
+from flask import Flask, jsonify
+from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def create_app(load_models=False):
+    """
+    สร้าง Flask app ของ AI Server และลงทะเบียน blueprints ทั้งหมด
+
+    การ import และสร้าง app ไม่โหลด TensorFlow หรือโมเดลใด ๆ (ใช้เวลาไม่ถึงวินาที)
+
+    Args:
+        load_models: โหลดและ warm-up โมเดลตาม AI_SERVER_WARMUP (blocking / background / lazy)
+            (False = โหลดเมื่อมีคำขอแรก หรือให้ gunicorn โหลดใน post_fork ของแต่ละ worker)
+
+    Returns:
+        app: Flask app
+    """
+    from src.routes.face_detection import face_detection_bp
+    from src.routes.face_recognition import face_recognition_bp
+    from src.routes.gallery import gallery_bp
+    from src.services import models
+    from src.services.inference import InferenceBusyError
+    from src.utils import metrics
+
+    app = Flask(__name__)
+    CORS(app)
+    # /metrics, เวลาต่อ endpoint และ Server-Timing (ปิดได้ด้วย AI_SERVER_METRICS=0)
+    metrics.init_app(app)
+    metrics.register_collector(models.metric_families)
+
+    @app.errorhandler(InferenceBusyError)
+    def inference_busy(error):
+        """คิวประมวลผลโมเดลเต็ม: ตอบ 503 พร้อม Retry-After ให้ client ลองใหม่ภายหลัง"""
+        response = jsonify({"status": "error", "error": str(error), "retry_after": error.retry_after})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response
+
+    @app.errorhandler(Exception)
+    def unexpected_error(error):
+        """ข้อผิดพลาดที่ route ไม่ได้จัดการเอง: ตอบ 500 พร้อมข้อความในรูปแบบ JSON เดียวกับทุก endpoint"""
+        if isinstance(error, HTTPException):
+            return error
+        logger.exception(f"เกิดข้อผิดพลาดระหว่างประมวลผลคำขอ: {error}")
+        return jsonify({"error": str(error)}), 500
+
+    app.register_blueprint(face_detection_bp, url_prefix='/api/face/detection')
+    app.register_blueprint(face_recognition_bp, url_prefix='/api/face/recognition')
+    app.register_blueprint(gallery_bp, url_prefix='/api/face/gallery')
+
+    @app.route('/api/health', methods=['GET'])
+    def health():
+        """ตรวจสอบสถานะของ AI Server"""
+        return jsonify({
+            "status": "ok",
+            "message": "AI Service is running",
+            "pid": os.getpid(),
+            "models_loaded": models.models_loaded()
+        })
+
+    @app.route('/api/ready', methods=['GET'])
+    def ready():
+        """ตรวจสอบว่าพร้อมรับคำขอหรือยัง (200 เมื่อโหลดและ warm-up โมเดลเสร็จ ไม่เช่นนั้น 503) พร้อมสถานะของแต่ละโมเดล"""
+        is_ready = models.is_ready()
+        return jsonify({
+            "status": "ready" if is_ready else "not_ready",
+            "pid": os.getpid(),
+            "models": models.model_status()
+        }), 200 if is_ready else 503
+
+    if load_models:
+        models.start_warm_up()
+
+    return app
+
+
+if __name__ == '__main__':
+    # โหมดพัฒนา: process เดียวแบบ multi-thread (production ใช้ gunicorn -c gunicorn.conf.py "app:create_app()")
+    # ข้อมูล CUDA / GPU ถูก log ตอนโหลด FaceNet (ดู configure_gpus)
+    app = create_app(load_models=True)
+    app.run(host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', '3002')), threaded=True)
@@ -0,0 +1,96 @@
+"""
+วัดเวลา cold start ของแต่ละ entry point ของ AI Server โดยรันแต่ละกรณีใน process ใหม่
+
+รายงานเวลาภายใน process (ตั้งแต่เริ่ม import จนเสร็จ) และเวลาทั้งหมดรวมการเริ่ม Python interpreter
+และบอกว่า TensorFlow ถูก import แล้วหรือยัง
+
+ตัวอย่าง:
+    FACENET_MODEL_PATH=../models/facenet/20180402-114759/20180402-114759.pb python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --entries create_app,health,quality --repeats 3 --json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+_IMAGE = '''
+import base64, cv2, numpy as np
+image = base64.b64encode(cv2.imencode('.jpg', np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8))[1].tobytes()).decode()
+'''
+
+# โค้ดของแต่ละ entry point (รันหลังจับเวลาเริ่มต้น)
+ENTRIES = {
+    'import_routes': 'import src.routes.face_recognition, src.routes.face_detection, src.routes.gallery',
+    'create_app': 'from app import create_app; create_app()',
+    'health': 'from app import create_app; create_app().test_client().get("/api/health")',
+    'quality': _IMAGE + 'from app import create_app\n'
+               'create_app().test_client().post("/api/face/recognition/quality", json={"image": image})',
+    'embeddings': _IMAGE + 'from app import create_app\n'
+                  'create_app().test_client().post("/api/face/recognition/embeddings", json={"image": image})',
+    'load_models': 'from src.services import models; models.load_models()',
+    'warm_up': 'from src.services import models; models.start_warm_up("blocking")',
+}
+
+_TEMPLATE = '''
+import time
+start = time.perf_counter()
+{code}
+import sys, json
+print(json.dumps({{"seconds": time.perf_counter() - start, "tensorflow": "tensorflow" in sys.modules}}))
+'''
+
+
+def run_entry(code):
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', _TEMPLATE.format(code=code)], cwd=ROOT,
+                               capture_output=True, text=True)
+    total = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else 'failed')
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['process_seconds'] = total
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', default=','.join(ENTRIES), help='entry point คั่นด้วย comma')
+    parser.add_argument('--repeats', type=int, default=1, help='จำนวนครั้งต่อ entry point (รายงานค่ากลาง)')
+    parser.add_argument('--json', action='store_true', help='แสดงผลเป็น JSON')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.entries.split(','):
+        if name not in ENTRIES:
+            raise SystemExit(f"unknown entry {name!r} (available: {', '.join(ENTRIES)})")
+        try:
+            runs = [run_entry(ENTRIES[name]) for _ in range(args.repeats)]
+        except RuntimeError as e:
+            results.append({'entry': name, 'error': str(e)})
+            continue
+        results.append({
+            'entry': name,
+            'seconds': float(np.median([run['seconds'] for run in runs])),
+            'process_seconds': float(np.median([run['process_seconds'] for run in runs])),
+            'tensorflow_imported': runs[0]['tensorflow'],
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'entry':<15}{'seconds':>9}{'process':>9}  tensorflow")
+    for row in results:
+        if 'error' in row:
+            print(f"{row['entry']:<15}  error: {row['error']}")
+            continue
+        print(f"{row['entry']:<15}{row['seconds']:>9.2f}{row['process_seconds']:>9.2f}  {row['tensorflow_imported']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+เปรียบเทียบ throughput ของการตรวจจับใบหน้าด้วย MTCNN แบบทีละรูป (detect_faces) กับแบบ batch
+(detect_faces_batch) และตรวจว่าผลลัพธ์ตรงกัน
+
+ตัวอย่าง:
+    python benchmarks/detector_batch.py --images ../data/sample_photos --batch-sizes 4,16,64
+    python benchmarks/detector_batch.py --max-padding 0 --json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.services import mtcnn_batch
+from src.services.face_detection import detect_faces, detect_faces_batch
+from benchmarks.detectors import load_images
+
+
+def same_faces(expected, actual):
+    if len(expected) != len(actual):
+        return False
+    return all(a['box'] == b['box'] and a['keypoints'] == b['keypoints']
+               and abs(float(a['confidence']) - float(b['confidence'])) < 1e-4
+               for a, b in zip(expected, actual))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', help='โฟลเดอร์รูปภาพ (ถ้าไม่ระบุจะใช้รูปสุ่มขนาด 1280x960)')
+    parser.add_argument('--limit', type=int, default=64, help='จำนวนรูปสูงสุด')
+    parser.add_argument('--batch-sizes', default='4,16,64')
+    parser.add_argument('--max-side', type=int, default=1280)
+    parser.add_argument('--max-padding', type=float, default=mtcnn_batch.DEFAULT_MAX_PADDING,
+                        help='พื้นที่ padding ที่ยอมให้เมื่อรวม pyramid level ต่างขนาดกัน (0 = ผลลัพธ์ตรงกันทุกบิต)')
+    parser.add_argument('--json', action='store_true', help='แสดงผลเป็น JSON')
+    args = parser.parse_args()
+
+    if args.images:
+        images = load_images(args.images, args.limit)
+    else:
+        rng = np.random.default_rng(0)
+        images = [rng.integers(0, 256, size=(960, 1280, 3), dtype=np.uint8) for _ in range(args.limit)]
+    if not images:
+        raise SystemExit(f"no images found in {args.images}")
+    mtcnn_batch.DEFAULT_MAX_PADDING = args.max_padding
+
+    # warm up ทั้งสองแบบ (สร้าง detector และ trace เครือข่าย) ก่อนจับเวลา
+    detect_faces(images[0], backend='mtcnn', max_side=args.max_side)
+    detect_faces_batch(images[:2], backend='mtcnn', max_side=args.max_side)
+
+    start = time.perf_counter()
+    serial = [detect_faces(image, backend='mtcnn', max_side=args.max_side) for image in images]
+    serial_seconds = time.perf_counter() - start
+    results = [{
+        'mode': 'serial',
+        'batch_size': 1,
+        'images_per_sec': len(images) / serial_seconds,
+        'faces': sum(len(faces) for faces in serial),
+        'matching_images': len(images),
+    }]
+
+    for size in [int(value) for value in args.batch_sizes.split(',')]:
+        start = time.perf_counter()
+        batched = []
+        for i in range(0, len(images), size):
+            batched.extend(detect_faces_batch(images[i:i + size], backend='mtcnn', max_side=args.max_side))
+        seconds = time.perf_counter() - start
+        results.append({
+            'mode': 'batch',
+            'batch_size': size,
+            'images_per_sec': len(images) / seconds,
+            'speedup': serial_seconds / seconds,
+            'faces': sum(len(faces) for faces in batched),
+            'matching_images': sum(same_faces(a, b) for a, b in zip(serial, batched)),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<8}{'batch':>6}{'img/s':>9}{'speedup':>9}{'faces':>7}{'match':>8}")
+    for row in results:
+        print(f"{row['mode']:<8}{row['batch_size']:>6}{row['images_per_sec']:>9.2f}{row.get('speedup', 1.0):>9.2f}"
+              f"{row['faces']:>7}{row['matching_images']:>5}/{len(images)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+เปรียบเทียบความเร็วและ recall ของ detector แต่ละ backend และขนาดการย่อรูป (max_side)
+
+recall วัดเทียบกับกล่องของ config แรก (ค่าเริ่มต้นคือ MTCNN ที่ความละเอียดเต็ม) โดยนับว่าพบใบหน้า
+เมื่อ IoU >= --iou ใช้ดูว่าย่อรูปได้เล็กแค่ไหนก่อนจะเริ่มพลาดใบหน้าเล็ก ๆ
+
+ตัวอย่าง:
+    python benchmarks/detectors.py --images ../data/sample_photos
+    python benchmarks/detectors.py --images photos/ --configs mtcnn:0,mtcnn:1280,mtcnn:640,yunet:1280,yunet:640 --json
+"""
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.services.face_detection import detect_faces, DETECTOR_BACKENDS
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+def load_images(folder, limit):
+    paths = sorted(path for path in glob.glob(os.path.join(folder, '**', '*'), recursive=True)
+                   if path.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+    images = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is not None:
+            images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    return images
+
+
+def parse_configs(value):
+    """"mtcnn:0,yunet:640" -> [('mtcnn', 0), ('yunet', 640)]"""
+    configs = []
+    for item in value.split(','):
+        backend, _, max_side = item.strip().partition(':')
+        if backend not in DETECTOR_BACKENDS:
+            raise SystemExit(f"unknown backend {backend!r} (supported: {', '.join(DETECTOR_BACKENDS)})")
+        configs.append((backend, int(max_side or 0)))
+    return configs
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+def matched(reference, boxes, threshold):
+    """จำนวนกล่องอ้างอิงที่จับคู่กับกล่องที่ตรวจพบได้ (จับคู่แบบ greedy ตาม IoU สูงสุด กล่องละครั้ง)"""
+    used = set()
+    count = 0
+    for ref in reference:
+        scores = [(iou(ref, box), j) for j, box in enumerate(boxes) if j not in used]
+        best = max(scores, default=(0.0, None))
+        if best[0] >= threshold:
+            used.add(best[1])
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', required=True, help='โฟลเดอร์รูปภาพ (ค้นหาในโฟลเดอร์ย่อยด้วย)')
+    parser.add_argument('--limit', type=int, default=200, help='จำนวนรูปสูงสุด')
+    parser.add_argument('--configs', default='mtcnn:0,mtcnn:1280,mtcnn:640,yunet:0,yunet:1280,yunet:640',
+                        help='backend:max_side คั่นด้วย comma (config แรกเป็นค่าอ้างอิงของ recall)')
+    parser.add_argument('--min-face-size', type=int, default=20)
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--json', action='store_true', help='แสดงผลเป็น JSON')
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.limit)
+    if not images:
+        raise SystemExit(f"no images found in {args.images}")
+    configs = parse_configs(args.configs)
+
+    results = []
+    reference = None
+    for backend, max_side in configs:
+        try:
+            # รอบแรกสร้าง detector และ warm up ไม่นับเวลา
+            detect_faces(images[0], backend=backend, max_side=max_side, min_face_size=args.min_face_size)
+        except FileNotFoundError as e:
+            print(f"skip {backend}: {e}", file=sys.stderr)
+            continue
+
+        times, boxes = [], []
+        for image in images:
+            start = time.perf_counter()
+            faces = detect_faces(image, backend=backend, max_side=max_side, min_face_size=args.min_face_size)
+            times.append((time.perf_counter() - start) * 1000)
+            boxes.append([face['box'] for face in faces])
+
+        if reference is None:
+            reference = boxes
+        expected = sum(len(ref) for ref in reference)
+        found = sum(matched(ref, got, args.iou) for ref, got in zip(reference, boxes))
+        results.append({
+            'backend': backend,
+            'max_side': max_side,
+            'images': len(images),
+            'faces': sum(len(got) for got in boxes),
+            'ms_per_image_p50': float(np.percentile(times, 50)),
+            'ms_per_image_p99': float(np.percentile(times, 99)),
+            'recall': found / expected if expected else 1.0,
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'backend':<10}{'max_side':>9}{'faces':>8}{'p50 ms':>10}{'p99 ms':>10}{'recall':>9}")
+    for row in results:
+        print(f"{row['backend']:<10}{row['max_side'] or 'full':>9}{row['faces']:>8}"
+              f"{row['ms_per_image_p50']:>10.1f}{row['ms_per_image_p99']:>10.1f}{row['recall']:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+เปรียบเทียบความเร็วของ FaceNet แต่ละ backend (session / tf.function / tf.function + XLA / SavedModel)
+ตามขนาด batch
+
+ตัวอย่าง:
+    python benchmarks/facenet_backends.py --model ../models/facenet/20180402-114759/20180402-114759.pb
+    python benchmarks/facenet_backends.py --batch-sizes 1,8,32 --backends session,function --json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.services.face_recognition import FaceRecognition
+from src.services.facenet_graph import export_saved_model
+from src.utils.preprocess import aligned_empty
+
+BACKENDS = ('session', 'function', 'function-xla', 'savedmodel')
+
+
+def load_backend(name, model_path, saved_model_dir):
+    if name == 'session':
+        return FaceRecognition(model_path)
+    if name == 'function':
+        return FaceRecognition(model_path, backend='function')
+    if name == 'function-xla':
+        return FaceRecognition(model_path, backend='function', jit_compile=True)
+    if name == 'savedmodel':
+        return FaceRecognition(saved_model_dir, backend='savedmodel')
+    raise ValueError(f"ไม่รู้จัก backend: {name}")
+
+
+def time_batch(face_recognition, images, repeats):
+    """เวลาต่อ batch (มิลลิวินาที) ของ embed_preprocessed หลัง warm-up"""
+    face_recognition.embed_preprocessed(images)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        face_recognition.embed_preprocessed(images)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.array(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='../models/facenet/20180402-114759/20180402-114759.pb')
+    parser.add_argument('--batch-sizes', default='1,2,4,8,16,32,64,128')
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='พิมพ์ผลเป็น JSON')
+    args = parser.parse_args()
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+    backends = args.backends.split(',')
+    rng = np.random.default_rng(0)
+    inputs = {}
+    for size in batch_sizes:
+        # จองแบบจัดแนวเหมือน batch จริงจาก FacePreprocessor.preprocess_batch
+        inputs[size] = aligned_empty((size, 160, 160, 3))
+        inputs[size][...] = rng.uniform(-1, 1, size=(size, 160, 160, 3))
+
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        if 'savedmodel' in backends:
+            export_saved_model(args.model, saved_model_dir)
+
+        results = []
+        reference = {}
+        for name in backends:
+            face_recognition = load_backend(name, args.model, saved_model_dir)
+            for size in batch_sizes:
+                times = time_batch(face_recognition, inputs[size], args.repeats)
+                embeddings = face_recognition.embed_preprocessed(inputs[size])
+                reference.setdefault(size, embeddings)
+                results.append({
+                    'backend': name,
+                    'batch_size': size,
+                    'ms_per_batch_p50': float(np.percentile(times, 50)),
+                    'ms_per_batch_p99': float(np.percentile(times, 99)),
+                    'images_per_sec': float(size / (np.percentile(times, 50) / 1000)),
+                    'max_abs_diff': float(np.abs(embeddings - reference[size]).max()),
+                })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'backend':<14}{'batch':>6}{'p50 ms':>10}{'p99 ms':>10}{'img/s':>10}{'max diff':>11}")
+    for row in results:
+        print(f"{row['backend']:<14}{row['batch_size']:>6}{row['ms_per_batch_p50']:>10.2f}"
+              f"{row['ms_per_batch_p99']:>10.2f}{row['images_per_sec']:>10.0f}{row['max_abs_diff']:>11.1e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""
+วัดความเร็วของแต่ละขั้นตอนใน pipeline ใบหน้าแยกกัน: base64 decode, cv2.imdecode, detect_faces, extract_face,
+preprocess_face, get_embeddings เทียบกับ get_embeddings_batch, quality_assessment และ find_best_match
+ตามขนาดรูป ขนาด batch และขนาดแกลเลอรี
+
+ถ้าไม่ระบุ --model จะสร้าง FaceNet ตัวแทนแบบสุ่มน้ำหนัก (input / phase_train / embeddings 512 มิติเหมือนของจริง)
+จึงรันได้โดยไม่ต้องมีไฟล์โมเดล ค่าเวลาของ embeddings จึงใช้เทียบกันเองระหว่างรอบเท่านั้น ไม่ใช่ความเร็วของ FaceNet จริง
+ถ้าไม่ระบุ --images จะใช้รูปสังเคราะห์ที่เข้ารหัส JPEG แล้ว (สร้างจาก seed คงที่ ผลซ้ำได้ทุกครั้ง)
+
+แต่ละแถวรายงาน throughput, p50/p99 latency และ peak RSS ของ process หลังจบขั้นตอนนั้น (ค่าสะสม เพิ่มขึ้นเท่านั้น
+ขั้นตอนถูกเรียงจากที่ใช้หน่วยความจำน้อยไปมาก; บน Windows ไม่มีค่า RSS) บันทึกผลเป็น JSON ด้วย --output
+แล้วเทียบกับผลรอบก่อนด้วย --compare เพื่อดู regression
+
+ตัวอย่าง:
+    python benchmarks/pipeline.py
+    python benchmarks/pipeline.py --image-sizes 640x480 --batch-sizes 1,32 --gallery-sizes 10000 --json
+    python benchmarks/pipeline.py --output bench-new.json --compare bench-baseline.json
+    python benchmarks/pipeline.py --model ../models/facenet/20180402-114759/20180402-114759.pb --images ../data/sample_photos
+"""
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import platform
+import tempfile
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.services.face_detection import detect_faces
+from src.services.face_recognition import FaceRecognition
+from src.services.gallery_index import GalleryIndex, normalize_embeddings
+from src.utils.preprocess import extract_face, preprocess_face
+from benchmarks.detectors import IMAGE_EXTENSIONS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def build_stand_in_model(path, embedding_size=512, seed=0):
+    """
+    เขียน frozen graph ตัวแทน FaceNet ที่มีน้ำหนักสุ่ม (conv 3x3 stride 2 ห้าชั้น + global average pool + dense)
+    ชื่อ tensor เหมือนโมเดลจริง (input:0, phase_train:0, embeddings:0) จึงโหลดด้วย FaceRecognition ได้ทุก backend
+    """
+    import tensorflow as tf
+
+    rng = np.random.default_rng(seed)
+    graph = tf.Graph()
+    with graph.as_default():
+        x = tf.compat.v1.placeholder(tf.float32, [None, 160, 160, 3], name='input')
+        tf.compat.v1.placeholder_with_default(False, [], name='phase_train')
+        channels = 3
+        for width in (32, 64, 128, 256, 512):
+            kernel = rng.normal(0, np.sqrt(2.0 / (9 * channels)), (3, 3, channels, width)).astype(np.float32)
+            x = tf.nn.relu(tf.nn.conv2d(x, tf.constant(kernel), strides=2, padding='SAME'))
+            channels = width
+        x = tf.reduce_mean(x, axis=[1, 2])
+        weights = rng.normal(0, np.sqrt(1.0 / channels), (channels, embedding_size)).astype(np.float32)
+        tf.identity(tf.matmul(x, tf.constant(weights)), name='embeddings')
+    with open(path, 'wb') as f:
+        f.write(graph.as_graph_def().SerializeToString())
+    return path
+
+
+def peak_rss_mb():
+    """peak RSS ของ process นี้ตั้งแต่เริ่ม (MB) หรือ None ถ้าระบบไม่รองรับ"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux รายงานเป็น KB, macOS เป็น byte
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(stage, size, fn, repeats, items=1):
+    """
+    จับเวลา fn(i) หลัง warm-up หนึ่งครั้ง
+
+    Args:
+        stage: ชื่อขั้นตอน
+        size: ขนาดของกรณีทดสอบ (ขนาดรูป / batch / แกลเลอรี)
+        fn: ฟังก์ชันที่รับลำดับรอบ (ใช้วนรูปเมื่อมีหลายรูป)
+        repeats: จำนวนรอบที่จับเวลา
+        items: จำนวนหน่วยงานต่อการเรียกหนึ่งครั้ง (ใช้คำนวณ throughput)
+    """
+    fn(0)
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn(i)
+        times.append((time.perf_counter() - start) * 1000)
+    times = np.array(times)
+    return {
+        'stage': stage,
+        'size': str(size),
+        'repeats': repeats,
+        'items_per_call': items,
+        'p50_ms': float(np.percentile(times, 50)),
+        'p99_ms': float(np.percentile(times, 99)),
+        'mean_ms': float(times.mean()),
+        'throughput_per_sec': items * 1000.0 / float(times.mean()),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def synthetic_jpeg(width, height, rng):
+    """รูปสังเคราะห์ที่มีโครงสร้างหยาบ + noise ละเอียด (ขนาด JPEG ใกล้เคียงภาพถ่ายมากกว่า noise ล้วน)"""
+    coarse = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+    image = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+    image = cv2.add(image, rng.integers(0, 24, (height, width, 3), dtype=np.uint8))
+    return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def load_inputs(args):
+    """คืน dict ชื่อกรณี -> รายการ JPEG/PNG bytes"""
+    if args.images:
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(args.images) for name in names
+                       if name.lower().endswith(IMAGE_EXTENSIONS))[:args.limit]
+        if not paths:
+            raise SystemExit(f"no images found in {args.images}")
+        encoded = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                encoded.append(f.read())
+        return {f'images({len(encoded)})': encoded}
+
+    rng = np.random.default_rng(args.seed)
+    inputs = {}
+    for size in args.image_sizes.split(','):
+        width, height = (int(value) for value in size.lower().split('x'))
+        inputs[size] = [synthetic_jpeg(width, height, rng)]
+    return inputs
+
+
+def face_box(image, faces):
+    """กรอบใบหน้าที่มั่นใจสูงสุด หรือสี่เหลี่ยมกลางรูป (40% ของด้านสั้น) ถ้าตรวจไม่พบ"""
+    if faces:
+        return max(faces, key=lambda face: face['confidence'])['box']
+    height, width = image.shape[:2]
+    side = int(min(height, width) * 0.4)
+    return [(width - side) // 2, (height - side) // 2, side, side]
+
+
+def image_stages(label, encoded, args):
+    payloads = [base64.b64encode(data).decode() for data in encoded]
+    images = [cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) for data in encoded]
+    rgb = [cv2.cvtColor(image, cv2.COLOR_BGR2RGB) for image in images]
+    crops = []
+    for image in images:
+        crop = extract_face(image, face_box(image, detect_faces(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))))
+        if crop is not None:
+            crops.append(crop)
+    n = len(encoded)
+
+    results = [
+        measure('base64_decode', label, lambda i: base64.b64decode(payloads[i % n]), args.repeats),
+        measure('imdecode', label,
+                lambda i: cv2.imdecode(np.frombuffer(encoded[i % n], np.uint8), cv2.IMREAD_COLOR), args.repeats),
+        measure('detect_faces', label, lambda i: detect_faces(rgb[i % n]), args.detect_repeats),
+        measure('extract_face', label,
+                lambda i: extract_face(images[i % n], face_box(images[i % n], None)), args.repeats),
+    ]
+    if crops:
+        results.append(measure('preprocess_face', label, lambda i: preprocess_face(crops[i % len(crops)]),
+                               args.repeats))
+    return results, crops
+
+
+def embedding_stages(face_recognition, crops, args):
+    results = []
+    for size in [int(value) for value in args.batch_sizes.split(',')]:
+        batch = [crops[i % len(crops)] for i in range(size)]
+        results.append(measure('get_embeddings', size,
+                               lambda i: [face_recognition.get_embeddings(crop) for crop in batch],
+                               args.repeats, items=size))
+        results.append(measure('get_embeddings_batch', size, lambda i: face_recognition.get_embeddings_batch(batch),
+                               args.repeats, items=size))
+    results.append(measure('quality_assessment', 1,
+                           lambda i: face_recognition.quality_assessment(crops[i % len(crops)]), args.repeats))
+    return results
+
+
+def search_stages(face_recognition, args):
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for size in [int(value) for value in args.gallery_sizes.split(',')]:
+        gallery = normalize_embeddings(rng.standard_normal((size, 512)).astype(np.float32))
+        queries = normalize_embeddings(rng.standard_normal((64, 512)).astype(np.float32))
+        results.append(measure('find_best_match', size,
+                               lambda i: face_recognition.find_best_match(queries[i % 64], gallery), args.repeats))
+        # ดัชนีที่สร้างไว้ล่วงหน้า (แบบที่ gallery endpoint ใช้) ไม่ต้องแปลงแกลเลอรีทุกครั้ง
+        index = GalleryIndex.from_embeddings(gallery)
+        results.append(measure('find_best_match_index', size,
+                               lambda i: face_recognition.find_best_match_in_index(queries[i % 64], index), args.repeats))
+    return results
+
+
+def compare(results, baseline_path):
+    """เพิ่มค่า p50 ของรอบก่อนและอัตราส่วน (ค่า > 1 = ช้าลง) ให้แต่ละแถวที่มีในผลรอบก่อน"""
+    with open(baseline_path) as f:
+        baseline = {(row['stage'], row['size']): row for row in json.load(f)['results']}
+    for row in results:
+        previous = baseline.get((row['stage'], row['size']))
+        if previous is not None:
+            row['baseline_p50_ms'] = previous['p50_ms']
+            row['p50_ratio'] = row['p50_ms'] / previous['p50_ms'] if previous['p50_ms'] else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', help='FaceNet frozen graph (ถ้าไม่ระบุจะใช้โมเดลตัวแทนแบบสุ่มน้ำหนัก)')
+    parser.add_argument('--backend', default='session', help='backend ของ FaceNet (session / function / ...)')
+    parser.add_argument('--profile', default='quality', help='โปรไฟล์การ preprocess (quality / fast)')
+    parser.add_argument('--images', help='โฟลเดอร์รูปภาพ (ถ้าไม่ระบุจะใช้รูปสังเคราะห์)')
+    parser.add_argument('--limit', type=int, default=32, help='จำนวนรูปสูงสุดจาก --images')
+    parser.add_argument('--image-sizes', default='640x480,1280x960,1920x1080', help='ขนาดรูปสังเคราะห์ (กว้างxสูง)')
+    parser.add_argument('--batch-sizes', default='1,8,32', help='จำนวนใบหน้าต่อการสร้าง embeddings')
+    parser.add_argument('--gallery-sizes', default='1000,10000,100000', help='จำนวน embeddings ในแกลเลอรี')
+    parser.add_argument('--repeats', type=int, default=50, help='จำนวนรอบที่จับเวลาต่อกรณี')
+    parser.add_argument('--detect-repeats', type=int, default=10, help='จำนวนรอบของ detect_faces (ช้ากว่าขั้นอื่นมาก)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='บันทึกผลเป็นไฟล์ JSON')
+    parser.add_argument('--compare', help='ไฟล์ JSON จากรอบก่อน (เพิ่มอัตราส่วน p50 เทียบกับรอบนั้น)')
+    parser.add_argument('--json', action='store_true', help='แสดงผลเป็น JSON')
+    args = parser.parse_args()
+
+    inputs = load_inputs(args)
+    results = []
+    crops = []
+    for label, encoded in inputs.items():
+        rows, image_crops = image_stages(label, encoded, args)
+        results.extend(rows)
+        crops.extend(image_crops)
+    if not crops:
+        raise SystemExit("could not crop any face from the input images")
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        model_path = args.model or build_stand_in_model(os.path.join(model_dir, 'stand_in.pb'), seed=args.seed)
+        face_recognition = FaceRecognition(model_path, preprocess_profile=args.profile, backend=args.backend)
+        results.extend(embedding_stages(face_recognition, crops, args))
+        results.extend(search_stages(face_recognition, args))
+
+    if args.compare:
+        compare(results, args.compare)
+
+    import tensorflow as tf
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'model': args.model or 'random-weight stand-in',
+            'backend': args.backend,
+            'profile': args.profile,
+            'images': args.images or 'synthetic',
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'tensorflow': tf.__version__,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'stage':<23}{'size':>12}{'items/s':>11}{'p50 ms':>10}{'p99 ms':>10}{'rss MB':>9}{'vs base':>9}")
+    for row in results:
+        rss = f"{row['peak_rss_mb']:.0f}" if row['peak_rss_mb'] is not None else '-'
+        ratio = f"{row['p50_ratio']:.2f}x" if row.get('p50_ratio') is not None else '-'
+        print(f"{row['stage']:<23}{row['size']:>12}{row['throughput_per_sec']:>11.1f}{row['p50_ms']:>10.2f}"
+              f"{row['p99_ms']:>10.2f}{rss:>9}{ratio:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# การตั้งค่า gunicorn สำหรับรัน AI Server ใน production
+#
+#   gunicorn -c gunicorn.conf.py "app:create_app()"
+#
+# แต่ละ worker โหลด FaceNet และ MTCNN ของตัวเองหลัง fork (TensorFlow ไม่ปลอดภัยที่จะ fork
+# หลังสร้าง session แล้ว จึงไม่ใช้ preload_app) และ warm-up ก่อนเริ่มรับคำขอ
+# (AI_SERVER_WARMUP=background ให้ worker รับคำขอทันทีและโหลดใน thread แยก, lazy = โหลดเมื่อมีคำขอแรก)
+import os
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '3002')}")
+
+# worker แต่ละตัวมีสำเนาโมเดลของตัวเอง ใช้หน่วยความจำประมาณ 1GB ต่อ worker
+workers = int(os.environ.get('AI_SERVER_WORKERS', '2'))
+# thread ภายใน worker ใช้โมเดลร่วมกัน (micro-batching รวม get_embeddings ของแต่ละ thread)
+worker_class = 'gthread'
+threads = int(os.environ.get('AI_SERVER_THREADS', '4'))
+
+preload_app = False
+
+# การโหลดโมเดลและ warm-up ใช้เวลานาน จึงต้องให้ timeout มากพอ
+timeout = int(os.environ.get('AI_SERVER_TIMEOUT', '120'))
+# เวลาที่ให้ worker ประมวลผลคำขอที่ค้างอยู่ให้เสร็จหลังได้รับ SIGTERM
+graceful_timeout = int(os.environ.get('AI_SERVER_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+# รีสตาร์ท worker เป็นระยะเพื่อคืนหน่วยความจำ (0 = ปิด)
+max_requests = int(os.environ.get('AI_SERVER_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+loglevel = os.environ.get('AI_SERVER_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    """โหลดโมเดลและ warm-up ใน worker ใหม่ ก่อนที่ worker จะเริ่มรับคำขอ (ตาม AI_SERVER_WARMUP)"""
+    from src.services import models
+    models.start_warm_up()
+    if models.models_loaded():
+        server.log.info(f"worker {worker.pid} โหลดโมเดลและ warm-up เสร็จ พร้อมรับคำขอ")
+    else:
+        server.log.info(f"worker {worker.pid} เริ่มรับคำขอ โมเดลจะโหลดใน background หรือเมื่อมีคำขอแรก (ดู /api/ready)")
+
+
+def worker_exit(server, worker):
+    """ปิด micro-batcher หลังคำขอที่ค้างอยู่เสร็จ (gunicorn หยุดรับคำขอใหม่และรอตาม graceful_timeout แล้ว)"""
+    from src.services import models
+    models.shutdown()
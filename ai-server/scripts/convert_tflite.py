@@ -0,0 +1,75 @@
+"""
+แปลง FaceNet (frozen graph) เป็น TFLite แบบ quantize สำหรับ CPU แล้วตรวจสอบความแม่นยำเทียบกับโมเดล float32
+
+หลังแปลงจะรายงาน cosine drift ของ embeddings และความแม่นยำการยืนยันตัวตนที่เปลี่ยนไปบนชุดคู่ภาพ
+(ไฟล์ --pairs บรรทัดละ "ภาพที่1 ภาพที่2 label") ใช้โมเดลที่ได้ด้วย FACENET_BACKEND=tflite
+และ FACENET_MODEL_PATH=<ไฟล์ .tflite>
+
+ตัวอย่าง:
+    python scripts/convert_tflite.py --quantization float16 --output facenet-fp16.tflite --pairs pairs.txt
+    python scripts/convert_tflite.py --quantization int8 --calibration-dir faces/ --output facenet-int8.tflite
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.services.face_recognition import FaceRecognition
+from src.services.facenet_tflite import convert_tflite, QUANTIZATION_MODES
+from src.services.model_eval import list_images, load_pairs, read_images, compare_embedding_models
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='../models/facenet/20180402-114759/20180402-114759.pb',
+                        help='frozen graph ของ FaceNet (float32)')
+    parser.add_argument('--output', required=True, help='ไฟล์ .tflite ปลายทาง')
+    parser.add_argument('--quantization', choices=QUANTIZATION_MODES, default='float16')
+    parser.add_argument('--calibration-dir', help='โฟลเดอร์ภาพใบหน้าที่ตัดแล้ว สำหรับปรับช่วงค่า int8')
+    parser.add_argument('--calibration-count', type=int, default=200)
+    parser.add_argument('--pairs', help='ไฟล์คู่ภาพสำหรับวัดความแม่นยำการยืนยันตัวตน')
+    parser.add_argument('--eval-dir', help='โฟลเดอร์ภาพใบหน้าสำหรับวัด cosine drift (ถ้าไม่มี --pairs)')
+    parser.add_argument('--threads', type=int, default=0, help='จำนวน thread ของ TFLite (0 = อัตโนมัติ)')
+    parser.add_argument('--no-xnnpack', action='store_true',
+                        help='ตรวจสอบโดยไม่ใช้ XNNPACK delegate (ตรงกับ FACENET_TFLITE_XNNPACK=0)')
+    parser.add_argument('--skip-eval', action='store_true', help='แปลงอย่างเดียว ไม่ตรวจสอบความแม่นยำ')
+    args = parser.parse_args()
+
+    reference = FaceRecognition(args.model)
+
+    calibration_images = None
+    if args.calibration_dir:
+        images = read_images(list_images(args.calibration_dir, args.calibration_count))
+        calibration_images, _ = reference.preprocessor.preprocess_batch(list(images.values()))
+    elif args.quantization == 'int8':
+        parser.error("--quantization int8 ต้องระบุ --calibration-dir")
+
+    convert_tflite(args.model, args.output, args.quantization, calibration_images)
+    if args.skip_eval:
+        return
+
+    pairs = load_pairs(args.pairs) if args.pairs else None
+    if pairs:
+        paths = [path for a, b, _ in pairs for path in (a, b)]
+    elif args.eval_dir or args.calibration_dir:
+        paths = list_images(args.eval_dir or args.calibration_dir)
+    else:
+        print("ไม่ได้ระบุ --pairs หรือ --eval-dir จึงข้ามการตรวจสอบความแม่นยำ")
+        return
+
+    candidate = FaceRecognition(args.output, backend='tflite', intra_op_threads=args.threads,
+                                use_xnnpack=not args.no_xnnpack)
+    report = compare_embedding_models(reference, candidate, read_images(paths), pairs)
+    report['model'] = {
+        'quantization': args.quantization,
+        'size_mb': os.path.getsize(args.output) / 1e6,
+        'reference_size_mb': os.path.getsize(args.model) / 1e6,
+        'xnnpack': not args.no_xnnpack,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
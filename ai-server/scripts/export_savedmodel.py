@@ -0,0 +1,36 @@
+"""
+แปลง frozen graph ของ FaceNet (.pb) เป็น SavedModel สำหรับ FACENET_BACKEND=savedmodel
+
+ตัวอย่าง:
+    python scripts/export_savedmodel.py --model ../models/facenet/20180402-114759/20180402-114759.pb \
+        --output ../models/facenet/20180402-114759/savedmodel
+"""
+import os
+import sys
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.services.facenet_graph import export_saved_model, load_graph_def, frozen_graph_function, FaceNetFunction
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='../models/facenet/20180402-114759/20180402-114759.pb',
+                        help='frozen graph ของ FaceNet')
+    parser.add_argument('--output', required=True, help='โฟลเดอร์ปลายทางของ SavedModel')
+    parser.add_argument('--xla', action='store_true', help='บันทึก function ที่ compile ด้วย XLA')
+    args = parser.parse_args()
+
+    export_saved_model(args.model, args.output, jit_compile=args.xla)
+
+    # ตรวจสอบว่า SavedModel ให้ผลเหมือน frozen graph
+    images = np.random.default_rng(0).uniform(-1, 1, size=(4, 160, 160, 3)).astype(np.float32)
+    expected = frozen_graph_function(load_graph_def(args.model))(images).numpy()
+    actual = FaceNetFunction(args.output, backend='savedmodel')(images)
+    print(f"บันทึกที่ {args.output} (ผลต่างสูงสุดเทียบกับ frozen graph: {np.abs(expected - actual).max():.2e})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+นำเข้า embeddings ที่ export มาจากฐานข้อมูล (JSON) เข้าคลัง embeddings แบบไบนารี
+
+รองรับไฟล์ JSON สองรูปแบบ:
+    {"<user_id>": [[...512 ค่า...], ...], ...}
+    [{"id": "<user_id>", "faceEmbeddings": [[...], ...]}, ...]   (faceEmbeddings เป็นสตริง JSON ก็ได้)
+
+ตัวอย่าง:
+    python scripts/import_embeddings.py --input users.json --store data/embedding_store --dtype float16
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.services.embedding_store import EmbeddingStore, STORE_DTYPES
+from src.services.models import DEFAULT_STORE_PATH
+
+
+def iter_user_embeddings(data):
+    """คืน (user_id, embeddings) ของแต่ละผู้ใช้จากข้อมูลที่ export มา"""
+    items = data.items() if isinstance(data, dict) else ((row.get('id'), row.get('faceEmbeddings')) for row in data)
+    for user_id, embeddings in items:
+        if isinstance(embeddings, str):
+            embeddings = json.loads(embeddings)
+        if embeddings:
+            yield user_id, np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='นำเข้า embeddings จาก JSON เข้าคลัง embeddings')
+    parser.add_argument('--input', required=True, help='ไฟล์ JSON ที่ export มา')
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH,
+                        help='โฟลเดอร์ของคลัง embeddings (ค่าเริ่มต้นเดียวกับ AI Server)')
+    parser.add_argument('--dtype', choices=STORE_DTYPES, default='float32', help='ชนิดข้อมูลเมื่อสร้างคลังใหม่')
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--replace', action='store_true', help='ลบ embeddings เดิมของผู้ใช้ก่อนเพิ่ม')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with open(args.input, encoding='utf-8') as f:
+        data = json.load(f)
+
+    store = EmbeddingStore(args.store, dim=args.dim, dtype=args.dtype)
+    users = rows = 0
+    for user_id, embeddings in iter_user_embeddings(data):
+        if args.replace:
+            store.remove(user_id)
+        store.add_many([user_id] * len(embeddings), embeddings)
+        users += 1
+        rows += len(embeddings)
+    if args.replace:
+        store.compact()
+
+    print(json.dumps({
+        'users': users,
+        'rows': rows,
+        'seconds': round(time.perf_counter() - start, 2),
+        'store': store.stats(),
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
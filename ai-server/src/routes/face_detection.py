@@ -1,8 +1,7 @@
-from flask import Blueprint, request, jsonify
-import numpy as np
-import cv2
-from src.services.face_detection import detect_faces
-import base64
+from flask import Blueprint, jsonify
+from src.services.face_detection import detect_faces, detector_version
+from src.services.embedding_cache import face_cache, content_hash
+from src.utils.image_io import read_request_image, get_request_data, ImageInputError
 
 # สร้าง blueprint
 face_detection_bp = Blueprint('face_detection', __name__)
@@ -12,27 +11,36 @@ def detect():
     """
     API สำหรับตรวจจับใบหน้าในรูปภาพ
     
-    รับข้อมูลรูปภาพในรูปแบบ Base64 และส่งคืนพิกัดของใบหน้าที่ตรวจพบ
+    รับข้อมูลรูปภาพในรูปแบบ Base64, multipart หรือไฟล์ image/jpeg, image/png
+    และส่งคืนพิกัดของใบหน้าที่ตรวจพบ (พิกัดของรูปต้นฉบับเสมอ แม้รูปจะถูกย่อก่อนตรวจจับ)
+    
+    พารามิเตอร์เสริม: detector (mtcnn / yunet), max_side (ย่อรูปให้ด้านยาวไม่เกินค่านี้ก่อนตรวจจับ
+    0 = ไม่ย่อ) และ min_face_size (ขนาดใบหน้าเล็กสุดที่ต้องการเป็นพิกเซลของรูปต้นฉบับ)
     """
-    # ตรวจสอบข้อมูลที่ส่งมา
-    if 'image' not in request.json:
-        return jsonify({"error": "กรุณาส่งรูปภาพในรูปแบบ Base64"}), 400
+    # ตรวจสอบและแปลงข้อมูลที่ส่งมาเป็นรูปภาพ
+    try:
+        image = read_request_image()
+    except ImageInputError as e:
+        return jsonify({"error": str(e)}), 400
     
+    data = get_request_data()
     try:
-        # แปลง Base64 เป็นรูปภาพ
-        image_data = request.json['image']
-        image_data = image_data.split(',')[1] if ',' in image_data else image_data
-        
-        # Decode base64
-        img_bytes = base64.b64decode(image_data)
-        img_array = np.frombuffer(img_bytes, np.uint8)
-        image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            return jsonify({"error": "ไม่สามารถอ่านรูปภาพได้"}), 400
-        
-        # ตรวจจับใบหน้า
-        faces = detect_faces(image)
+        backend = data.get('detector') or None
+        max_side = int(data['max_side']) if data.get('max_side') is not None else None
+        min_face_size = int(data['min_face_size']) if data.get('min_face_size') is not None else None
+        if (max_side is not None and max_side < 0) or (min_face_size is not None and min_face_size < 1):
+            raise ValueError("max_side ต้องไม่ติดลบ และ min_face_size ต้องมากกว่า 0")
+        version = detector_version(backend, max_side, min_face_size)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        # ตรวจจับใบหน้า (ใช้ผลจากแคชถ้าเคยตรวจจับรูปนี้ด้วย detector และการตั้งค่าเดียวกันแล้ว)
+        faces = face_cache.get_or_compute(
+            'detections', content_hash(image),
+            lambda: detect_faces(image, backend=backend, max_side=max_side, min_face_size=min_face_size),
+            detector=version
+        )
         
         # ประมวลผลข้อมูลใบหน้า
         results = []
@@ -62,5 +70,6 @@ def detect():
             "count": len(results)
         })
     
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    except FileNotFoundError as e:
+        # ไฟล์โมเดลของ detector ที่เลือกไม่มีบนเซิร์ฟเวอร์ (เช่น YuNet ที่ยังไม่ได้ดาวน์โหลด)
+        return jsonify({"error": str(e)}), 400
@@ -1,199 +1,652 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, jsonify, request, Response, stream_with_context
 import numpy as np
-import cv2
-import base64
 import os
 import json
-from src.services.face_detection import detect_faces
-from src.services.face_recognition import FaceRecognition
-from src.utils.preprocess import extract_face
+from concurrent.futures import ThreadPoolExecutor
+from src.services.models import get_face_recognition, get_face_analyzer, get_embedding_store, inference_stats
+from src.services.face_analysis import parse_outputs, NO_FACE_MESSAGE
+from src.services.face_detection import detector_version
+from src.services.embedding_cache import face_cache
+from src.services.face_clustering import FaceClusterer
+from src.services.face_tracking import FaceStreamTracker
+from src.services.gallery_index import GalleryIndex, parse_k
+from src.utils.image_io import (
+    read_request_image, get_request_data, get_image_payloads, decode_image_payload, has_image,
+    encode_image_base64, ImageInputError
+)
+from src.utils.metrics import stage
+from src.utils.embedding_codec import (
+    request_encoding, encode_embedding, decode_embedding, decode_embeddings, EmbeddingFormatError
+)
 
 # สร้าง blueprint
 face_recognition_bp = Blueprint('face_recognition', __name__)
 
-# โหลดโมเดล FaceNet
-model_path = os.environ.get('FACENET_MODEL_PATH', '../models/facenet/20180402-114759/20180402-114759.pb')
-face_recognition = FaceRecognition(model_path)
+# โมเดล FaceNet และ FaceAnalyzer ถูกโหลดครั้งเดียวต่อ process ผ่าน src.services.models
+# (โหลดตอน worker เริ่มทำงาน ไม่ใช่ตอน import) ดู get_face_recognition / get_face_analyzer
 
-@face_recognition_bp.route('/embeddings', methods=['POST'])
-def get_embeddings():
+# จำนวนรูปภาพสูงสุดต่อคำขอ /embeddings/batch และ /quality/batch
+max_batch_images = int(os.environ.get('MAX_BATCH_IMAGES', '64'))
+
+# จำนวนรูปภาพสูงสุดต่อฝั่งของ /compare/matrix และจำนวนช่องสูงสุดของเมทริกซ์ที่ส่งคืนเต็ม
+max_matrix_images = int(os.environ.get('MAX_MATRIX_IMAGES', '256'))
+max_matrix_cells = int(os.environ.get('MAX_COMPARE_MATRIX_CELLS', '1000000'))
+
+# จำนวนใบหน้าสูงสุดต่อคำขอ /cluster (รวมใบหน้าเดิมที่ส่งมาเพื่อจัดกลุ่มเพิ่ม)
+max_cluster_faces = int(os.environ.get('MAX_CLUSTER_FACES', '100000'))
+
+# thread pool สำหรับ decode รูปภาพแบบขนาน (cv2.imdecode ปล่อย GIL ระหว่างทำงาน)
+decode_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('DECODE_WORKERS', '4')))
+
+def _decode_payload(payload):
+    """decode รูปภาพหนึ่งชิ้นของคำขอแบบหลายรูป ข้อมูลที่อ่านไม่ได้หรือชนิดผิด (เช่นตัวเลข) คืน None แทน raise"""
+    try:
+        return decode_image_payload(payload)
+    except Exception:
+        return None
+
+def _decode_payloads(payloads):
+    """decode รูปภาพทั้งหมดแบบขนาน รายการที่อ่านไม่ได้เป็น None (กลายเป็น error ของรูปนั้น)"""
+    with stage('decode'):
+        return list(decode_executor.map(_decode_payload, payloads))
+
+def _parse_bool(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def _request_detector(data):
+    """backend ของการตรวจจับใบหน้าที่คำขอเลือก (None = ค่าเริ่มต้นของเซิร์ฟเวอร์) ชื่อไม่ถูกต้องจะเกิด ValueError"""
+    detector = data.get('detector') or None
+    if detector is not None:
+        detector_version(detector)
+    return detector
+
+def _with_encoding(response, encoding):
+    """ระบุรูปแบบ embeddings ในผลลัพธ์เมื่อไม่ใช่ JSON list (ค่าเริ่มต้น)"""
+    if encoding != 'json':
+        response["embedding_encoding"] = encoding
+    return response
+
+def _face_to_json(face, encoding='json'):
+    """แปลงผลวิเคราะห์ใบหน้าหนึ่งใบเป็น JSON (เฉพาะผลลัพธ์ที่ถูกขอ)"""
+    result = {
+        "face_box": face['box'],
+        "confidence": face['confidence'],
+        "landmarks": face['landmarks']
+    }
+    if 'embedding' in face:
+        result["embedding"] = encode_embedding(face['embedding'], encoding)
+    if 'quality' in face:
+        result["quality"] = face['quality']
+    if 'crop' in face:
+        result["crop"] = encode_image_base64(face['crop'])
+    if 'aligned' in face:
+        result["aligned"] = encode_image_base64(face['aligned']) if face['aligned'] is not None else None
+    return result
+
+@face_recognition_bp.route('/analyze', methods=['POST'])
+def analyze():
     """
-    API สำหรับสร้าง face embeddings จากรูปภาพ
+    API สำหรับวิเคราะห์ใบหน้าในขั้นตอนเดียว
     
-    รับข้อมูลรูปภาพในรูปแบบ Base64 และส่งคืน embeddings
+    ตรวจจับใบหน้าครั้งเดียว แล้วส่งคืนผลลัพธ์ที่เลือกในฟิลด์ outputs
+    (crop, alignment, embedding, quality - list หรือสตริงคั่นด้วย comma, ค่าเริ่มต้น embedding,quality)
+    all_faces=true ถ้าต้องการทุกใบหน้าในรูป และ detector (mtcnn / yunet) ถ้าต้องการเลือก backend ของการตรวจจับ
     """
-    # ตรวจสอบข้อมูลที่ส่งมา
-    if 'image' not in request.json:
-        return jsonify({"error": "กรุณาส่งรูปภาพในรูปแบบ Base64"}), 400
+    # ตรวจสอบและแปลงข้อมูลที่ส่งมาเป็นรูปภาพ
+    try:
+        image = read_request_image()
+    except ImageInputError as e:
+        return jsonify({"error": str(e)}), 400
     
+    data = get_request_data()
     try:
-        # แปลง Base64 เป็นรูปภาพ
-        image_data = request.json['image']
-        image_data = image_data.split(',')[1] if ',' in image_data else image_data
-        
-        # Decode base64
-        img_bytes = base64.b64decode(image_data)
-        img_array = np.frombuffer(img_bytes, np.uint8)
-        image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            return jsonify({"error": "ไม่สามารถอ่านรูปภาพได้"}), 400
-        
-        # ตรวจจับใบหน้า
-        faces = detect_faces(image)
+        outputs = parse_outputs(data.get('outputs'))
+        encoding = request_encoding(data)
+        detector = _request_detector(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        result = get_face_analyzer().analyze(image, outputs=outputs, all_faces=_parse_bool(data.get('all_faces', False)),
+                                             detector=detector)
         
-        if not faces:
+        if 'error' in result:
             return jsonify({
                 "status": "error",
-                "message": "ไม่พบใบหน้าในรูปภาพ"
+                "message": result['error']
             }), 400
         
-        # ถ้ามีหลายใบหน้า ใช้ใบหน้าที่มีความมั่นใจสูงสุด
-        face = max(faces, key=lambda x: x['confidence'])
+        return jsonify(_with_encoding({
+            "status": "success",
+            "faces": [_face_to_json(face, encoding) for face in result['faces']],
+            "count": len(result['faces'])
+        }, encoding))
+    
+    except FileNotFoundError as e:
+        # ไฟล์โมเดลของ detector ที่เลือกไม่มีบนเซิร์ฟเวอร์ (เช่น YuNet ที่ยังไม่ได้ดาวน์โหลด)
+        return jsonify({"error": str(e)}), 400
+
+def _request_gallery(data, encoding):
+    """
+    gallery สำหรับ /identify: ฟิลด์ gallery ({"ids": [...], "embeddings": [...]}) ถ้าส่งมา
+    ไม่เช่นนั้นใช้คลัง embeddings ของเซิร์ฟเวอร์ (/api/face/gallery)
+    """
+    gallery = data.get('gallery')
+    if gallery is None:
+        return get_embedding_store()
+    if not isinstance(gallery, dict) or 'ids' not in gallery or 'embeddings' not in gallery:
+        raise EmbeddingFormatError("gallery ต้องมีฟิลด์ ids และ embeddings")
+    embeddings = decode_embeddings(gallery['embeddings'], encoding)
+    if len(gallery['ids']) != len(embeddings):
+        raise EmbeddingFormatError("จำนวน ids ของ gallery ไม่ตรงกับจำนวน embeddings")
+    return GalleryIndex.from_embeddings(embeddings, gallery['ids'])
+
+@face_recognition_bp.route('/identify', methods=['POST'])
+def identify():
+    """
+    API สำหรับระบุตัวตนทุกใบหน้าในรูปภาพ (เช่นรูปหมู่)
+    
+    ตรวจจับใบหน้าครั้งเดียว สร้าง embeddings ของทุกใบหน้าใน batch เดียว แล้วค้นหาใน gallery
+    ด้วยการคูณเมทริกซ์ครั้งเดียวสำหรับทุกใบหน้า รับ k (จำนวนผู้ที่อาจเป็น ค่าเริ่มต้น 3),
+    threshold (ค่าเริ่มต้นเท่ากับ threshold ของการเปรียบเทียบ), with_quality=true ถ้าต้องการคะแนนคุณภาพ
+    gallery ({"ids", "embeddings"}) ถ้าต้องการค้นหาในชุดที่ส่งมาแทนคลังของเซิร์ฟเวอร์
+    และ detector (mtcnn / yunet) ถ้าต้องการเลือก backend ของการตรวจจับ
+    """
+    # ตรวจสอบและแปลงข้อมูลที่ส่งมาเป็นรูปภาพ
+    try:
+        image = read_request_image()
+    except ImageInputError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    data = get_request_data()
+    try:
+        encoding = request_encoding(data)
+        gallery = _request_gallery(data, encoding)
+        k = parse_k(data.get('k'), 3)
+        threshold = float(data.get('threshold', get_face_recognition().default_threshold))
+        detector = _request_detector(data)
+    except (EmbeddingFormatError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        outputs = ('embedding', 'quality') if _parse_bool(data.get('with_quality', False)) else ('embedding',)
+        result = get_face_analyzer().analyze(image, outputs=outputs, all_faces=True, detector=detector)
         
-        # ตัดใบหน้า
-        face_img = extract_face(image, face['box'])
+        if 'error' in result:
+            return jsonify({
+                "status": "error",
+                "message": result['error']
+            }), 400
         
-        # สร้าง embeddings
-        embedding = face_recognition.get_embeddings(face_img)
+        faces = [face for face in result['faces'] if face['embedding'] is not None]
+        with stage('search'):
+            matches = gallery.search_batch([face['embedding'] for face in faces], k=k) if faces else []
         
-        # ประเมินคุณภาพ
-        quality_score, feedback = face_recognition.quality_assessment(face_img)
+        identified = []
+        for face, candidates in zip(faces, matches):
+            entry = {
+                "face_box": face['box'],
+                "confidence": face['confidence'],
+                "candidates": [{"user_id": user_id, "distance": distance, "confidence": 1.0 - distance}
+                               for user_id, distance in candidates],
+                # ผู้ที่ใกล้ที่สุดถ้าผ่าน threshold ไม่เช่นนั้นเป็น null (ไม่รู้จัก)
+                "identity": candidates[0][0] if candidates and candidates[0][1] < threshold else None
+            }
+            if 'quality' in face:
+                entry["quality"] = face['quality']
+            identified.append(entry)
         
         return jsonify({
             "status": "success",
-            "embedding": embedding.tolist(),
-            "quality": {
-                "score": float(quality_score),
-                "feedback": feedback
-            },
-            "face_box": face['box']
+            "faces": identified,
+            "count": len(identified),
+            "identified": sum(1 for face in identified if face["identity"] is not None),
+            "threshold": threshold
         })
     
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 400
+
+@face_recognition_bp.route('/embeddings', methods=['POST'])
+def get_embeddings():
+    """
+    API สำหรับสร้าง face embeddings จากรูปภาพ
+    
+    รับข้อมูลรูปภาพในรูปแบบ Base64, multipart หรือไฟล์ image/jpeg, image/png และส่งคืน embeddings
+    """
+    # ตรวจสอบและแปลงข้อมูลที่ส่งมาเป็นรูปภาพ
+    try:
+        image = read_request_image()
+    except ImageInputError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        encoding = request_encoding(get_request_data())
+    except EmbeddingFormatError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # ตรวจจับใบหน้า (ใบหน้าที่มีความมั่นใจสูงสุด) สร้าง embedding และประเมินคุณภาพในขั้นตอนเดียว
+    result = get_face_analyzer().analyze(image, outputs=('embedding', 'quality'))
+    
+    if 'error' in result:
+        return jsonify({
+            "status": "error",
+            "message": result['error']
+        }), 400
+    
+    face = result['faces'][0]
+    if face['embedding'] is None:
+        return jsonify({"error": "ไม่สามารถสร้าง embedding ได้"}), 500
+    
+    return jsonify(_with_encoding({
+        "status": "success",
+        "embedding": encode_embedding(face['embedding'], encoding),
+        "quality": face['quality'],
+        "face_box": face['box']
+    }, encoding))
 
 @face_recognition_bp.route('/compare', methods=['POST'])
 def compare_faces():
     """
     API สำหรับเปรียบเทียบใบหน้าสองภาพ
     
-    รับข้อมูลรูปภาพสองรูปหรือ embeddings ในรูปแบบ JSON และส่งคืนผลการเปรียบเทียบ
+    รับข้อมูลรูปภาพสองรูป (JSON Base64 หรือ multipart ฟิลด์ image1/image2) หรือ embeddings
+    และส่งคืนผลการเปรียบเทียบ
     """
-    try:
-        data = request.json
+    data = get_request_data()
+    
+    # ตรวจสอบว่าส่งมาเป็น embeddings หรือรูปภาพ
+    if 'embedding1' in data and 'embedding2' in data:
+        # กรณีส่ง embeddings มาโดยตรง (รายการตัวเลขหรือ base64 ตาม embedding_encoding)
+        try:
+            encoding = request_encoding(data)
+            embedding1 = decode_embedding(data['embedding1'], encoding)
+            embedding2 = decode_embedding(data['embedding2'], encoding)
+        except EmbeddingFormatError as e:
+            return jsonify({"error": str(e)}), 400
+    
+    elif has_image('image1') and has_image('image2'):
+        # กรณีส่งรูปภาพมา (Base64 หรือ multipart) ต้องสร้าง embeddings ก่อน
+        try:
+            image1 = read_request_image('image1')
+            image2 = read_request_image('image2')
+        except ImageInputError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # ตรวจสอบว่าส่งมาเป็น embeddings หรือรูปภาพ
-        if 'embedding1' in data and 'embedding2' in data:
-            # กรณีส่ง embeddings มาโดยตรง
-            embedding1 = np.array(data['embedding1'])
-            embedding2 = np.array(data['embedding2'])
+        # ตรวจจับใบหน้าของทั้งสองรูป แล้วสร้าง embeddings ทั้งคู่ใน batch เดียว
+        result1, result2 = get_face_analyzer().analyze_many([image1, image2], outputs=('embedding',))
+        for result, ordinal in ((result1, "แรก"), (result2, "ที่สอง")):
+            if 'error' in result:
+                message = f"ไม่พบใบหน้าในรูปภาพ{ordinal}" if result['error'] == NO_FACE_MESSAGE else result['error']
+                return jsonify({"error": message}), 400
         
-        elif 'image1' in data and 'image2' in data:
-            # กรณีส่งรูปภาพมา ต้องสร้าง embeddings ก่อน
-            # แปลง Base64 เป็นรูปภาพ 1
-            image_data1 = data['image1']
-            image_data1 = image_data1.split(',')[1] if ',' in image_data1 else image_data1
-            img_bytes1 = base64.b64decode(image_data1)
-            img_array1 = np.frombuffer(img_bytes1, np.uint8)
-            image1 = cv2.imdecode(img_array1, cv2.IMREAD_COLOR)
-            
-            # แปลง Base64 เป็นรูปภาพ 2
-            image_data2 = data['image2']
-            image_data2 = image_data2.split(',')[1] if ',' in image_data2 else image_data2
-            img_bytes2 = base64.b64decode(image_data2)
-            img_array2 = np.frombuffer(img_bytes2, np.uint8)
-            image2 = cv2.imdecode(img_array2, cv2.IMREAD_COLOR)
-            
-            # ตรวจจับและตัดใบหน้า 1
-            faces1 = detect_faces(image1)
-            if not faces1:
-                return jsonify({"error": "ไม่พบใบหน้าในรูปภาพแรก"}), 400
-            face1 = max(faces1, key=lambda x: x['confidence'])
-            face_img1 = extract_face(image1, face1['box'])
-            
-            # ตรวจจับและตัดใบหน้า 2
-            faces2 = detect_faces(image2)
-            if not faces2:
-                return jsonify({"error": "ไม่พบใบหน้าในรูปภาพที่สอง"}), 400
-            face2 = max(faces2, key=lambda x: x['confidence'])
-            face_img2 = extract_face(image2, face2['box'])
-            
-            # สร้าง embeddings
-            embedding1 = face_recognition.get_embeddings(face_img1)
-            embedding2 = face_recognition.get_embeddings(face_img2)
+        embedding1 = result1['faces'][0]['embedding']
+        embedding2 = result2['faces'][0]['embedding']
+    
+    else:
+        return jsonify({"error": "กรุณาส่ง embeddings หรือรูปภาพ"}), 400
+    
+    # กำหนด threshold ถ้ามีการส่งมา
+    threshold = float(data.get('threshold', 0.7))
+    
+    # เปรียบเทียบใบหน้า
+    is_same, distance = get_face_recognition().compare_faces(embedding1, embedding2, threshold)
+    
+    # ส่งคืนผลลัพธ์
+    return jsonify({
+        "status": "success",
+        "is_same_person": bool(is_same),
+        "confidence": 1.0 - float(distance),
+        "distance": float(distance),
+        "threshold": threshold
+    })
+
+class _CompareInputError(ValueError):
+    pass
+
+def _collect_embeddings(data, side, encoding, all_faces):
+    """
+    ดึงชุด embeddings ของ /compare/matrix และ /cluster จาก embeddings<side> หรือ images<side>
+
+    Returns:
+        embeddings: เมทริกซ์ (N, D) หรือ None ถ้าไม่ได้ส่งฝั่งนี้มา
+        faces: รายการ {"image", "face_box"} ของแต่ละแถว (เฉพาะกรณีส่งรูปภาพ)
+        errors: รายการ {"image", "error"} ของรูปที่ใช้ไม่ได้
+    """
+    if f'embeddings{side}' in data:
+        return decode_embeddings(data[f'embeddings{side}'], encoding), None, []
+
+    payloads = get_image_payloads(f'images{side}')
+    if not payloads:
+        return None, None, []
+    if len(payloads) > max_matrix_images:
+        raise _CompareInputError(f"ส่งรูปภาพได้สูงสุด {max_matrix_images} รูปต่อฝั่ง")
+
+    decoded = _decode_payloads(payloads)
+    analyzed = get_face_analyzer().analyze_many(decoded, outputs=('embedding',), all_faces=all_faces)
+
+    embeddings, faces, errors = [], [], []
+    for i, result in enumerate(analyzed):
+        if 'error' in result:
+            errors.append({"image": i, "error": result['error']})
+            continue
+        for face in result['faces']:
+            if face['embedding'] is not None:
+                embeddings.append(face['embedding'])
+                faces.append({"image": i, "face_box": face['box']})
+    if not embeddings:
+        raise _CompareInputError(f"ไม่พบใบหน้าในรูปภาพชุดที่ {side}" if side else "ไม่พบใบหน้าในรูปภาพ")
+    return np.stack(embeddings), faces, errors
+
+@face_recognition_bp.route('/compare/matrix', methods=['POST'])
+def compare_matrix():
+    """
+    API สำหรับเปรียบเทียบใบหน้าหลายต่อหลาย (N x M) ในคำขอเดียว
+    
+    รับ embeddings1 / embeddings2 (รายการ embeddings) หรือ images1 / images2 (รายการรูปภาพ
+    ใช้ทุกใบหน้าในรูปถ้า all_faces=true ซึ่งเป็นค่าเริ่มต้น) ถ้าไม่ส่งชุดที่สอง จะเทียบชุดแรกกับตัวเอง
+    (หาใบหน้าซ้ำ) ถ้าระบุ threshold จะคืนเฉพาะคู่ที่ distance < threshold (สูงสุด max_pairs คู่)
+    ไม่เช่นนั้นคืนเมทริกซ์ระยะห่างทั้งหมด
+    """
+    data = get_request_data()
+    try:
+        encoding = request_encoding(data)
+        all_faces = _parse_bool(data.get('all_faces', True))
+        embeddings1, faces1, errors1 = _collect_embeddings(data, 1, encoding, all_faces)
+        if embeddings1 is None:
+            return jsonify({"error": "กรุณาส่ง embeddings1 หรือ images1"}), 400
+        embeddings2, faces2, errors2 = _collect_embeddings(data, 2, encoding, all_faces)
+        if embeddings2 is not None and embeddings2.shape[1] != embeddings1.shape[1]:
+            return jsonify({"error": "embeddings ทั้งสองชุดต้องมีจำนวนมิติเท่ากัน"}), 400
+    except (_CompareInputError, EmbeddingFormatError, ImageInputError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        face_recognition = get_face_recognition()
+        response = {
+            "status": "success",
+            "shape": [len(embeddings1), len(embeddings1 if embeddings2 is None else embeddings2)]
+        }
         
+        if data.get('threshold') is not None:
+            threshold = float(data['threshold'])
+            with stage('search'):
+                rows, cols, distances = face_recognition.matching_pairs(
+                    embeddings1, embeddings2, threshold, max_pairs=int(data.get('max_pairs', 10000))
+                )
+            response["threshold"] = threshold
+            response["pairs"] = [{"i": int(i), "j": int(j), "distance": float(d)}
+                                 for i, j, d in zip(rows, cols, distances)]
+            response["count"] = len(response["pairs"])
         else:
-            return jsonify({"error": "กรุณาส่ง embeddings หรือรูปภาพ"}), 400
+            if response["shape"][0] * response["shape"][1] > max_matrix_cells:
+                return jsonify({
+                    "error": f"เมทริกซ์ใหญ่เกิน {max_matrix_cells} ช่อง กรุณาระบุ threshold เพื่อรับเฉพาะคู่ที่ตรงกัน"
+                }), 400
+            with stage('search'):
+                distances = face_recognition.distance_matrix(embeddings1, embeddings2)
+            response["distances"] = distances.tolist()
         
-        # กำหนด threshold ถ้ามีการส่งมา
-        threshold = data.get('threshold', 0.7)
-        
-        # เปรียบเทียบใบหน้า
-        is_same, distance = face_recognition.compare_faces(embedding1, embedding2, threshold)
+        if faces1 is not None:
+            response["faces1"] = faces1
+            response["errors1"] = errors1
+        if faces2 is not None:
+            response["faces2"] = faces2
+            response["errors2"] = errors2
+        return jsonify(response)
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@face_recognition_bp.route('/cluster', methods=['POST'])
+def cluster_faces():
+    """
+    API สำหรับจัดกลุ่มใบหน้า (เช่นทุกใบหน้าในอัลบั้มของผู้ใช้)
+    
+    รับ embeddings หรือ images (ใช้ทุกใบหน้าในรูป) พร้อม threshold (cosine distance, ค่าเริ่มต้น
+    เท่ากับ threshold ของการเปรียบเทียบ) และ k (จำนวนเพื่อนบ้านต่อใบหน้า ค่าเริ่มต้น 10)
+    ถ้าส่ง existing_embeddings และ existing_labels (ผลการจัดกลุ่มครั้งก่อน) มาด้วย
+    จะจัดใบหน้าใหม่เข้ากลุ่มเดิมโดยไม่จัดกลุ่มใบหน้าเดิมใหม่ และคืน labels เฉพาะใบหน้าใหม่
+    """
+    data = get_request_data()
+    try:
+        encoding = request_encoding(data)
+        embeddings, faces, errors = _collect_embeddings(data, '', encoding, _parse_bool(data.get('all_faces', True)))
+        if embeddings is None:
+            return jsonify({"error": "กรุณาส่ง embeddings หรือ images"}), 400
+        existing = None
+        if 'existing_embeddings' in data:
+            existing = decode_embeddings(data['existing_embeddings'], encoding)
+        if len(embeddings) + (0 if existing is None else len(existing)) > max_cluster_faces:
+            return jsonify({"error": f"จัดกลุ่มได้สูงสุด {max_cluster_faces} ใบหน้าต่อคำขอ"}), 400
+    except (_CompareInputError, EmbeddingFormatError, ImageInputError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        options = {
+            "threshold": float(data.get('threshold', get_face_recognition().default_threshold)),
+            "k": parse_k(data.get('k'), 10),
+        }
+        if existing is not None:
+            clusterer = FaceClusterer.from_labels(existing, data.get('existing_labels', []), **options)
+            labels = clusterer.add(embeddings)
+        else:
+            clusterer = FaceClusterer(**options)
+            labels = clusterer.fit(embeddings)
         
-        # ส่งคืนผลลัพธ์
-        return jsonify({
+        response = {
             "status": "success",
-            "is_same_person": bool(is_same),
-            "confidence": 1.0 - float(distance),
-            "distance": float(distance),
-            "threshold": threshold
-        })
+            "labels": labels.tolist(),
+            "clusters": len(np.unique(clusterer.labels)),
+            "threshold": options["threshold"]
+        }
+        if faces is not None:
+            response["faces"] = faces
+            response["errors"] = errors
+        return jsonify(response)
     
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 @face_recognition_bp.route('/quality', methods=['POST'])
 def assess_quality():
     """
     API สำหรับประเมินคุณภาพของรูปภาพใบหน้า
     
-    รับข้อมูลรูปภาพในรูปแบบ Base64 และส่งคืนผลการประเมินคุณภาพ
+    รับข้อมูลรูปภาพในรูปแบบ Base64, multipart หรือไฟล์ image/jpeg, image/png และส่งคืนผลการประเมินคุณภาพ
     """
-    # ตรวจสอบข้อมูลที่ส่งมา
-    if 'image' not in request.json:
-        return jsonify({"error": "กรุณาส่งรูปภาพในรูปแบบ Base64"}), 400
+    # ตรวจสอบและแปลงข้อมูลที่ส่งมาเป็นรูปภาพ
+    try:
+        image = read_request_image()
+    except ImageInputError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # ตรวจจับใบหน้า (ใช้ผลจากแคชร่วมกับ /embeddings) และประเมินคุณภาพ
+    result = get_face_analyzer().analyze(image, outputs=('quality',))
+    
+    if 'error' in result:
+        return jsonify({
+            "status": "error",
+            "message": result['error']
+        }), 400
     
+    face = result['faces'][0]
+    return jsonify({
+        "status": "success",
+        "quality": face['quality'],
+        "face_box": face['box']
+    })
+
+@face_recognition_bp.route('/embeddings/batch', methods=['POST'])
+def get_embeddings_batch():
+    """
+    API สำหรับสร้าง face embeddings จากรูปภาพหลายรูปในคำขอเดียว
+    
+    รับรายการรูปภาพ Base64 ในฟิลด์ images หรือหลายไฟล์ multipart ชื่อ images
+    (และ all_faces=true ถ้าต้องการทุกใบหน้าในแต่ละรูป)
+    decode แบบขนาน ตรวจจับใบหน้า แล้วสร้าง embeddings ของทุกใบหน้าผ่าน get_embeddings_batch
+    ทีละ chunk ส่งคืนผลลัพธ์และข้อผิดพลาดแยกตามรูปภาพ
+    """
+    data = get_request_data()
+    images = get_image_payloads('images')
+    if not images:
+        return jsonify({"error": "กรุณาส่งรายการรูปภาพในฟิลด์ images (Base64 หรือ multipart)"}), 400
+    if len(images) > max_batch_images:
+        return jsonify({"error": f"ส่งรูปภาพได้สูงสุด {max_batch_images} รูปต่อคำขอ"}), 400
+    
+    all_faces = _parse_bool(data.get('all_faces', False))
     try:
-        # แปลง Base64 เป็นรูปภาพ
-        image_data = request.json['image']
-        image_data = image_data.split(',')[1] if ',' in image_data else image_data
-        
-        # Decode base64
-        img_bytes = base64.b64decode(image_data)
-        img_array = np.frombuffer(img_bytes, np.uint8)
-        image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            return jsonify({"error": "ไม่สามารถอ่านรูปภาพได้"}), 400
-        
-        # ตรวจจับใบหน้า
-        faces = detect_faces(image)
-        
-        if not faces:
-            return jsonify({
-                "status": "error",
-                "message": "ไม่พบใบหน้าในรูปภาพ"
-            }), 400
-        
-        # ถ้ามีหลายใบหน้า ใช้ใบหน้าที่มีความมั่นใจสูงสุด
-        face = max(faces, key=lambda x: x['confidence'])
+        encoding = request_encoding(data)
+    except EmbeddingFormatError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # decode รูปภาพทั้งหมดแบบขนาน
+    decoded = _decode_payloads(images)
+    
+    # ตรวจจับใบหน้าของทุกรูป แล้วสร้าง embeddings ของทุกใบหน้าเป็น chunk
+    analyzed = get_face_analyzer().analyze_many(decoded, outputs=('embedding',), all_faces=all_faces)
+    
+    results = []
+    for i, result in enumerate(analyzed):
+        faces = result.get('faces', [])
+        if 'error' not in result and any(face['embedding'] is None for face in faces):
+            result = {'error': "ไม่สามารถสร้าง embedding ได้"}
         
-        # ตัดใบหน้า
-        face_img = extract_face(image, face['box'])
+        if 'error' in result:
+            results.append({"index": i, "status": "error", "error": result['error']})
+            continue
         
-        # ประเมินคุณภาพ
-        quality_score, feedback = face_recognition.quality_assessment(face_img)
+        results.append({
+            "index": i,
+            "status": "success",
+            "faces": [{
+                "embedding": encode_embedding(face['embedding'], encoding),
+                "face_box": face['box'],
+                "confidence": face['confidence']
+            } for face in faces]
+        })
+    
+    return jsonify(_with_encoding({
+        "status": "success",
+        "results": results,
+        "count": len(results),
+        "succeeded": sum(1 for r in results if r["status"] == "success")
+    }, encoding))
+
+@face_recognition_bp.route('/quality/batch', methods=['POST'])
+def assess_quality_batch():
+    """
+    API สำหรับประเมินคุณภาพใบหน้าในรูปภาพหลายรูปในคำขอเดียว
+    
+    รับรายการรูปภาพ Base64 ในฟิลด์ images หรือหลายไฟล์ multipart ชื่อ images
+    (all_faces=true เพื่อประเมินทุกใบหน้า, feedback=false ถ้าต้องการเฉพาะคะแนน)
+    ใบหน้าทั้งหมดจากทุกรูปถูกประเมินในครั้งเดียวบน crop ขนาดจริง คะแนนและคำแนะนำจึงตรงกับ /quality
+    """
+    data = get_request_data()
+    images = get_image_payloads('images')
+    if not images:
+        return jsonify({"error": "กรุณาส่งรายการรูปภาพในฟิลด์ images (Base64 หรือ multipart)"}), 400
+    if len(images) > max_batch_images:
+        return jsonify({"error": f"ส่งรูปภาพได้สูงสุด {max_batch_images} รูปต่อคำขอ"}), 400
+    
+    # decode รูปภาพทั้งหมดแบบขนาน (รูปที่อ่านไม่ได้กลายเป็น error ของรูปนั้น)
+    decoded = _decode_payloads(images)
+    
+    analyzed = get_face_analyzer().analyze_many(
+        decoded,
+        outputs=('quality',),
+        all_faces=_parse_bool(data.get('all_faces', False)),
+        with_feedback=_parse_bool(data.get('feedback', True))
+    )
+    
+    results = []
+    for i, result in enumerate(analyzed):
+        if 'error' in result:
+            results.append({"index": i, "status": "error", "error": result['error']})
+            continue
         
-        return jsonify({
+        results.append({
+            "index": i,
             "status": "success",
-            "quality": {
-                "score": float(quality_score),
-                "feedback": feedback
-            },
-            "face_box": face['box']
+            "faces": [{
+                "quality": face['quality'],
+                "face_box": face['box'],
+                "confidence": face['confidence']
+            } for face in result['faces']]
         })
     
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return jsonify({
+        "status": "success",
+        "results": results,
+        "count": len(results),
+        "succeeded": sum(1 for r in results if r["status"] == "success")
+    })
+
+@face_recognition_bp.route('/stream', methods=['POST'])
+def stream_frames():
+    """
+    API สำหรับจดจำใบหน้าจากเฟรมวิดีโอ / เว็บแคมต่อเนื่อง (เช่นเครื่อง check-in)
+    
+    รับ body แบบ NDJSON (ส่งแบบ chunked ได้) บรรทัดละหนึ่งเฟรม {"image": "<base64>", "timestamp": ...}
+    และส่งผลกลับแบบ NDJSON ทีละเฟรมทันทีที่ประมวลผลเสร็จ: tracks ในเฟรมนั้นและ events
+    (track_started, identity, track_ended) พารามิเตอร์อยู่ใน query string เท่านั้น (body คือเฟรม):
+    detect_every (ค่าเริ่มต้น 5), threshold, quality_margin, detector และ identify=false
+    ถ้าไม่ต้องค้นหาตัวตนในคลัง embeddings ต้องส่ง Content-Type: application/x-ndjson
+    """
+    if request.mimetype != 'application/x-ndjson':
+        return jsonify({"error": "กรุณาส่งเฟรมเป็น NDJSON (Content-Type: application/x-ndjson)"}), 415
+    
+    # อ่านพารามิเตอร์จาก query string เท่านั้น (get_request_data จะอ่าน body ทิ้งก่อนถึงเฟรม)
+    params = request.args
+    try:
+        tracker = FaceStreamTracker(
+            get_face_recognition(),
+            gallery=get_embedding_store() if _parse_bool(params.get('identify', True)) else None,
+            detect_every=int(params.get('detect_every', 5)),
+            threshold=float(params['threshold']) if params.get('threshold') is not None else None,
+            quality_margin=float(params.get('quality_margin', 5.0)),
+            detector=_request_detector(params)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    def generate():
+        for line in request.stream:
+            if not line.strip():
+                continue
+            try:
+                frame = json.loads(line)
+                if not isinstance(frame, dict) or not isinstance(frame.get('image'), str):
+                    raise ImageInputError("แต่ละเฟรมต้องเป็น object ที่มีฟิลด์ image เป็นสตริง Base64")
+                image = decode_image_payload(frame['image'])
+                if image is None:
+                    raise ImageInputError("ไม่สามารถอ่านรูปภาพได้")
+                result = tracker.process(image, frame.get('timestamp'))
+            except Exception as e:
+                # เฟรมที่อ่านไม่ได้ คิวเต็ม หรือผิดพลาดอื่นถูกข้าม สตรีมทำงานต่อกับเฟรมถัดไปจนส่งสรุปท้ายสตรีม
+                result = {"frame": tracker.frame_index, "error": str(e)}
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+        yield json.dumps({"events": tracker.finish(), "summary": tracker.counters}, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@face_recognition_bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """
+    API สำหรับดูสถิติของแคชผลการตรวจจับใบหน้าและ embeddings (hit/miss, ขนาด, การ evict)
+    """
+    return jsonify({
+        "status": "success",
+        "cache": face_cache.stats()
+    })
+
+@face_recognition_bp.route('/inference/stats', methods=['GET'])
+def inference_stats_route():
+    """
+    API สำหรับดูสถิติคิวการประมวลผลของ MTCNN และ FaceNet (ความยาวคิว, เวลารอ, จำนวนที่ถูกปฏิเสธ)
+    """
+    return jsonify({
+        "status": "success",
+        "pid": os.getpid(),
+        "inference": inference_stats()
+    })
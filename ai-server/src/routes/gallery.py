@@ -0,0 +1,133 @@
+from flask import Blueprint, jsonify
+from src.services.models import get_face_analyzer, get_embedding_store
+from src.services.face_analysis import NO_FACE_MESSAGE
+from src.services.gallery_index import parse_k
+from src.utils.image_io import read_request_image, get_request_data, has_image, ImageInputError
+from src.utils.embedding_codec import request_encoding, decode_embedding, decode_embeddings
+from src.utils.metrics import stage
+
+# สร้าง blueprint
+gallery_bp = Blueprint('gallery', __name__)
+
+# คลัง embeddings เปิดครั้งเดียวต่อ process ผ่าน src.services.models.get_embedding_store
+# (memmap แบบอ่านอย่างเดียว ทุก worker ใช้หน้าหน่วยความจำชุดเดียวกันจาก page cache)
+
+class _NoFaceError(Exception):
+    pass
+
+def _request_embeddings(data):
+    """
+    ดึง embeddings จากคำขอ: ฟิลด์ embedding (หนึ่งเวกเตอร์), embeddings (หลายเวกเตอร์)
+    เป็นรายการตัวเลขหรือ base64 ตาม embedding_encoding หรือรูปภาพ (ใช้ใบหน้าที่มีความมั่นใจสูงสุด)
+
+    Returns:
+        embeddings: numpy array (N, D) หรือ None ถ้าไม่มีข้อมูล
+    """
+    if 'embeddings' in data:
+        return decode_embeddings(data['embeddings'], request_encoding(data))
+    if 'embedding' in data:
+        return decode_embedding(data['embedding'], request_encoding(data)).reshape(1, -1)
+    if has_image():
+        result = get_face_analyzer().analyze(read_request_image(), outputs=('embedding',))
+        if 'error' in result:
+            raise _NoFaceError(result['error'])
+        embedding = result['faces'][0]['embedding']
+        if embedding is None:
+            raise _NoFaceError(NO_FACE_MESSAGE)
+        return embedding.reshape(1, -1)
+    return None
+
+@gallery_bp.route('/add', methods=['POST'])
+def add():
+    """
+    API สำหรับเพิ่ม embeddings ของผู้ใช้เข้าคลัง
+
+    รับ user_id และ embedding / embeddings หรือรูปภาพ (ระบบสร้าง embedding ให้)
+    """
+    data = get_request_data()
+    if data.get('user_id') is None:
+        return jsonify({"error": "กรุณาระบุ user_id"}), 400
+
+    try:
+        embeddings = _request_embeddings(data)
+        if embeddings is None:
+            return jsonify({"error": "กรุณาส่ง embedding หรือรูปภาพ"}), 400
+
+        store = get_embedding_store()
+        store.add_many([data['user_id']] * len(embeddings), embeddings)
+        return jsonify({
+            "status": "success",
+            "user_id": data['user_id'],
+            "added": len(embeddings)
+        })
+
+    except (ImageInputError, _NoFaceError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+@gallery_bp.route('/search', methods=['POST'])
+def search():
+    """
+    API สำหรับค้นหาผู้ใช้ที่ใกล้เคียงที่สุดในคลัง
+
+    รับ embedding / embeddings หรือรูปภาพ พร้อม k (ค่าเริ่มต้น 5) และ threshold (ถ้าระบุ)
+    """
+    data = get_request_data()
+
+    try:
+        embeddings = _request_embeddings(data)
+        if embeddings is None:
+            return jsonify({"error": "กรุณาส่ง embedding หรือรูปภาพ"}), 400
+
+        k = parse_k(data.get('k'), 5)
+        threshold = float(data['threshold']) if data.get('threshold') is not None else None
+        with stage('search'):
+            results = get_embedding_store().search_batch(embeddings, k=k, threshold=threshold)
+        results = [[{"user_id": user_id, "distance": distance, "confidence": 1.0 - distance}
+                    for user_id, distance in matches] for matches in results]
+
+        return jsonify({
+            "status": "success",
+            # ส่งผลลัพธ์ของ embedding เดียวในรูปแบบเดิม และส่งเป็นรายการถ้า query หลายตัว
+            "matches": results[0] if 'embeddings' not in data else results
+        })
+
+    except (ImageInputError, _NoFaceError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+@gallery_bp.route('/users/<user_id>', methods=['DELETE'])
+def remove(user_id):
+    """
+    API สำหรับลบ embeddings ทั้งหมดของผู้ใช้ออกจากคลัง (พื้นที่คืนเมื่อเรียก /compact)
+    """
+    store = get_embedding_store()
+    removed = store.remove(user_id)
+    # user_id ใน URL เป็นสตริงเสมอ ถ้าเพิ่มไว้เป็นตัวเลขให้ลองลบแบบตัวเลขด้วย
+    if not removed and user_id.isdigit():
+        removed = store.remove(int(user_id))
+    return jsonify({
+        "status": "success",
+        "user_id": user_id,
+        "removed": removed
+    })
+
+@gallery_bp.route('/compact', methods=['POST'])
+def compact():
+    """
+    API สำหรับเขียนคลังใหม่โดยตัดแถวที่ถูกลบออก
+    """
+    removed = get_embedding_store().compact()
+    return jsonify({
+        "status": "success",
+        "removed": removed,
+        "store": get_embedding_store().stats()
+    })
+
+@gallery_bp.route('/stats', methods=['GET'])
+def stats():
+    """
+    API สำหรับดูขนาดของคลัง embeddings (จำนวนแถว ผู้ใช้ แถวที่ถูกลบ ขนาดไฟล์)
+    """
+    return jsonify({
+        "status": "success",
+        "store": get_embedding_store().stats()
+    })
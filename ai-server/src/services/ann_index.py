@@ -0,0 +1,548 @@
+import json
+import time
+import logging
+import numpy as np
+from scipy import sparse
+from src.services.gallery_index import GalleryIndex, normalize_embeddings
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+INDEX_MODES = ('exact', 'ivf', 'ivfpq')
+
+
+def _kmeans(data, k, iterations, seed):
+    """
+    k-means (Lloyd) แบบ vectorized คืนค่า centroids แบบ float32
+
+    การหา centroid ที่ใกล้ที่สุดใช้การคูณเมทริกซ์ และการรวมค่าแต่ละกลุ่มใช้ sparse matrix
+    จึงเร็วกว่า scipy.cluster.vq.kmeans2 มากสำหรับข้อมูลหลายแสนแถว
+    """
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    n = len(data)
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(n, k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _assign(data, centroids)
+        membership = sparse.csr_matrix((np.ones(n, dtype=np.float32), (assignments, np.arange(n))), shape=(k, n))
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.asarray(membership @ data)
+
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # กลุ่มที่ว่างจะสุ่มจุดใหม่จากข้อมูล เพื่อไม่ให้เสีย centroid ไปเปล่า ๆ
+        if empty.any():
+            centroids[empty] = data[rng.choice(n, int(empty.sum()), replace=False)]
+
+    return centroids
+
+
+def _assign(data, centroids):
+    """หา centroid ที่ใกล้ที่สุด (L2) ของแต่ละแถว โดยใช้การคูณเมทริกซ์ครั้งเดียว"""
+    # argmin ||x - c||^2 = argmax (x.c - ||c||^2 / 2)
+    scores = data @ centroids.T - 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+    return np.argmax(scores, axis=1)
+
+
+class _InvertedList:
+    """รายการ inverted list หนึ่งรายการ เก็บ codes (เวกเตอร์หรือ PQ codes) ต่อเนื่องกันพร้อม user id"""
+
+    def __init__(self, width, dtype):
+        self.codes = np.empty((0, width), dtype=dtype)
+        self.ids = []
+        self.size = 0
+
+    def append(self, user_ids, codes):
+        needed = self.size + len(codes)
+        if needed > len(self.codes):
+            grown = np.empty((max(needed, 2 * len(self.codes), 16), self.codes.shape[1]), dtype=self.codes.dtype)
+            grown[:self.size] = self.codes[:self.size]
+            self.codes = grown
+        self.codes[self.size:needed] = codes
+        self.ids.extend(user_ids)
+        self.size = needed
+
+    def remove(self, user_id):
+        """ลบทุกแถวของผู้ใช้ด้วยการย้ายแถวสุดท้ายมาแทนที่"""
+        removed = 0
+        row = 0
+        while row < self.size:
+            if self.ids[row] == user_id:
+                last = self.size - 1
+                self.codes[row] = self.codes[last]
+                self.ids[row] = self.ids[last]
+                self.ids.pop()
+                self.size -= 1
+                removed += 1
+            else:
+                row += 1
+        return removed
+
+    def view(self):
+        return self.codes[:self.size]
+
+
+class IVFIndex:
+    """
+    ดัชนีค้นหาใบหน้าแบบประมาณ (approximate nearest neighbour) ด้วย IVF
+
+    แบ่ง gallery ออกเป็น nlist กลุ่มด้วย k-means (coarse quantizer) แล้วค้นหาเฉพาะ
+    nprobe กลุ่มที่ใกล้ query ที่สุด ถ้ากำหนด pq_m จะเก็บ residual แบบ product quantization
+    (pq_m ไบต์ต่อใบหน้า) แทนเวกเตอร์ float32 เต็ม เพื่อลดหน่วยความจำ
+    """
+
+    def __init__(self, dim=512, nlist=1024, nprobe=8, pq_m=0, pq_bits=8, seed=0):
+        """
+        เริ่มต้น IVFIndex
+
+        Args:
+            dim: จำนวนมิติของ embedding
+            nlist: จำนวนกลุ่มของ coarse quantizer
+            nprobe: จำนวนกลุ่มที่ค้นหาต่อ query (มาก = แม่นขึ้นแต่ช้าลง)
+            pq_m: จำนวน sub-quantizer ของ PQ (0 = ไม่ใช้ PQ, เก็บเวกเตอร์เต็ม)
+            pq_bits: จำนวนบิตต่อ sub-quantizer (สูงสุด 8)
+            seed: seed สำหรับ k-means
+        """
+        if pq_m and dim % pq_m != 0:
+            raise ValueError(f"dim ({dim}) ต้องหารด้วย pq_m ({pq_m}) ลงตัว")
+        if not 1 <= pq_bits <= 8:
+            raise ValueError("pq_bits ต้องอยู่ระหว่าง 1 ถึง 8")
+
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.seed = seed
+        self.centroids = None
+        self.codebooks = None
+        self._codebook_norms = None
+        self._lists = []
+        self._user_lists = {}
+        self._size = 0
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, user_id):
+        return user_id in self._user_lists
+
+    def train(self, embeddings, iterations=20, max_train_points=None):
+        """
+        ฝึก coarse quantizer (และ PQ codebooks ถ้าเปิดใช้) จากตัวอย่าง embeddings
+
+        Args:
+            embeddings: เมทริกซ์ embeddings สำหรับฝึก (N, D)
+            iterations: จำนวนรอบของ k-means
+            max_train_points: จำนวนตัวอย่างสูงสุดที่ใช้ฝึก (default: 256 * nlist)
+
+        Raises:
+            ValueError: ถ้า embeddings ไม่ใช่เมทริกซ์ (N, dim)
+        """
+        data = normalize_embeddings(embeddings)
+        if data.ndim != 2 or data.shape[1] != self.dim:
+            raise ValueError(f"embeddings สำหรับฝึกต้องมีขนาด (N, {self.dim}) ไม่ใช่ {data.shape}")
+        max_train_points = max_train_points or 256 * self.nlist
+        if len(data) > max_train_points:
+            rng = np.random.default_rng(self.seed)
+            data = data[rng.choice(len(data), max_train_points, replace=False)]
+
+        self.centroids = _kmeans(data, self.nlist, iterations, self.seed)
+        self.nlist = len(self.centroids)
+
+        if self.pq_m:
+            residuals = data - self.centroids[_assign(data, self.centroids)]
+            sub_dim = self.dim // self.pq_m
+            ksub = 2 ** self.pq_bits
+            self.codebooks = np.stack([
+                self._pad_codebook(_kmeans(residuals[:, j * sub_dim:(j + 1) * sub_dim], ksub, iterations, self.seed + j), ksub)
+                for j in range(self.pq_m)
+            ])
+            self._codebook_norms = None
+
+        width, dtype = (self.pq_m, np.uint8) if self.pq_m else (self.dim, np.float32)
+        self._lists = [_InvertedList(width, dtype) for _ in range(self.nlist)]
+        self._user_lists = {}
+        self._size = 0
+        logger.info(f"ฝึก IVFIndex สำเร็จ: nlist={self.nlist}, pq_m={self.pq_m}, ตัวอย่าง={len(data)}")
+
+    @staticmethod
+    def _pad_codebook(codebook, ksub):
+        """ถ้าตัวอย่างน้อยกว่า ksub ให้เติม codebook ให้ครบโดยซ้ำแถวแรก (code เหล่านั้นจะไม่ถูกใช้)"""
+        if len(codebook) == ksub:
+            return codebook
+        padding = np.repeat(codebook[:1], ksub - len(codebook), axis=0)
+        return np.vstack([codebook, padding])
+
+    def _encode(self, data, assignments):
+        """เข้ารหัส residual เป็น PQ codes (N, pq_m)"""
+        residuals = data - self.centroids[assignments]
+        sub_dim = self.dim // self.pq_m
+        codes = np.empty((len(data), self.pq_m), dtype=np.uint8)
+        for j in range(self.pq_m):
+            codes[:, j] = _assign(residuals[:, j * sub_dim:(j + 1) * sub_dim], self.codebooks[j])
+        return codes
+
+    def add(self, user_id, embedding):
+        """เพิ่ม embedding ของผู้ใช้หนึ่งชุด"""
+        self.add_many([user_id], np.asarray(embedding).reshape(1, -1))
+
+    def add_many(self, user_ids, embeddings):
+        """
+        เพิ่ม embeddings หลายชุดเข้าดัชนี (ต้อง train ก่อน)
+
+        Args:
+            user_ids: รายการรหัสผู้ใช้
+            embeddings: เมทริกซ์ embeddings (N, D)
+        """
+        if not self.is_trained:
+            raise RuntimeError("ต้องเรียก train() ก่อนเพิ่ม embeddings เข้า IVFIndex")
+
+        user_ids = list(user_ids)
+        data = normalize_embeddings(embeddings).reshape(-1, self.dim)
+        if len(user_ids) != len(data):
+            raise ValueError("จำนวน user id ไม่ตรงกับจำนวน embeddings")
+
+        assignments = _assign(data, self.centroids)
+        codes = self._encode(data, assignments) if self.pq_m else data
+
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.flatnonzero(np.diff(assignments[order])) + 1
+        for group in np.split(order, bounds):
+            if len(group) == 0:
+                continue
+            list_no = int(assignments[group[0]])
+            group_ids = [user_ids[i] for i in group]
+            self._lists[list_no].append(group_ids, codes[group])
+            for user_id in group_ids:
+                self._user_lists.setdefault(user_id, set()).add(list_no)
+        self._size += len(data)
+
+    def remove(self, user_id):
+        """
+        ลบ embeddings ทั้งหมดของผู้ใช้
+
+        Returns:
+            removed: จำนวนแถวที่ถูกลบ
+        """
+        removed = 0
+        for list_no in self._user_lists.pop(user_id, ()):
+            removed += self._lists[list_no].remove(user_id)
+        self._size -= removed
+        return removed
+
+    def search(self, embedding, k=1, threshold=None, nprobe=None):
+        """
+        ค้นหา k ใบหน้าที่ใกล้เคียงที่สุด (โดยประมาณ) ด้วย cosine distance
+
+        Args:
+            embedding: embedding ที่ต้องการค้นหา (D,)
+            k: จำนวนผลลัพธ์สูงสุด
+            threshold: ถ้าระบุ จะคืนเฉพาะผลที่ distance < threshold
+            nprobe: จำนวนกลุ่มที่ค้นหา (ถ้าไม่ระบุใช้ค่าของดัชนี)
+
+        Returns:
+            matches: รายการ (user_id, distance) เรียงจากใกล้ที่สุด
+        """
+        if self._size == 0 or embedding is None:
+            return []
+
+        query = normalize_embeddings(np.asarray(embedding).reshape(-1))
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+
+        coarse = np.sum((self.centroids - query) ** 2, axis=1)
+        probes = np.argpartition(coarse, nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+
+        if self.pq_m:
+            tables = self._pq_tables(query, probes)
+
+        candidate_ids = []
+        candidate_distances = []
+        for probe, list_no in enumerate(probes):
+            inverted = self._lists[list_no]
+            if inverted.size == 0:
+                continue
+            if self.pq_m:
+                # asymmetric distance: รวมระยะจากตารางของแต่ละ sub-quantizer ตาม code ที่เก็บไว้
+                distances = 0.5 * tables[probe][np.arange(self.pq_m), inverted.view()].sum(axis=1)
+            else:
+                distances = 1.0 - inverted.view() @ query
+            candidate_ids.extend(inverted.ids)
+            candidate_distances.append(distances)
+
+        if not candidate_distances:
+            return []
+
+        distances = np.concatenate(candidate_distances)
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(len(distances))
+        top = top[np.argsort(distances[top], kind='stable')]
+
+        matches = []
+        for i in top:
+            distance = float(distances[i])
+            if threshold is not None and distance >= threshold:
+                break
+            matches.append((candidate_ids[i], distance))
+        return matches
+
+    def search_batch(self, embeddings, k=1, threshold=None, nprobe=None, block_size=4096):
+        """
+        ค้นหาหลาย embeddings พร้อมกัน
+
+        แทนที่จะวนค้นหาทีละ query จะจัดกลุ่ม query ตาม inverted list ที่ต้องค้น แล้วคูณเมทริกซ์
+        ของทุก query ในกลุ่มกับเวกเตอร์ใน list นั้นครั้งเดียว (เฉพาะ IVF เวกเตอร์เต็ม ส่วน PQ วนทีละ query)
+
+        Args:
+            embeddings: เมทริกซ์ query (Q, D)
+            k: จำนวนผลลัพธ์สูงสุดต่อ query
+            threshold: ถ้าระบุ จะคืนเฉพาะผลที่ distance < threshold
+            nprobe: จำนวนกลุ่มที่ค้นหา (ถ้าไม่ระบุใช้ค่าของดัชนี)
+            block_size: จำนวน query สูงสุดที่ประมวลผลพร้อมกัน
+
+        Returns:
+            matches: รายการผลลัพธ์ของแต่ละ query ในรูปแบบเดียวกับ search()
+        """
+        queries = normalize_embeddings(np.asarray(embeddings).reshape(-1, self.dim))
+        if self._size == 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+        if self.pq_m:
+            return [self.search(query, k, threshold, nprobe) for query in queries]
+        if len(queries) > block_size:
+            # แบ่ง query เป็นชุด เพื่อจำกัดหน่วยความจำของผลลัพธ์ระหว่างทาง
+            return [matches for start in range(0, len(queries), block_size)
+                    for matches in self.search_batch(queries[start:start + block_size], k, threshold, nprobe, block_size)]
+
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        scores = queries @ self.centroids.T - 0.5 * np.einsum('ij,ij->i', self.centroids, self.centroids)
+        if nprobe < self.nlist:
+            probes = np.argpartition(-scores, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(self.nlist), scores.shape)
+
+        query_rows = np.repeat(np.arange(len(queries)), probes.shape[1])
+        probe_lists = probes.reshape(-1)
+        order = np.argsort(probe_lists, kind='stable')
+        bounds = np.flatnonzero(np.diff(probe_lists[order])) + 1
+
+        found_queries, found_lists, found_positions, found_distances = [], [], [], []
+        for group in np.split(order, bounds):
+            list_no = int(probe_lists[group[0]])
+            inverted = self._lists[list_no]
+            if inverted.size == 0:
+                continue
+            rows = query_rows[group]
+            distances = 1.0 - queries[rows] @ inverted.view().T
+            list_k = min(k, inverted.size)
+            if list_k < inverted.size:
+                top = np.argpartition(distances, list_k - 1, axis=1)[:, :list_k]
+            else:
+                top = np.broadcast_to(np.arange(inverted.size), distances.shape)
+            found_queries.append(np.repeat(rows, list_k))
+            found_lists.append(np.full(len(rows) * list_k, list_no))
+            found_positions.append(top.reshape(-1))
+            found_distances.append(np.take_along_axis(distances, top, axis=1).reshape(-1))
+
+        results = [[] for _ in range(len(queries))]
+        if not found_queries:
+            return results
+
+        found_queries = np.concatenate(found_queries)
+        found_lists = np.concatenate(found_lists)
+        found_positions = np.concatenate(found_positions)
+        found_distances = np.concatenate(found_distances)
+        # เรียงตาม query แล้วตามระยะห่าง จากนั้นเก็บ k อันดับแรกของแต่ละ query
+        order = np.lexsort((found_distances, found_queries))
+        sorted_queries = found_queries[order]
+        group_starts = np.concatenate([[0], np.flatnonzero(np.diff(sorted_queries)) + 1])
+        group_sizes = np.diff(np.concatenate([group_starts, [len(order)]]))
+        rank = np.arange(len(order)) - np.repeat(group_starts, group_sizes)
+        keep = rank < k
+        if threshold is not None:
+            keep &= found_distances[order] < threshold
+        for i in order[keep]:
+            results[found_queries[i]].append(
+                (self._lists[found_lists[i]].ids[found_positions[i]], float(found_distances[i])))
+        return results
+
+    def _pq_tables(self, query, probes):
+        """
+        สร้างตารางระยะทาง ||r_j - b||^2 ของทุกกลุ่มที่ probe ในการคำนวณครั้งเดียว
+
+        r คือ residual ของ query เทียบกับ centroid ของแต่ละกลุ่ม สำหรับ unit vectors
+        ||q - x||^2 = 2 - 2cos ดังนั้น cosine distance = ||q - x||^2 / 2
+
+        Returns:
+            tables: อาร์เรย์ (nprobe, pq_m, ksub)
+        """
+        sub_dim = self.dim // self.pq_m
+        residuals = (query - self.centroids[probes]).reshape(len(probes), self.pq_m, sub_dim)
+        if self._codebook_norms is None:
+            self._codebook_norms = np.einsum('mks,mks->mk', self.codebooks, self.codebooks)
+        # matmul แบบ batch ต่อ sub-quantizer เร็วกว่า einsum หลายเท่า
+        cross = np.matmul(residuals.transpose(1, 0, 2), self.codebooks.transpose(0, 2, 1)).transpose(1, 0, 2)
+        residual_norms = np.einsum('pms,pms->pm', residuals, residuals)
+        return residual_norms[:, :, None] - 2.0 * cross + self._codebook_norms[None]
+
+    def save(self, path):
+        """
+        บันทึกดัชนีลงดิสก์ในรูปแบบ .npz
+
+        Args:
+            path: ตำแหน่งไฟล์ที่ต้องการบันทึก
+        """
+        if not self.is_trained:
+            raise RuntimeError("ไม่สามารถบันทึก IVFIndex ที่ยังไม่ได้ train")
+
+        sizes = np.array([inverted.size for inverted in self._lists], dtype=np.int64)
+        codes = np.concatenate([inverted.view() for inverted in self._lists])
+        # id ที่เป็นชนิดของ numpy (เช่น np.int64) แปลงเป็นชนิดของ Python ก่อนเก็บเป็น JSON
+        ids = [user_id.item() if isinstance(user_id, np.generic) else user_id
+               for inverted in self._lists for user_id in inverted.ids]
+        config = {
+            'dim': self.dim, 'nlist': self.nlist, 'nprobe': self.nprobe,
+            'pq_m': self.pq_m, 'pq_bits': self.pq_bits, 'seed': self.seed,
+        }
+        arrays = {
+            'config': np.array(json.dumps(config)),
+            'ids': np.array(json.dumps(ids)),
+            'centroids': self.centroids,
+            'sizes': sizes,
+            'codes': codes,
+        }
+        if self.pq_m:
+            arrays['codebooks'] = self.codebooks
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+        logger.info(f"บันทึก IVFIndex ({self._size} ใบหน้า) ไปยัง {path}")
+
+    @classmethod
+    def load(cls, path):
+        """
+        โหลดดัชนีที่บันทึกไว้ด้วย save()
+
+        Args:
+            path: ตำแหน่งไฟล์ .npz
+
+        Returns:
+            index: IVFIndex ที่พร้อมค้นหา
+        """
+        with np.load(path) as data:
+            config = json.loads(str(data['config']))
+            ids = json.loads(str(data['ids']))
+            index = cls(**config)
+            index.centroids = data['centroids']
+            if index.pq_m:
+                index.codebooks = data['codebooks']
+            sizes = data['sizes']
+            codes = data['codes']
+
+        width, dtype = (index.pq_m, np.uint8) if index.pq_m else (index.dim, np.float32)
+        index._lists = [_InvertedList(width, dtype) for _ in range(index.nlist)]
+        offset = 0
+        for list_no, size in enumerate(sizes):
+            size = int(size)
+            if size:
+                list_ids = ids[offset:offset + size]
+                index._lists[list_no].append(list_ids, codes[offset:offset + size])
+                for user_id in list_ids:
+                    index._user_lists.setdefault(user_id, set()).add(list_no)
+            offset += size
+        index._size = offset
+        return index
+
+
+def create_index(mode='exact', embeddings=None, ids=None, **kwargs):
+    """
+    สร้างดัชนีค้นหาใบหน้าตามโหมดที่เลือก
+
+    Args:
+        mode: 'exact' (GalleryIndex), 'ivf' (IVF เวกเตอร์เต็ม) หรือ 'ivfpq' (IVF + PQ)
+        embeddings: embeddings เริ่มต้น (ใช้ train และเพิ่มเข้าดัชนี)
+        ids: รายการ user id ของ embeddings
+        **kwargs: พารามิเตอร์ของ IVFIndex เช่น nlist, nprobe, pq_m (dim ถ้าไม่ระบุใช้จำนวนคอลัมน์ของ embeddings)
+
+    Returns:
+        index: ดัชนีที่มีเมธอด add_many / remove / search เหมือนกัน
+    """
+    if mode not in INDEX_MODES:
+        raise ValueError(f"ไม่รู้จักโหมดดัชนี: {mode} (รองรับ {', '.join(INDEX_MODES)})")
+
+    if mode == 'exact':
+        if embeddings is None:
+            return GalleryIndex(dim=kwargs.get('dim', 512))
+        return GalleryIndex.from_embeddings(embeddings, ids)
+
+    if mode == 'ivfpq':
+        kwargs.setdefault('pq_m', 64)
+    else:
+        kwargs['pq_m'] = 0
+    if embeddings is not None:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 2:
+            kwargs.setdefault('dim', embeddings.shape[1])
+    index = IVFIndex(**kwargs)
+    if embeddings is not None:
+        index.train(embeddings)
+        index.add_many(range(len(embeddings)) if ids is None else ids, embeddings)
+    return index
+
+
+def recall_latency_report(index, exact_index, queries, k=10, nprobes=(1, 2, 4, 8, 16, 32, 64)):
+    """
+    วัด recall@k และ latency ของ IVFIndex เทียบกับผลการค้นหาแบบ exact
+
+    Args:
+        index: IVFIndex ที่ต้องการวัด
+        exact_index: GalleryIndex ที่มี embeddings ชุดเดียวกัน (ใช้เป็นคำตอบอ้างอิง)
+        queries: เมทริกซ์ query embeddings (Q, D)
+        k: จำนวนผลลัพธ์ที่ใช้คำนวณ recall
+        nprobes: ค่า nprobe ที่ต้องการทดสอบ
+
+    Returns:
+        report: รายการ dict ต่อค่า nprobe ประกอบด้วย recall, p50/p99 latency (ms) และ QPS
+    """
+    truth = [{user_id for user_id, _ in exact_index.search(q, k=k)} for q in queries]
+
+    exact_latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        exact_index.search(q, k=k)
+        exact_latencies.append((time.perf_counter() - start) * 1000.0)
+
+    report = [{
+        'mode': 'exact',
+        'nprobe': None,
+        'recall': 1.0,
+        'p50_ms': float(np.percentile(exact_latencies, 50)),
+        'p99_ms': float(np.percentile(exact_latencies, 99)),
+        'qps': 1000.0 / float(np.mean(exact_latencies)),
+    }]
+
+    for nprobe in nprobes:
+        if nprobe > index.nlist:
+            continue
+        latencies = []
+        hits = 0
+        for q, expected in zip(queries, truth):
+            start = time.perf_counter()
+            matches = index.search(q, k=k, nprobe=nprobe)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            hits += len(expected.intersection(user_id for user_id, _ in matches))
+        report.append({
+            'mode': 'ivfpq' if index.pq_m else 'ivf',
+            'nprobe': nprobe,
+            'recall': hits / float(max(1, sum(len(expected) for expected in truth))),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'qps': 1000.0 / float(np.mean(latencies)),
+        })
+
+    return report
@@ -0,0 +1,165 @@
+import math
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+import numpy as np
+from src.utils.preprocess import aligned_empty
+from src.services.inference import InferenceBusyError
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    รวมคำขอ inference จากหลาย thread ให้เป็น batch เดียว (dynamic micro-batching)
+
+    แต่ละคำขอส่ง input หนึ่งชิ้นผ่าน submit() และได้ Future กลับไป thread เบื้องหลังจะรอ
+    รวบรวมคำขอไม่เกิน window_ms หรือจนครบ max_batch_size แล้วเรียก run_batch ครั้งเดียว
+    จากนั้นกระจายผลลัพธ์กลับไปยัง Future ของแต่ละคำขอ ถ้าคิวเต็ม submit() จะได้ InferenceBusyError ทันที
+    """
+
+    def __init__(self, run_batch, max_batch_size=32, window_ms=5.0, name='batcher', max_queue=None, workers=1):
+        """
+        เริ่มต้น MicroBatcher
+
+        Args:
+            run_batch: ฟังก์ชันที่รับ numpy array (N, ...) และคืนผลลัพธ์ N แถว
+            max_batch_size: จำนวนคำขอสูงสุดต่อ batch
+            window_ms: เวลาสูงสุดที่รอรวบรวมคำขอหลังได้คำขอแรก (มิลลิวินาที)
+            name: ชื่อของ thread (ใช้ใน log และข้อความผิดพลาด)
+            max_queue: จำนวนคำขอที่รอในคิวได้สูงสุด (None = ไม่จำกัด)
+            workers: จำนวน thread ที่รวบรวมและรัน batch พร้อมกันได้
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self.name = name
+        self.batches_run = 0
+        self.items_run = 0
+        self.rejected = 0
+        self.max_queue = None if max_queue is None else max(1, int(max_queue))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._batch_seconds = None
+        self._running_workers = max(1, int(workers))
+        self._threads = [threading.Thread(target=self._loop, name=f'{name}-{i}', daemon=True)
+                         for i in range(max(1, int(workers)))]
+        for thread in self._threads:
+            thread.start()
+
+    def retry_after(self):
+        """ประมาณเวลาที่คิวปัจจุบันจะว่าง (วินาที) จากเวลาประมวลผลเฉลี่ยต่อ batch"""
+        batches = self._queue.qsize() / self.max_batch_size + 1
+        return max(1, math.ceil((self._batch_seconds or 1.0) * batches / len(self._threads)))
+
+    def submit(self, item):
+        """
+        ส่ง input หนึ่งชิ้นเข้าคิว
+
+        input ที่ shape หรือ dtype ต่างกันจะถูกแยกรันคนละ batch ไม่ทำให้ทั้ง batch ล้มเหลว
+
+        Args:
+            item: numpy array ของ input หนึ่งชิ้น (ไม่มีมิติ batch)
+
+        Returns:
+            future: Future ที่จะได้ผลลัพธ์ของ input นี้
+
+        Raises:
+            RuntimeError: ถ้า batcher ถูกปิดแล้ว
+            InferenceBusyError: ถ้าคิวเต็ม
+        """
+        item = np.asarray(item)
+        future = Future()
+        # ตรวจสถานะและใส่คิวภายใต้ lock เดียวกับ close() เพื่อไม่ให้มีคำขอเข้าคิวหลัง _STOP
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{self.name} ถูกปิดแล้ว")
+            if self.max_queue is not None and self._queue.qsize() >= self.max_queue:
+                self.rejected += 1
+                raise InferenceBusyError(self.name, self.retry_after())
+            self._queue.put((item, future))
+        return future
+
+    def _collect(self, first):
+        """รวบรวมคำขอต่อจาก first จนครบ max_batch_size หรือหมดเวลา window"""
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                # ใส่กลับเข้าคิวเพื่อให้ loop หลักหยุดหลังประมวลผล batch นี้
+                self._queue.put(_STOP)
+                break
+            batch.append(entry)
+        return batch
+
+    def _loop(self):
+        while True:
+            entry = self._queue.get()
+            if entry is _STOP:
+                break
+
+            batch = [pending for pending in self._collect(entry) if pending[1].set_running_or_notify_cancel()]
+            # แยก batch ตาม shape และ dtype เพื่อให้ input ที่ไม่เข้ากันไม่ทำให้คำขออื่นล้มเหลวไปด้วย
+            groups = {}
+            for pending in batch:
+                groups.setdefault((pending[0].shape, pending[0].dtype), []).append(pending)
+            for group in groups.values():
+                self._run_group(group)
+
+        with self._lock:
+            self._running_workers -= 1
+            if self._running_workers > 0:
+                return
+        # worker ตัวสุดท้าย: ล้มเหลวคำขอที่ยังค้างในคิว (ถ้ามี) แทนการปล่อยให้ผู้เรียกรอ Future ตลอดไป
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not _STOP and entry[1].set_running_or_notify_cancel():
+                entry[1].set_exception(RuntimeError(f"{self.name} ถูกปิดแล้ว"))
+
+    def _run_group(self, batch):
+        """รัน run_batch กับคำขอที่มี shape และ dtype เดียวกัน แล้วกระจายผลลัพธ์ไปยัง Future ของแต่ละคำขอ"""
+        try:
+            # รวม input ลง buffer ที่จัดแนวแล้ว เพื่อให้ส่งต่อให้โมเดลได้โดยไม่ต้องคัดลอกอีก
+            start = time.monotonic()
+            first_item = batch[0][0]
+            stacked = aligned_empty((len(batch),) + first_item.shape, first_item.dtype)
+            outputs = self.run_batch(np.stack([item for item, _ in batch], out=stacked))
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self.batches_run += 1
+                self.items_run += len(batch)
+                self._batch_seconds = elapsed if self._batch_seconds is None else (
+                    0.8 * self._batch_seconds + 0.2 * elapsed)
+        except Exception as e:
+            logger.error(f"{self.name}: เกิดข้อผิดพลาดในการประมวลผล batch ขนาด {len(batch)}: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+
+    def close(self, timeout=None):
+        """หยุด thread เบื้องหลังหลังจากประมวลผลคำขอที่ค้างอยู่ในคิวจนหมด"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for _ in self._threads:
+                self._queue.put(_STOP)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
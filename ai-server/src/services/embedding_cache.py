@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def content_hash(image):
+    """
+    คำนวณ hash ของรูปภาพที่ decode แล้ว (รวมขนาดและชนิดข้อมูล) ใช้เป็นกุญแจของแคช
+
+    Args:
+        image: numpy array ของรูปภาพ
+
+    Returns:
+        digest: สตริง hex ความยาว 32 ตัวอักษร
+    """
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.shape}|{image.dtype}".encode())
+    digest.update(memoryview(image).cast('B'))
+    return digest.hexdigest()
+
+
+def _encode_detections(faces):
+    return json.dumps(faces).encode()
+
+
+def _decode_detections(data):
+    return json.loads(data)
+
+
+def _encode_embedding(embedding):
+    return np.asarray(embedding, dtype='<f4').tobytes()
+
+
+def _decode_embedding(data):
+    return np.frombuffer(data, dtype='<f4').copy()
+
+
+def _normalize_detections(faces):
+    """แปลงผลการตรวจจับจาก MTCNN (มี numpy scalar / tuple) ให้เป็นชนิดข้อมูลพื้นฐานที่ serialize ได้"""
+    return [{
+        'box': [int(v) for v in face['box']],
+        'confidence': float(face['confidence']),
+        'keypoints': {name: [int(v) for v in point] for name, point in face['keypoints'].items()}
+    } for face in faces]
+
+
+# ชนิดข้อมูลที่แคชได้: (แปลงก่อนเก็บใน L1, encode สำหรับ Redis, decode จาก Redis)
+_CODECS = {
+    'detections': (_normalize_detections, _encode_detections, _decode_detections),
+    'embedding': (lambda embedding: np.asarray(embedding, dtype=np.float32), _encode_embedding, _decode_embedding),
+}
+
+
+class LRUCache:
+    """แคชในหน่วยความจำแบบ LRU จำกัดขนาดเป็นไบต์และมีอายุ (TTL) ปลอดภัยต่อการใช้หลาย thread"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ttl=3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.current_bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, size, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.current_bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+class RedisCache:
+    """แคชชั้นที่สองบน Redis (ใช้ร่วมกันระหว่าง worker/เครื่อง) ถ้า Redis ใช้ไม่ได้จะข้ามไปเงียบ ๆ"""
+
+    def __init__(self, url, ttl=3600, prefix='facecache:'):
+        import redis
+        self.ttl = ttl
+        self.prefix = prefix
+        self.errors = 0
+        self._client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.2)
+
+    def get(self, key):
+        try:
+            return self._client.get(self.prefix + key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"อ่านแคชจาก Redis ไม่สำเร็จ: {e}")
+            return None
+
+    def set(self, key, data):
+        try:
+            self._client.set(self.prefix + key, data, ex=self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"เขียนแคชไปยัง Redis ไม่สำเร็จ: {e}")
+
+
+class FaceCache:
+    """
+    แคชผลการตรวจจับใบหน้าและ embeddings แบบ content-addressed
+
+    กุญแจคือ hash ของรูปภาพที่ decode แล้ว + ชนิดผลลัพธ์ + เวอร์ชันโมเดล + พารามิเตอร์ของการประมวลผล
+    ชั้นแรกเป็น LRU ในหน่วยความจำของ process ชั้นที่สอง (ถ้าตั้ง REDIS_URL) เป็น Redis
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ttl=3600, redis_url=None, enabled=True):
+        """
+        เริ่มต้น FaceCache
+
+        Args:
+            max_bytes: ขนาดสูงสุดของแคชในหน่วยความจำ (ไบต์)
+            ttl: อายุของแต่ละรายการ (วินาที)
+            redis_url: URL ของ Redis สำหรับแคชชั้นที่สอง (None = ไม่ใช้)
+            enabled: ปิดแคชทั้งหมดถ้าเป็น False
+        """
+        self.enabled = enabled
+        self.memory = LRUCache(max_bytes, ttl)
+        self.redis = None
+        if enabled and redis_url:
+            try:
+                self.redis = RedisCache(redis_url, ttl)
+                logger.info(f"เปิดใช้แคชชั้นที่สองบน Redis: {redis_url}")
+            except ImportError:
+                logger.warning("ไม่พบแพ็กเกจ redis - ใช้แคชในหน่วยความจำอย่างเดียว")
+        self._counters = {kind: {'memory_hits': 0, 'redis_hits': 0, 'misses': 0} for kind in _CODECS}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """สร้าง FaceCache จาก environment variables (FACE_CACHE_*, REDIS_URL)"""
+        return cls(
+            max_bytes=int(float(os.environ.get('FACE_CACHE_MAX_MB', '256')) * 1024 * 1024),
+            ttl=int(os.environ.get('FACE_CACHE_TTL', '3600')),
+            redis_url=os.environ.get('REDIS_URL') or None,
+            enabled=os.environ.get('FACE_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no'),
+        )
+
+    @staticmethod
+    def make_key(kind, image_hash, **params):
+        """สร้างกุญแจจากชนิดผลลัพธ์, hash ของรูปภาพ และพารามิเตอร์ (เรียงตามชื่อเพื่อให้คงที่)"""
+        suffix = '|'.join(f"{name}={params[name]}" for name in sorted(params))
+        return f"{kind}:{image_hash}:{suffix}"
+
+    def _count(self, kind, counter):
+        with self._lock:
+            self._counters[kind][counter] += 1
+
+    def lookup(self, kind, image_hash, **params):
+        """
+        ค้นหาผลลัพธ์ในแคช (ชั้นหน่วยความจำก่อน แล้วจึง Redis)
+
+        Returns:
+            value: ผลลัพธ์ที่แคชไว้ หรือ None ถ้าไม่พบ (นับเป็น miss)
+        """
+        if not self.enabled or image_hash is None:
+            return None
+
+        key = self.make_key(kind, image_hash, **params)
+        value = self.memory.get(key)
+        if value is not None:
+            self._count(kind, 'memory_hits')
+            return value
+
+        if self.redis is not None:
+            data = self.redis.get(key)
+            if data is not None:
+                self._count(kind, 'redis_hits')
+                value = _CODECS[kind][2](data)
+                self.memory.set(key, value, len(data))
+                return value
+
+        self._count(kind, 'misses')
+        return None
+
+    def store(self, kind, image_hash, value, **params):
+        """
+        เก็บผลลัพธ์ลงแคชทุกชั้น (ผลลัพธ์ที่เป็น None จะไม่ถูกเก็บ)
+
+        Returns:
+            value: ผลลัพธ์ที่แปลงเป็นรูปแบบเดียวกับที่อ่านจากแคช
+        """
+        if value is None:
+            return None
+        normalize, encode, _ = _CODECS[kind]
+        value = normalize(value)
+        if not self.enabled or image_hash is None:
+            return value
+
+        key = self.make_key(kind, image_hash, **params)
+        data = encode(value)
+        self.memory.set(key, value, len(data))
+        if self.redis is not None:
+            self.redis.set(key, data)
+        return value
+
+    def get_or_compute(self, kind, image_hash, compute, **params):
+        """
+        คืนค่าจากแคชถ้ามี ถ้าไม่มีจะเรียก compute() แล้วเก็บผลลัพธ์ (ยกเว้นผลลัพธ์เป็น None)
+
+        Args:
+            kind: ชนิดผลลัพธ์ ('detections' หรือ 'embedding')
+            image_hash: hash ของรูปภาพจาก content_hash() (None = ไม่ใช้แคช)
+            compute: ฟังก์ชันที่คำนวณผลลัพธ์เมื่อไม่พบในแคช
+            **params: เวอร์ชันโมเดลและพารามิเตอร์ที่มีผลต่อผลลัพธ์
+
+        Returns:
+            value: ผลลัพธ์จากแคชหรือจาก compute()
+        """
+        value = self.lookup(kind, image_hash, **params)
+        if value is not None:
+            return value
+        return self.store(kind, image_hash, compute(), **params)
+
+    def stats(self):
+        """สถิติของแคช: จำนวน hit/miss แยกตามชนิด, อัตรา hit, ขนาดที่ใช้และจำนวนที่ถูก evict"""
+        with self._lock:
+            counters = {kind: dict(values) for kind, values in self._counters.items()}
+        for values in counters.values():
+            total = values['memory_hits'] + values['redis_hits'] + values['misses']
+            values['hit_ratio'] = (values['memory_hits'] + values['redis_hits']) / total if total else 0.0
+        return {
+            'enabled': self.enabled,
+            'redis': self.redis is not None,
+            'entries': len(self.memory),
+            'bytes': self.memory.current_bytes,
+            'max_bytes': self.memory.max_bytes,
+            'evictions': self.memory.evictions,
+            'redis_errors': self.redis.errors if self.redis is not None else 0,
+            'kinds': counters,
+        }
+
+
+# แคชที่ใช้ร่วมกันทั้ง process
+face_cache = FaceCache.from_env()
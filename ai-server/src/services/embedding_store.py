@@ -0,0 +1,376 @@
+import os
+import json
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+from src.services.gallery_index import normalize_embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows: ล็อกได้เฉพาะภายใน process เดียว
+    fcntl = None
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STORE_DTYPES = ('float32', 'float16')
+
+META_FILE = 'meta.json'
+LOCK_FILE = '.lock'
+
+
+class EmbeddingStore:
+    """
+    คลัง embeddings บนดิสก์แบบ append-only สำหรับ gallery ขนาดใหญ่
+
+    โครงสร้างในโฟลเดอร์:
+        meta.json            มิติ ชนิดข้อมูล และ generation ปัจจุบัน (จุด commit ของการ compact)
+        vectors-<gen>.bin    เมทริกซ์ embeddings ที่ normalize แล้ว (float32 หรือ float16) ต่อกันเป็นแถว
+        ids-<gen>.jsonl      บันทึกการเปลี่ยนแปลง หนึ่งบรรทัดต่อการเพิ่มหนึ่งแถวหรือการลบหนึ่งผู้ใช้
+
+    เมทริกซ์ถูกเปิดด้วย np.memmap แบบอ่านอย่างเดียว worker จึงค้นหาได้ทันทีโดยไม่ต้องอ่านทั้งไฟล์
+    เข้าหน่วยความจำของตัวเอง และทุก worker ของ gunicorn ใช้หน้าหน่วยความจำชุดเดียวกันจาก page cache
+    การเขียนจะล็อกไฟล์ (fcntl) ข้าม process และ worker อื่นจะเห็นแถวใหม่ในการค้นหาครั้งถัดไป
+    การลบเป็นแบบ tombstone จนกว่าจะเรียก compact()
+
+    ใช้แทน GalleryIndex ได้ (add / add_many / remove / search)
+    """
+
+    def __init__(self, path, dim=512, dtype='float32', block_rows=65536):
+        """
+        เปิดหรือสร้างคลัง embeddings
+
+        Args:
+            path: โฟลเดอร์ของคลัง (สร้างให้ถ้ายังไม่มี)
+            dim: จำนวนมิติของ embedding (ใช้เมื่อสร้างคลังใหม่)
+            dtype: 'float32' หรือ 'float16' (ใช้เมื่อสร้างคลังใหม่ float16 ใช้พื้นที่ครึ่งหนึ่ง)
+            block_rows: จำนวนแถวต่อการคูณเมทริกซ์หนึ่งครั้งตอนค้นหา (จำกัดหน่วยความจำชั่วคราว)
+        """
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"dtype ต้องเป็นหนึ่งใน {STORE_DTYPES} ไม่ใช่ {dtype!r}")
+
+        self.path = path
+        self.block_rows = block_rows
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            with self._write_lock():
+                if not os.path.exists(meta_path):
+                    self._write_meta({'dim': dim, 'dtype': dtype, 'generation': 0})
+        self._load()
+
+    # ----- การอ่านไฟล์ -----
+
+    def _file(self, kind, generation=None):
+        generation = self.generation if generation is None else generation
+        suffix = 'bin' if kind == 'vectors' else 'jsonl'
+        return os.path.join(self.path, f"{kind}-{generation}.{suffix}")
+
+    def _write_meta(self, meta):
+        tmp_path = os.path.join(self.path, META_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+    def _meta_stamp(self):
+        stat = os.stat(os.path.join(self.path, META_FILE))
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
+        """อ่าน meta.json และบันทึกของ generation ปัจจุบันใหม่ทั้งหมด"""
+        with open(os.path.join(self.path, META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+        self._stamp = self._meta_stamp()
+        self.dim = int(meta['dim'])
+        self.dtype = np.dtype(meta['dtype'])
+        self.generation = int(meta['generation'])
+
+        self._ids = []
+        self._ids_snapshot = ()
+        self._alive = np.zeros(0, dtype=bool)
+        self._rows = {}
+        self._log_offset = 0
+        self._matrix = np.empty((0, self.dim), dtype=self.dtype)
+        self._read_log()
+
+    def _read_log(self):
+        """อ่านเฉพาะบรรทัดใหม่ของบันทึกต่อจากครั้งก่อน แล้วขยาย memmap ให้ครอบคลุมแถวใหม่"""
+        log_path = self._file('ids')
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        # บรรทัดสุดท้ายที่ยังเขียนไม่จบ (ไม่มี \n) จะถูกอ่านในครั้งถัดไป
+        complete = data[:data.rfind(b'\n') + 1]
+        if not complete:
+            return
+        self._log_offset += len(complete)
+
+        deleted = []
+        for line in complete.splitlines():
+            record = json.loads(line)
+            if 'delete' in record:
+                deleted.extend(self._rows.pop(record['delete'], []))
+            else:
+                self._rows.setdefault(record['id'], []).append(len(self._ids))
+                self._ids.append(record['id'])
+
+        if len(self._ids) > len(self._alive):
+            alive = np.ones(len(self._ids), dtype=bool)
+            alive[:len(self._alive)] = self._alive
+            self._alive = alive
+            self._matrix = np.memmap(self._file('vectors'), dtype=self.dtype, mode='r',
+                                     shape=(len(self._ids), self.dim))
+        if deleted:
+            alive = self._alive.copy()
+            alive[deleted] = False
+            self._alive = alive
+
+    def refresh(self):
+        """
+        อ่านการเปลี่ยนแปลงที่ process อื่นเขียนไว้ (แถวใหม่ การลบ หรือการ compact)
+
+        เรียกอัตโนมัติก่อนค้นหาทุกครั้ง ต้นทุนคือ os.stat สองครั้งเมื่อไม่มีอะไรเปลี่ยน
+        """
+        with self._lock:
+            if self._meta_stamp() != self._stamp:
+                self._load()
+                return
+            log_path = self._file('ids')
+            if os.path.exists(log_path) and os.path.getsize(log_path) > self._log_offset:
+                self._read_log()
+
+    def _snapshot(self):
+        """
+        คืน (matrix, ids, alive) ชุดปัจจุบันที่ยาวเท่ากันทั้งสามตัว ใช้ค้นหาต่อได้โดยไม่ต้องถือ lock
+
+        ids เป็น tuple ที่ไม่เปลี่ยนแปลง (self._ids ถูกต่อท้ายในที่เดิมเมื่อ thread อื่นเพิ่มแถว)
+        และสร้างใหม่เฉพาะเมื่อจำนวนแถวเปลี่ยน
+        """
+        self.refresh()
+        with self._lock:
+            size = len(self._ids)
+            if len(self._ids_snapshot) != size:
+                self._ids_snapshot = tuple(self._ids)
+            return self._matrix[:size], self._ids_snapshot, self._alive[:size]
+
+    # ----- การเขียน -----
+
+    @contextmanager
+    def _write_lock(self):
+        """ล็อกการเขียนทั้งภายใน process (threading) และข้าม process (fcntl.flock)"""
+        with self._lock:
+            with open(os.path.join(self.path, LOCK_FILE), 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append_log(self, records):
+        with open(self._file('ids'), 'ab') as f:
+            f.write(''.join(json.dumps(record) + '\n' for record in records).encode('utf-8'))
+
+    def add(self, user_id, embedding):
+        """
+        เพิ่ม embedding ของผู้ใช้เข้าคลัง
+
+        Args:
+            user_id: รหัสผู้ใช้ (ค่าที่แปลงเป็น JSON ได้ เช่น str หรือ int)
+            embedding: embedding (D,)
+        """
+        self.add_many([user_id], np.asarray(embedding).reshape(1, -1))
+
+    def add_many(self, user_ids, embeddings):
+        """
+        เพิ่ม embeddings หลายชุดเข้าคลังในครั้งเดียว
+
+        เวกเตอร์ถูกเขียนลงไฟล์ก่อนบันทึก id เสมอ ถ้า process ตายระหว่างทาง แถวที่ไม่มี id
+        จะถูกเขียนทับในการเพิ่มครั้งถัดไป
+
+        Args:
+            user_ids: รายการรหัสผู้ใช้ (ยาวเท่ากับจำนวนแถวของ embeddings)
+            embeddings: เมทริกซ์ embeddings (N, D)
+        """
+        user_ids = list(user_ids)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.dim:
+            raise ValueError(f"embeddings ต้องมีขนาด (N, {self.dim}) แต่ได้ {embeddings.shape}")
+        if len(user_ids) != len(embeddings):
+            raise ValueError("จำนวน user id ไม่ตรงกับจำนวน embeddings")
+        if not user_ids:
+            return
+
+        rows = normalize_embeddings(embeddings).astype(self.dtype)
+        with self._write_lock():
+            self.refresh()
+            row_bytes = self.dim * self.dtype.itemsize
+            vectors_path = self._file('vectors')
+            with open(vectors_path, 'r+b' if os.path.exists(vectors_path) else 'wb') as f:
+                f.seek(len(self._ids) * row_bytes)
+                f.write(rows.tobytes())
+                f.truncate()
+            self._append_log([{'id': user_id} for user_id in user_ids])
+            self._read_log()
+
+    def remove(self, user_id):
+        """
+        ลบ embeddings ทั้งหมดของผู้ใช้ (tombstone พื้นที่จะคืนเมื่อ compact)
+
+        Args:
+            user_id: รหัสผู้ใช้
+
+        Returns:
+            removed: จำนวนแถวที่ถูกลบ
+        """
+        with self._write_lock():
+            self.refresh()
+            removed = len(self._rows.get(user_id, []))
+            if removed:
+                self._append_log([{'delete': user_id}])
+                self._read_log()
+            return removed
+
+    def compact(self):
+        """
+        เขียนเฉพาะแถวที่ยังไม่ถูกลบลง generation ใหม่ แล้วสลับ meta.json (atomic)
+
+        process อื่นที่ยังเปิด memmap ของ generation เดิมค้นหาต่อได้จนกว่าจะ refresh
+        (ไฟล์ที่ถูกลบยังคงอยู่จนกว่าจะไม่มีใครเปิด)
+
+        Returns:
+            removed: จำนวนแถวที่ถูกลบทิ้ง
+        """
+        with self._write_lock():
+            self.refresh()
+            live = np.flatnonzero(self._alive)
+            removed = len(self._ids) - len(live)
+            if removed == 0:
+                return 0
+
+            old_generation = self.generation
+            generation = old_generation + 1
+            with open(self._file('vectors', generation), 'wb') as f:
+                for start in range(0, len(live), self.block_rows):
+                    f.write(np.ascontiguousarray(self._matrix[live[start:start + self.block_rows]]).tobytes())
+            with open(self._file('ids', generation), 'wb') as f:
+                f.write(''.join(json.dumps({'id': self._ids[row]}) + '\n' for row in live).encode('utf-8'))
+
+            self._write_meta({'dim': self.dim, 'dtype': self.dtype.name, 'generation': generation})
+            for kind in ('vectors', 'ids'):
+                try:
+                    os.remove(self._file(kind, old_generation))
+                except FileNotFoundError:
+                    pass
+            self._load()
+
+        logger.info(f"compact คลัง embeddings {self.path}: ลบ {removed} แถว เหลือ {len(live)} แถว")
+        return removed
+
+    # ----- การค้นหา -----
+
+    def __len__(self):
+        _, _, alive = self._snapshot()
+        return int(alive.sum())
+
+    def __contains__(self, user_id):
+        self.refresh()
+        with self._lock:
+            return bool(self._rows.get(user_id))
+
+    @property
+    def ids(self):
+        """รายการ user id ของแถวที่ยังไม่ถูกลบ เรียงตามแถว"""
+        _, ids, alive = self._snapshot()
+        return [ids[row] for row in np.flatnonzero(alive)]
+
+    @property
+    def embeddings(self):
+        """เมทริกซ์ embeddings ของแถวที่ยังไม่ถูกลบ (float32 คัดลอกเข้าหน่วยความจำ)"""
+        matrix, _, alive = self._snapshot()
+        return np.asarray(matrix[alive], dtype=np.float32)
+
+    def search(self, embedding, k=1, threshold=None):
+        """
+        ค้นหา k ใบหน้าที่ใกล้เคียงที่สุดด้วย cosine distance
+
+        Args:
+            embedding: embedding ที่ต้องการค้นหา (D,)
+            k: จำนวนผลลัพธ์สูงสุด
+            threshold: ถ้าระบุ จะคืนเฉพาะผลที่ distance < threshold
+
+        Returns:
+            matches: รายการ (user_id, distance) เรียงจากใกล้ที่สุด
+        """
+        if embedding is None:
+            return []
+        return self.search_batch(np.asarray(embedding).reshape(1, -1), k, threshold)[0]
+
+    def search_batch(self, embeddings, k=1, threshold=None):
+        """
+        ค้นหาหลาย embeddings พร้อมกัน (อ่านเมทริกซ์จากดิสก์รอบเดียวสำหรับทุก query)
+
+        Args:
+            embeddings: เมทริกซ์ query (Q, D)
+            k: จำนวนผลลัพธ์สูงสุดต่อ query
+            threshold: ถ้าระบุ จะคืนเฉพาะผลที่ distance < threshold
+
+        Returns:
+            matches: รายการผลลัพธ์ของแต่ละ query ในรูปแบบเดียวกับ search()
+        """
+        queries = normalize_embeddings(np.asarray(embeddings).reshape(-1, self.dim))
+        matrix, ids, alive = self._snapshot()
+        size = len(ids)
+        live = int(alive.sum())
+        if size == 0 or live == 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+
+        # cosine distance ของทุกแถว คำนวณทีละ block เพื่อให้หน่วยความจำชั่วคราวคงที่
+        distances = np.empty((len(queries), size), dtype=np.float32)
+        for start in range(0, size, self.block_rows):
+            block = np.asarray(matrix[start:start + self.block_rows], dtype=np.float32)
+            np.matmul(queries, block.T, out=distances[:, start:start + len(block)])
+        np.subtract(1.0, distances, out=distances)
+        distances[:, ~alive] = np.inf
+
+        k = min(k, live)
+        if k < size:
+            top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(size), (len(queries), size))
+
+        results = []
+        for query_distances, query_top in zip(distances, top):
+            query_top = query_top[np.argsort(query_distances[query_top], kind='stable')]
+            matches = []
+            for row in query_top:
+                distance = float(query_distances[row])
+                if distance == np.inf or (threshold is not None and distance >= threshold):
+                    break
+                matches.append((ids[row], distance))
+            results.append(matches)
+        return results
+
+    def stats(self):
+        """ขนาดของคลัง (จำนวนแถว แถวที่ถูกลบ ขนาดไฟล์)"""
+        _, ids, alive = self._snapshot()
+        vectors_path = self._file('vectors')
+        live = int(alive.sum())
+        return {
+            'path': self.path,
+            'dim': self.dim,
+            'dtype': self.dtype.name,
+            'generation': self.generation,
+            'rows': len(ids),
+            'live_rows': live,
+            'deleted_rows': len(ids) - live,
+            'users': len({ids[row] for row in np.flatnonzero(alive)}),
+            'file_bytes': os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0,
+        }
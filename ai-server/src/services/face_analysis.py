@@ -0,0 +1,265 @@
+import os
+import logging
+from src.services.face_detection import detect_faces, detect_faces_batch, detector_version
+from src.services.embedding_cache import face_cache, content_hash
+from src.utils.preprocess import extract_face, align_face, align_faces, ALIGNMENT_MODES
+from src.utils.quality import quality_assessment_batch
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# ผลลัพธ์ที่ผู้เรียกเลือกได้
+ANALYSIS_OUTPUTS = ('crop', 'alignment', 'embedding', 'quality')
+
+NO_FACE_MESSAGE = "ไม่พบใบหน้าในรูปภาพ"
+CROP_FAILED_MESSAGE = "ไม่สามารถตัดใบหน้าจากรูปภาพได้"
+INVALID_IMAGE_MESSAGE = "ไม่สามารถอ่านรูปภาพได้"
+
+
+def parse_outputs(value, default=('embedding', 'quality')):
+    """
+    แปลงรายการผลลัพธ์ที่ผู้ใช้ส่งมา (list หรือสตริงคั่นด้วย comma) และตรวจสอบความถูกต้อง
+
+    Raises:
+        ValueError: ถ้ามีชื่อผลลัพธ์ที่ไม่รู้จัก
+    """
+    if value is None or value == '':
+        return tuple(default)
+    if isinstance(value, str):
+        value = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in value if name not in ANALYSIS_OUTPUTS]
+    if unknown:
+        raise ValueError(f"ไม่รู้จักผลลัพธ์: {', '.join(unknown)} (รองรับ {', '.join(ANALYSIS_OUTPUTS)})")
+    return tuple(value)
+
+
+class FaceAnalyzer:
+    """
+    ขั้นตอนวิเคราะห์ใบหน้าแบบครั้งเดียวจบ: ตรวจจับใบหน้าครั้งเดียวต่อรูป แล้วสร้าง crop, ภาพที่จัดแนวแล้ว,
+    embedding และคะแนนคุณภาพจาก crop เดียวกันตามที่ผู้เรียกเลือก
+
+    embeddings ของทุกใบหน้าจากทุกรูปในการเรียกหนึ่งครั้งจะถูกรวมเป็น batch เดียว
+    ผลการตรวจจับและ embeddings ถูกเก็บใน FaceCache ตาม hash ของรูปภาพ
+    """
+
+    def __init__(self, face_recognition, cache=face_cache, chunk_size=32, margin=20, alignment=None):
+        """
+        เริ่มต้น FaceAnalyzer
+
+        Args:
+            face_recognition: instance ของ FaceRecognition หรือฟังก์ชันที่คืน instance
+                (โหลด FaceNet เมื่อต้องใช้ embedding ครั้งแรก คำขอที่ขอเฉพาะคุณภาพจึงไม่ต้องรอโหลดโมเดล)
+            cache: FaceCache ที่ใช้เก็บผลการตรวจจับและ embeddings
+            chunk_size: จำนวนใบหน้าสูงสุดต่อการเรียก get_embeddings_batch
+            margin: ระยะขอบของการตัดใบหน้า
+            alignment: วิธีจัดแนวใบหน้าก่อนสร้าง embedding จาก ALIGNMENT_MODES
+                (None = อ่านจาก FACE_ALIGNMENT, ค่าเริ่มต้น 'none')
+
+        Raises:
+            ValueError: ถ้า alignment ไม่อยู่ใน ALIGNMENT_MODES
+        """
+        alignment = (alignment or os.environ.get('FACE_ALIGNMENT', 'none')).lower()
+        if alignment not in ALIGNMENT_MODES:
+            raise ValueError(f"ไม่รู้จักวิธีจัดแนวใบหน้า: {alignment} (รองรับ {', '.join(ALIGNMENT_MODES)})")
+        self._face_recognition = face_recognition
+        self.alignment = alignment
+        self.cache = cache
+        self.chunk_size = chunk_size
+        self.margin = margin
+
+    @property
+    def face_recognition(self):
+        if callable(self._face_recognition):
+            self._face_recognition = self._face_recognition()
+        return self._face_recognition
+
+    def detect(self, image, image_hash=None, detector=None):
+        """ตรวจจับใบหน้า โดยใช้ผลจากแคชถ้าเคยตรวจจับรูปเดียวกันด้วย detector เดียวกันแล้ว"""
+        return self.cache.get_or_compute('detections', image_hash, lambda: detect_faces(image, backend=detector),
+                                         detector=detector_version(detector))
+
+    def detect_many(self, images, image_hashes, detector=None):
+        """
+        ตรวจจับใบหน้าในหลายรูป รูปที่ไม่มีในแคชจะถูกตรวจจับพร้อมกันใน batch เดียว
+
+        Args:
+            images: รายการรูปภาพ
+            image_hashes: hash ของแต่ละรูป (None = ไม่ใช้แคชสำหรับรูปนั้น)
+            detector: backend ของการตรวจจับใบหน้า (None = ค่าเริ่มต้นของเซิร์ฟเวอร์)
+
+        Returns:
+            detections: รายการผลการตรวจจับต่อรูป
+        """
+        version = detector_version(detector)
+        detections = [self.cache.lookup('detections', image_hash, detector=version) for image_hash in image_hashes]
+        missing = [i for i, faces in enumerate(detections) if faces is None]
+        if len(missing) == 1:
+            i = missing[0]
+            detections[i] = self.cache.store('detections', image_hashes[i],
+                                             detect_faces(images[i], backend=detector), detector=version)
+        elif missing:
+            computed = detect_faces_batch([images[i] for i in missing], backend=detector)
+            for i, faces in zip(missing, computed):
+                detections[i] = self.cache.store('detections', image_hashes[i], faces, detector=version)
+        return detections
+
+    def _embedding_params(self, face):
+        return {
+            'model': self.face_recognition.model_version,
+            'box': tuple(face['box']),
+            'size': 160,
+            'margin': self.margin,
+            'profile': self.face_recognition.preprocessor.profile,
+            'alignment': self.alignment,
+        }
+
+    def analyze(self, image, outputs=('embedding', 'quality'), all_faces=False, image_hash=None,
+                with_feedback=True, detector=None):
+        """
+        วิเคราะห์ใบหน้าในรูปภาพเดียว (คุณภาพวัดบน crop ขนาดจริง ตรงกับ FaceRecognition.quality_assessment)
+
+        Returns:
+            result: dict ที่มี 'faces' (รายการผลของแต่ละใบหน้า) หรือ 'error' ถ้าวิเคราะห์ไม่ได้
+        """
+        return self.analyze_many([image], outputs, all_faces, [image_hash], with_feedback, detector)[0]
+
+    def analyze_many(self, images, outputs=('embedding', 'quality'), all_faces=False, image_hashes=None,
+                     with_feedback=True, detector=None, quality_size=None):
+        """
+        วิเคราะห์ใบหน้าในหลายรูปภาพ โดยตรวจจับครั้งเดียวต่อรูปและสร้าง embeddings เป็น batch
+
+        Args:
+            images: รายการรูปภาพ BGR (รูปที่เป็น None ถือว่าอ่านไม่ได้)
+            outputs: ผลลัพธ์ที่ต้องการจาก ANALYSIS_OUTPUTS
+            all_faces: True = ทุกใบหน้าเรียงตามความมั่นใจ, False = เฉพาะใบหน้าที่มั่นใจสูงสุด
+            image_hashes: hash ของแต่ละรูป (ถ้าไม่ระบุจะคำนวณเมื่อเปิดแคช)
+            with_feedback: สร้างคำแนะนำด้านคุณภาพด้วยหรือไม่ (False = คืนเฉพาะคะแนน)
+            detector: backend ของการตรวจจับใบหน้า ('mtcnn' / 'yunet', None = ค่าเริ่มต้นของเซิร์ฟเวอร์)
+            quality_size: ขนาดที่ย่อ crop ก่อนวัดคุณภาพแบบ vectorized (None = วัดบน crop ขนาดจริงทีละใบ
+                ตรงกับเกณฑ์เบลอที่ตั้งไว้สำหรับ crop ขนาดจริง ใช้ขนาดคงที่เฉพาะเมื่อต้องการเทียบคะแนนกันเองเท่านั้น)
+
+        Returns:
+            results: รายการ dict ต่อรูปภาพ แต่ละใบหน้ามี box, confidence, landmarks
+                และ crop / aligned / embedding / quality ตามที่เลือก
+        """
+        outputs = set(outputs)
+        image_hashes = image_hashes or [None] * len(images)
+        results = []
+        pending = []
+        quality_pending = []
+
+        if self.cache.enabled:
+            image_hashes = [content_hash(image) if image_hash is None and image is not None else image_hash
+                            for image, image_hash in zip(images, image_hashes)]
+        # ตรวจจับทุกรูปที่อ่านได้ใน batch เดียว (MTCNN รันเครือข่ายทีละ batch ของทุกรูปแทนทีละรูป)
+        valid = [i for i, image in enumerate(images) if image is not None]
+        detections = dict(zip(valid, self.detect_many([images[i] for i in valid],
+                                                      [image_hashes[i] for i in valid], detector)))
+
+        for i, (image, image_hash) in enumerate(zip(images, image_hashes)):
+            if image is None:
+                results.append({'error': INVALID_IMAGE_MESSAGE})
+                continue
+
+            faces = detections[i]
+            if not faces:
+                results.append({'error': NO_FACE_MESSAGE})
+                continue
+
+            # ถ้าไม่ได้ขอทุกใบหน้า ใช้ใบหน้าที่มีความมั่นใจสูงสุด
+            if all_faces:
+                faces = sorted(faces, key=lambda x: x['confidence'], reverse=True)
+            else:
+                faces = [max(faces, key=lambda x: x['confidence'])]
+
+            analyzed = []
+            for face in faces:
+                # ตัดใบหน้าครั้งเดียว ใช้ร่วมกันทุกผลลัพธ์
+                face_img = extract_face(image, face['box'], self.margin)
+                if face_img is None:
+                    continue
+
+                entry = {
+                    'box': face['box'],
+                    'confidence': float(face['confidence']),
+                    'landmarks': face['keypoints'],
+                }
+                if 'crop' in outputs:
+                    entry['crop'] = face_img
+                if 'alignment' in outputs:
+                    # ภาพเดียวกับที่ FaceNet เห็นเมื่อใช้ FACE_ALIGNMENT=similarity
+                    aligned, _ = align_faces(image, [face['keypoints']])
+                    entry['aligned'] = aligned[0] if len(aligned) else align_face(face_img, face['keypoints'])
+                if 'quality' in outputs:
+                    quality_pending.append((entry, face_img))
+                if 'embedding' in outputs:
+                    pending.append((entry, face_img, (image, face['keypoints']), image_hash,
+                                    self._embedding_params(face)))
+                analyzed.append(entry)
+
+            if analyzed:
+                results.append({'faces': analyzed})
+            else:
+                results.append({'error': CROP_FAILED_MESSAGE})
+
+        if quality_pending:
+            # ประเมินคุณภาพของทุกใบหน้าจากทุกรูปในครั้งเดียว
+            scores, feedback = quality_assessment_batch(
+                [face_img for _, face_img in quality_pending], with_feedback=with_feedback, size=quality_size)
+            for i, (entry, _) in enumerate(quality_pending):
+                entry['quality'] = {'score': float(scores[i])}
+                if feedback is not None:
+                    entry['quality']['feedback'] = feedback[i]
+
+        if pending:
+            self._embed(pending)
+
+        return results
+
+    def _embed(self, pending):
+        """สร้าง embeddings ของใบหน้าที่ไม่อยู่ในแคชทั้งหมดในคราวเดียว แล้วเก็บลงแคช"""
+        misses = []
+        for entry, face_img, landmarks, image_hash, params in pending:
+            cached = self.cache.lookup('embedding', image_hash, **params)
+            if cached is not None:
+                entry['embedding'] = cached
+            elif self.alignment == 'similarity':
+                misses.append((entry, face_img, landmarks, image_hash, params))
+            else:
+                misses.append((entry, face_img, image_hash, params))
+
+        if self.alignment == 'similarity':
+            self._embed_aligned(misses)
+            return
+
+        if len(misses) == 1:
+            # ใบหน้าเดียวใช้ get_embeddings เพื่อให้ถูกรวมกับคำขออื่นผ่าน micro-batching
+            entry, face_img, image_hash, params = misses[0]
+            entry['embedding'] = self.cache.store('embedding', image_hash,
+                                                  self.face_recognition.get_embeddings(face_img), **params)
+            return
+
+        for start in range(0, len(misses), self.chunk_size):
+            chunk = misses[start:start + self.chunk_size]
+            embeddings = self.face_recognition.get_embeddings_batch([face_img for _, face_img, _, _ in chunk])
+
+            # get_embeddings_batch ข้ามใบหน้าที่ preprocess ไม่ได้ ถ้าจำนวนไม่ตรงให้คำนวณทีละใบแทน
+            if embeddings is None or len(embeddings) != len(chunk):
+                embeddings = [self.face_recognition.get_embeddings(face_img) for _, face_img, _, _ in chunk]
+
+            for (entry, _, image_hash, params), embedding in zip(chunk, embeddings):
+                entry['embedding'] = self.cache.store('embedding', image_hash, embedding, **params)
+
+    def _embed_aligned(self, misses):
+        """
+        สร้าง embeddings ด้วยการจัดแนวแบบ similarity จากภาพต้นฉบับ ใบหน้าทั้งหมดของแต่ละรูปถูก warp
+        ลงใน batch เดียว ใบหน้าที่จัดแนวไม่ได้ (ไม่มี landmarks ครบ) ใช้ crop แบบเดิมแทน
+        """
+        for start in range(0, len(misses), self.chunk_size):
+            chunk = misses[start:start + self.chunk_size]
+            embeddings = self.face_recognition.get_embeddings_aligned([landmarks for _, _, landmarks, _, _ in chunk])
+            for (entry, face_img, _, image_hash, params), embedding in zip(chunk, embeddings):
+                if embedding is None:
+                    embedding = self.face_recognition.get_embeddings(face_img)
+                entry['embedding'] = self.cache.store('embedding', image_hash, embedding, **params)
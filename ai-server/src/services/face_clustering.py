@@ -0,0 +1,261 @@
+import logging
+import numpy as np
+from src.services.gallery_index import normalize_embeddings
+from src.services.ann_index import IVFIndex
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+KNN_METHODS = ('auto', 'exact', 'ivf')
+
+# method='auto' ใช้ kNN แบบ exact จนถึงจำนวนใบหน้านี้ มากกว่านี้ใช้ IVF (ต้นทุน exact โต N^2)
+EXACT_KNN_LIMIT = 20000
+
+
+def exact_knn(queries, base, k, threshold, self_offset=None, block_size=1024):
+    """
+    หา k เพื่อนบ้านที่ใกล้ที่สุดของแต่ละ query ด้วยการคูณเมทริกซ์ทีละ block (embeddings ต้อง normalize แล้ว)
+
+    Args:
+        queries: เมทริกซ์ (Q, D)
+        base: เมทริกซ์ (N, D)
+        k: จำนวนเพื่อนบ้านต่อ query
+        threshold: เก็บเฉพาะเพื่อนบ้านที่ cosine distance < threshold
+        self_offset: ถ้า queries เป็นส่วนหนึ่งของ base (queries[i] = base[self_offset + i]) จะไม่นับตัวเอง
+        block_size: จำนวน query ต่อการคูณเมทริกซ์หนึ่งครั้ง
+
+    Returns:
+        rows, cols, distances: ขอบของกราฟ kNN (index ของ query, index ใน base, ระยะห่าง)
+    """
+    rows, cols, distances = [], [], []
+    k = min(k, len(base) - (self_offset is not None))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    for start in range(0, len(queries), block_size):
+        block = 1.0 - queries[start:start + block_size] @ base.T
+        local = np.arange(len(block))
+        if self_offset is not None:
+            block[local, self_offset + start + local] = np.inf
+        top = np.argpartition(block, k - 1, axis=1)[:, :k] if k < block.shape[1] else \
+            np.broadcast_to(np.arange(block.shape[1]), block.shape)
+        top_distances = block[local[:, None], top]
+        keep = top_distances < threshold
+        rows.append(np.repeat(local + start, k).reshape(-1, k)[keep])
+        cols.append(top[keep])
+        distances.append(top_distances[keep])
+
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(distances).astype(np.float32)
+
+
+def chinese_whispers(n, rows, cols, weights, labels=None, movable=None, iterations=20, batches=10, seed=0):
+    """
+    จัดกลุ่มกราฟด้วย Chinese whispers: แต่ละโหนดรับ label ที่มีน้ำหนักรวมจากเพื่อนบ้านมากที่สุด
+
+    อัปเดตโหนดทีละชุดย่อย (สุ่มลำดับ) แบบ vectorized ทั้งชุด จึงใช้ได้กับกราฟหลายแสนโหนด
+    และไม่แกว่งเหมือนการอัปเดตพร้อมกันทุกโหนด
+
+    Args:
+        n: จำนวนโหนด
+        rows, cols, weights: ขอบของกราฟ (จะถูกทำให้เป็นกราฟไม่มีทิศทางอัตโนมัติ)
+        labels: label เริ่มต้น (ถ้าไม่ระบุ แต่ละโหนดเริ่มเป็นกลุ่มของตัวเอง)
+        movable: index ของโหนดที่เปลี่ยน label ได้ (ถ้าไม่ระบุ = ทุกโหนด)
+        iterations: จำนวนรอบสูงสุด (หยุดก่อนถ้า label ไม่เปลี่ยน)
+        batches: จำนวนชุดย่อยต่อรอบ
+        seed: seed ของการสุ่มลำดับ
+
+    Returns:
+        labels: numpy array (n,) ของ label แต่ละโหนด
+    """
+    labels = np.arange(n, dtype=np.int64) if labels is None else np.array(labels, dtype=np.int64)
+    movable = np.arange(n) if movable is None else np.asarray(movable, dtype=np.int64)
+    if len(rows) == 0 or len(movable) == 0:
+        return labels
+
+    src = np.concatenate([rows, cols]).astype(np.int64)
+    dst = np.concatenate([cols, rows]).astype(np.int64)
+    weights = np.concatenate([weights, weights]).astype(np.float32)
+    # เก็บเฉพาะขอบที่ออกจากโหนดที่เปลี่ยน label ได้
+    keep = np.zeros(n, dtype=bool)
+    keep[movable] = True
+    keep = keep[src]
+    src, dst, weights = src[keep], dst[keep], weights[keep]
+    movable = np.intersect1d(movable, src)
+
+    # รหัสรวมของคู่ (โหนด, label) เป็นจำนวนเต็มเดียว ให้ np.unique ทำงานบน array มิติเดียว
+    label_span = int(labels.max()) + 1
+    rng = np.random.default_rng(seed)
+    in_batch = np.zeros(n, dtype=bool)
+    for iteration in range(iterations):
+        changed = 0
+        for batch in np.array_split(rng.permutation(movable), min(batches, len(movable))):
+            in_batch[batch] = True
+            edges = np.flatnonzero(in_batch[src])
+            in_batch[batch] = False
+
+            # รวมน้ำหนักต่อคู่ (โหนด, label ของเพื่อนบ้าน) แล้วเลือก label ที่น้ำหนักรวมมากที่สุด
+            keys, inverse = np.unique(src[edges] * label_span + labels[dst[edges]], return_inverse=True)
+            totals = np.bincount(inverse, weights=weights[edges])
+            key_nodes = keys // label_span
+            order = np.lexsort((-totals, key_nodes))
+            first = np.concatenate([[True], key_nodes[order][1:] != key_nodes[order][:-1]])
+            nodes = key_nodes[order][first]
+            best = keys[order][first] % label_span
+
+            changed += int(np.count_nonzero(labels[nodes] != best))
+            labels[nodes] = best
+        if changed == 0:
+            break
+    logger.debug(f"chinese whispers: {iteration + 1} รอบ")
+    return labels
+
+
+class FaceClusterer:
+    """
+    จัดกลุ่มใบหน้า (เช่นทุกใบหน้าในอัลบั้ม) จาก embeddings
+
+    สร้างกราฟ kNN ที่ตัดด้วย threshold ของ cosine distance (exact แบบ block หรือ IVF สำหรับข้อมูลใหญ่)
+    แล้วจัดกลุ่มด้วย Chinese whispers ใบหน้าใหม่ที่เพิ่มภายหลังด้วย add() จะถูกจัดเข้ากลุ่มเดิม
+    โดยคำนวณเฉพาะเพื่อนบ้านของใบหน้าใหม่ และไม่เปลี่ยน label ของใบหน้าเดิม
+    """
+
+    def __init__(self, threshold=0.6, k=10, method='auto', iterations=20, seed=0, nprobe=8):
+        """
+        เริ่มต้น FaceClusterer
+
+        Args:
+            threshold: cosine distance สูงสุดที่ถือว่าเป็นเพื่อนบ้านในกราฟ
+            k: จำนวนเพื่อนบ้านต่อใบหน้า
+            method: 'exact', 'ivf' หรือ 'auto' (exact ถ้าไม่เกิน EXACT_KNN_LIMIT ใบหน้า)
+            iterations: จำนวนรอบสูงสุดของ Chinese whispers
+            seed: seed ของการสุ่ม (ผลลัพธ์ซ้ำได้)
+            nprobe: จำนวนกลุ่มที่ค้นหาต่อ query เมื่อใช้ IVF
+        """
+        if method not in KNN_METHODS:
+            raise ValueError(f"method ต้องเป็นหนึ่งใน {KNN_METHODS} ไม่ใช่ {method!r}")
+        self.threshold = threshold
+        self.k = k
+        self.method = method
+        self.iterations = iterations
+        self.seed = seed
+        self.nprobe = nprobe
+        self.embeddings = None
+        self.labels = np.zeros(0, dtype=np.int64)
+        self._index = None
+
+    @classmethod
+    def from_labels(cls, embeddings, labels, **kwargs):
+        """
+        สร้าง FaceClusterer จากผลการจัดกลุ่มเดิม เพื่อเพิ่มใบหน้าใหม่ด้วย add() โดยไม่จัดกลุ่มใหม่ทั้งหมด
+
+        Args:
+            embeddings: เมทริกซ์ embeddings เดิม (N, D)
+            labels: label เดิมของแต่ละใบหน้า (จำนวนเต็ม)
+        """
+        clusterer = cls(**kwargs)
+        clusterer.embeddings = normalize_embeddings(np.asarray(embeddings).reshape(len(embeddings), -1))
+        clusterer.labels = np.asarray(labels, dtype=np.int64).reshape(-1)
+        if len(clusterer.labels) != len(clusterer.embeddings):
+            raise ValueError("จำนวน labels ไม่ตรงกับจำนวน embeddings")
+        return clusterer
+
+    def _use_ivf(self, n):
+        return self.method == 'ivf' or (self.method == 'auto' and n > EXACT_KNN_LIMIT)
+
+    def _build_index(self):
+        # nlist ~ 2 sqrt(N) และฝึก k-means จากตัวอย่าง 32 จุดต่อกลุ่ม ให้เวลาสร้างดัชนีน้อยกว่าการค้นหา
+        nlist = max(1, min(len(self.embeddings) // 8, int(2 * np.sqrt(len(self.embeddings)))))
+        self._index = IVFIndex(dim=self.embeddings.shape[1], nlist=nlist, nprobe=self.nprobe, seed=self.seed)
+        self._index.train(self.embeddings, iterations=10, max_train_points=32 * nlist)
+        self._index.add_many(range(len(self.embeddings)), self.embeddings)
+
+    def _knn(self, start):
+        """ขอบ kNN ของใบหน้าตั้งแต่แถว start เทียบกับใบหน้าทั้งหมด"""
+        queries = self.embeddings[start:]
+        if not self._use_ivf(len(self.embeddings)):
+            return exact_knn(queries, self.embeddings, self.k, self.threshold, self_offset=start)
+
+        if self._index is None:
+            self._build_index()
+        elif len(self._index) < len(self.embeddings):
+            self._index.add_many(range(len(self._index), len(self.embeddings)), self.embeddings[len(self._index):])
+
+        rows, cols, distances = [], [], []
+        for i, matches in enumerate(self._index.search_batch(queries, k=self.k + 1, threshold=self.threshold)):
+            for row, distance in matches:
+                if row != start + i:
+                    rows.append(i)
+                    cols.append(row)
+                    distances.append(distance)
+        return (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64),
+                np.asarray(distances, dtype=np.float32))
+
+    def fit(self, embeddings):
+        """
+        จัดกลุ่มใบหน้าทั้งหมดใหม่
+
+        Args:
+            embeddings: เมทริกซ์ embeddings (N, D)
+
+        Returns:
+            labels: label ของแต่ละใบหน้า (0 = กลุ่มที่ใหญ่ที่สุด)
+        """
+        self.embeddings = normalize_embeddings(np.asarray(embeddings).reshape(len(embeddings), -1))
+        self._index = None
+        rows, cols, distances = self._knn(0)
+        labels = chinese_whispers(len(self.embeddings), rows, cols, 1.0 - distances,
+                                  iterations=self.iterations, seed=self.seed)
+        self.labels = self._relabel(labels)
+        return self.labels
+
+    def add(self, embeddings):
+        """
+        เพิ่มใบหน้าใหม่เข้ากลุ่มเดิม (หรือกลุ่มใหม่) โดยไม่จัดกลุ่มใบหน้าเดิมใหม่
+
+        Args:
+            embeddings: เมทริกซ์ embeddings ของใบหน้าใหม่ (M, D)
+
+        Returns:
+            labels: label ของใบหน้าใหม่ (label ใหม่เริ่มต่อจาก label สูงสุดเดิม)
+        """
+        embeddings = normalize_embeddings(np.asarray(embeddings).reshape(len(embeddings), -1))
+        if self.embeddings is None or len(self.embeddings) == 0:
+            return self.fit(embeddings)
+
+        start = len(self.embeddings)
+        self.embeddings = np.concatenate([self.embeddings, embeddings])
+        rows, cols, distances = self._knn(start)
+
+        n = len(self.embeddings)
+        next_label = int(self.labels.max()) + 1 if len(self.labels) else 0
+        labels = np.concatenate([self.labels, np.arange(next_label, next_label + len(embeddings))])
+        # ใบหน้าเดิมเป็นจุดยึด label คงที่ มีเพียงใบหน้าใหม่ที่เปลี่ยน label ได้
+        labels = chinese_whispers(n, rows + start, cols, 1.0 - distances, labels=labels,
+                                  movable=np.arange(start, n), iterations=self.iterations, seed=self.seed)
+
+        # label ใหม่ที่ไม่ได้เข้ากลุ่มเดิมถูกเรียงให้ต่อเนื่องจาก label เดิม
+        new_labels = labels[start:]
+        fresh = new_labels >= next_label
+        if fresh.any():
+            _, new_labels[fresh] = np.unique(new_labels[fresh], return_inverse=True)
+            new_labels[fresh] += next_label
+        self.labels = np.concatenate([self.labels, new_labels])
+        return new_labels
+
+    @staticmethod
+    def _relabel(labels):
+        """เรียง label ใหม่เป็น 0..C-1 ตามขนาดกลุ่มจากใหญ่ไปเล็ก"""
+        unique, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+        rank = np.empty(len(unique), dtype=np.int64)
+        rank[np.argsort(-counts, kind='stable')] = np.arange(len(unique))
+        return rank[inverse.reshape(-1)]
+
+    def clusters(self, min_size=1):
+        """
+        รายการกลุ่ม: dict ของ label -> index ของใบหน้าในกลุ่ม (เฉพาะกลุ่มที่มีอย่างน้อย min_size ใบหน้า)
+        """
+        order = np.argsort(self.labels, kind='stable')
+        unique, starts, counts = np.unique(self.labels[order], return_index=True, return_counts=True)
+        return {int(label): order[start:start + count].tolist()
+                for label, start, count in zip(unique, starts, counts) if count >= min_size}
@@ -1,28 +1,259 @@
 import cv2
 import numpy as np
-from mtcnn import MTCNN
 import os
+import sys
+import threading
+from src.services.inference import InferenceExecutor
+from src.utils.metrics import stage, BATCH_SIZE, FACES_PER_IMAGE
 
-# Initialize MTCNN detector
-detector = MTCNN()
+# Supported detector backends (DETECTOR_BACKEND selects the default, requests may override it)
+DETECTOR_BACKENDS = ('mtcnn', 'yunet')
 
-def detect_faces(image_data):
+DEFAULT_BACKEND = os.environ.get('DETECTOR_BACKEND', 'mtcnn')
+# Longest image side passed to the detector; larger images are downscaled first (0 = never, the default).
+# Opt-in only: MTCNN cannot see faces under 12 px after downscaling, so small faces in large photos get lost
+DEFAULT_MAX_SIDE = int(os.environ.get('DETECTOR_MAX_SIDE', '0'))
+# Smallest face (in original image pixels) worth detecting; prunes MTCNN's image pyramid
+DEFAULT_MIN_FACE_SIZE = int(os.environ.get('DETECTOR_MIN_FACE_SIZE', '20'))
+
+# OpenCV YuNet model (face_detection_yunet_2023mar.onnx from the OpenCV model zoo)
+YUNET_MODEL_PATH = os.environ.get('YUNET_MODEL_PATH', '../models/yunet/face_detection_yunet_2023mar.onnx')
+YUNET_SCORE_THRESHOLD = float(os.environ.get('YUNET_SCORE_THRESHOLD', '0.8'))
+
+# MTCNN's P-Net cell size: faces smaller than this can not be found at any pyramid scale
+MTCNN_MIN_CELL = 12
+
+# MTCNN detector (created lazily, once per process - see get_detector)
+detector = None
+# Pool of replicas of the default backend that detect_faces borrows from (see get_detector_pool)
+detector_pool = None
+# Pools of every backend created so far, by name
+detector_pools = {}
+_detector_lock = threading.Lock()
+
+_VERSIONS = {'mtcnn': 'mtcnn-0.1.1', 'yunet': 'yunet-2023mar'}
+
+def detector_version(backend=None, max_side=None, min_face_size=None):
     """
-    Detect faces in the given image using MTCNN
-    
-    Args:
-        image_data: numpy array of image data
-        
-    Returns:
-        List of dictionaries containing face detection results
+    Identify a detector's output format/weights and settings (part of the face cache key)
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend {backend!r} (supported: {', '.join(DETECTOR_BACKENDS)})")
+    max_side = DEFAULT_MAX_SIDE if max_side is None else max_side
+    min_face_size = DEFAULT_MIN_FACE_SIZE if min_face_size is None else min_face_size
+    return f"{_VERSIONS[backend]}/max{max_side}/min{min_face_size}"
+
+# Identifies the default detector output (part of the face cache key)
+DETECTOR_VERSION = detector_version()
+
+class YuNetDetector:
     """
+    OpenCV DNN YuNet face detector with the same detect_faces() interface and output format as MTCNN
+
+    cv2.FaceDetectorYN keeps per-input-size state, so one instance must not be used by two
+    threads at once; detect_faces borrows instances from a pool like the MTCNN replicas.
+    """
+
+    def __init__(self, model_path=YUNET_MODEL_PATH, score_threshold=YUNET_SCORE_THRESHOLD,
+                 nms_threshold=0.3, top_k=5000, min_face_size=DEFAULT_MIN_FACE_SIZE):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"YuNet model not found: {model_path} (set YUNET_MODEL_PATH)")
+        self.min_face_size = min_face_size
+        self._detector = cv2.FaceDetectorYN.create(model_path, "", (320, 320), score_threshold,
+                                                   nms_threshold, top_k)
+        self._input_size = (320, 320)
+
+    def detect_faces(self, image):
+        height, width = image.shape[:2]
+        if self._input_size != (width, height):
+            self._detector.setInputSize((width, height))
+            self._input_size = (width, height)
+        _, detections = self._detector.detect(np.ascontiguousarray(image[:, :, :3]))
+        if detections is None:
+            return []
+
+        faces = []
+        for row in detections:
+            x, y, w, h = row[:4]
+            if min(w, h) < self.min_face_size:
+                continue
+            points = row[4:14].reshape(5, 2)
+            # YuNet orders points from the subject's view (right eye first); MTCNN names
+            # them by image side, so order each pair by x
+            eyes = sorted(points[:2].tolist())
+            mouth = sorted(points[3:5].tolist())
+            x0, y0 = max(0, int(x)), max(0, int(y))
+            faces.append({
+                'box': [x0, y0, int(x + w) - x0, int(y + h) - y0],
+                'confidence': float(row[14]),
+                'keypoints': {
+                    'left_eye': (int(eyes[0][0]), int(eyes[0][1])),
+                    'right_eye': (int(eyes[1][0]), int(eyes[1][1])),
+                    'nose': (int(points[2][0]), int(points[2][1])),
+                    'mouth_left': (int(mouth[0][0]), int(mouth[0][1])),
+                    'mouth_right': (int(mouth[1][0]), int(mouth[1][1])),
+                }
+            })
+        return faces
+
+def get_detector():
+    """
+    Return the process-wide MTCNN detector, creating it on first use
+
+    Creating it lazily keeps model loading out of import time, so a forking
+    server can load it in each worker after fork. mtcnn (and with it TensorFlow)
+    is only imported here, so importing this module stays cheap.
+    """
+    global detector
+    if detector is None:
+        with _detector_lock:
+            if detector is None:
+                from mtcnn import MTCNN
+                from tensorflow import keras
+                # mtcnn calls Model.predict without verbose=0; keep Keras progress bars off stdout
+                keras.utils.disable_interactive_logging()
+                detector = MTCNN(min_face_size=max(MTCNN_MIN_CELL, DEFAULT_MIN_FACE_SIZE))
+    return detector
+
+def _create_replicas(backend):
+    if backend == 'mtcnn':
+        replicas = int(os.environ.get('MTCNN_REPLICAS', '1'))
+        first = get_detector()
+        from mtcnn import MTCNN
+        return [first] + [MTCNN() for _ in range(replicas - 1)]
+    replicas = int(os.environ.get('YUNET_REPLICAS', '1'))
+    return [YuNetDetector() for _ in range(replicas)]
+
+def get_detector_pool(backend=None):
+    """
+    Return the process-wide pool of detector replicas for a backend, creating it on first use
+
+    Configured by MTCNN_REPLICAS / YUNET_REPLICAS (detectors running in parallel), DETECTOR_MAX_QUEUE
+    (requests allowed to wait) and INFERENCE_QUEUE_TIMEOUT (seconds to wait for a replica).
+    """
+    global detector_pool
+    backend = backend or DEFAULT_BACKEND
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend {backend!r} (supported: {', '.join(DETECTOR_BACKENDS)})")
+
+    pool = detector_pools.get(backend)
+    if pool is None:
+        replicas = _create_replicas(backend)
+        with _detector_lock:
+            pool = detector_pools.get(backend)
+            if pool is None:
+                pool = InferenceExecutor(
+                    replicas,
+                    max_queue=int(os.environ.get('DETECTOR_MAX_QUEUE', '64')),
+                    queue_timeout=float(os.environ.get('INFERENCE_QUEUE_TIMEOUT', '10')),
+                    name=backend
+                )
+                detector_pools[backend] = pool
+                if backend == DEFAULT_BACKEND:
+                    detector_pool = pool
+    return pool
+
+def _scale_faces(faces, scale):
+    """Map boxes and keypoints detected on a downscaled image back to original coordinates"""
+    for face in faces:
+        x, y, w, h = face['box']
+        face['box'] = [int(round(x / scale)), int(round(y / scale)), int(round(w / scale)), int(round(h / scale))]
+        face['keypoints'] = {name: (int(round(px / scale)), int(round(py / scale)))
+                             for name, (px, py) in face['keypoints'].items()}
+    return faces
+
+def _prepare_image(image_data, max_side):
+    """Convert to RGB and downscale so the longest side is at most max_side; returns (image, scale)"""
     # Convert to RGB if needed
     if len(image_data.shape) == 2:  # Grayscale
         image_data = cv2.cvtColor(image_data, cv2.COLOR_GRAY2RGB)
     elif image_data.shape[2] == 4:  # RGBA
         image_data = cv2.cvtColor(image_data, cv2.COLOR_RGBA2RGB)
-    
-    # Detect faces
-    faces = detector.detect_faces(image_data)
-    
-    return faces
+
+    # Downscale large photos: the detector's cost grows with pixel count, faces do not need 12 MP
+    scale = 1.0
+    height, width = image_data.shape[:2]
+    if max_side and max(height, width) > max_side:
+        scale = max_side / max(height, width)
+        image_data = cv2.resize(image_data, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                interpolation=cv2.INTER_AREA)
+    return image_data, scale
+
+def _is_mtcnn(replica):
+    # Nothing can be an MTCNN instance before the mtcnn package has been imported by get_detector
+    mtcnn = sys.modules.get('mtcnn')
+    return mtcnn is not None and isinstance(replica, mtcnn.MTCNN)
+
+def _replica_min_face_size(replica, min_face_size, scale):
+    if _is_mtcnn(replica):
+        return max(MTCNN_MIN_CELL, int(min_face_size * scale))
+    return min_face_size * scale
+
+def detect_faces(image_data, backend=None, max_side=None, min_face_size=None):
+    """
+    Detect faces in the given image
+
+    Args:
+        image_data: numpy array of image data
+        backend: 'mtcnn' or 'yunet' (default: DETECTOR_BACKEND)
+        max_side: downscale so the longest side is at most this many pixels before detection
+            (default: DETECTOR_MAX_SIDE, 0 = full resolution)
+        min_face_size: smallest face to detect in original image pixels (default: DETECTOR_MIN_FACE_SIZE)
+
+    Returns:
+        List of dictionaries containing face detection results (in original image coordinates)
+    """
+    max_side = DEFAULT_MAX_SIDE if max_side is None else max_side
+    min_face_size = DEFAULT_MIN_FACE_SIZE if min_face_size is None else min_face_size
+    image_data, scale = _prepare_image(image_data, max_side)
+
+    # Detect faces on a free replica (raises InferenceBusyError when the queue is full)
+    with get_detector_pool(backend).acquire() as replica:
+        # The replica is ours until released, so the per-call minimum face size can be set on it
+        replica.min_face_size = _replica_min_face_size(replica, min_face_size, scale)
+        with stage('detect'):
+            faces = replica.detect_faces(image_data)
+    FACES_PER_IMAGE.observe(len(faces), backend or DEFAULT_BACKEND)
+
+    return _scale_faces(faces, scale) if scale != 1.0 else faces
+
+def detect_faces_batch(images, backend=None, max_side=None, min_face_size=None):
+    """
+    Detect faces in several images with one detector replica
+
+    MTCNN runs batched (see src.services.mtcnn_batch): pyramid levels of all images share
+    P-Net calls and candidate windows of all images share R-Net / O-Net calls, which is much
+    faster than calling detect_faces in a loop for enrollment and album imports.
+
+    Args:
+        images: list of numpy arrays of image data
+        backend, max_side, min_face_size: as for detect_faces
+
+    Returns:
+        List with one detect_faces() result per image
+    """
+    max_side = DEFAULT_MAX_SIDE if max_side is None else max_side
+    min_face_size = DEFAULT_MIN_FACE_SIZE if min_face_size is None else min_face_size
+    prepared = [_prepare_image(image, max_side) for image in images]
+    if not prepared:
+        return []
+
+    with get_detector_pool(backend).acquire() as replica, stage('detect'):
+        BATCH_SIZE.observe(len(prepared), backend or DEFAULT_BACKEND)
+        if _is_mtcnn(replica):
+            from src.services.mtcnn_batch import detect_faces_batch as mtcnn_detect_batch
+            results = mtcnn_detect_batch(
+                replica, [image for image, _ in prepared],
+                [_replica_min_face_size(replica, min_face_size, scale) for _, scale in prepared]
+            )
+        else:
+            results = []
+            for image, scale in prepared:
+                replica.min_face_size = _replica_min_face_size(replica, min_face_size, scale)
+                results.append(replica.detect_faces(image))
+
+    for faces in results:
+        FACES_PER_IMAGE.observe(len(faces), backend or DEFAULT_BACKEND)
+    return [_scale_faces(faces, scale) if scale != 1.0 else faces
+            for faces, (_, scale) in zip(results, prepared)]
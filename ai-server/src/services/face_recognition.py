@@ -1,52 +1,125 @@
 import os
 import numpy as np
-import tensorflow as tf
 import cv2
 import logging
-from src.utils.preprocess import preprocess_face
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from src.utils.preprocess import FacePreprocessor, aligned_empty
+from src.utils.metrics import stage, BATCH_SIZE
+from src.utils.quality import (
+    QUALITY_SIZE, NO_FACE_FEEDBACK, quality_score, quality_feedback, quality_metrics, quality_assessment_batch
+)
+from src.services.gallery_index import normalize_embeddings
+from src.services.batching import MicroBatcher
+from src.services.inference import InferenceExecutor, InferenceBusyError
 
 # ตั้งค่า logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# ปรับการใช้งาน GPU
-physical_devices = tf.config.list_physical_devices('GPU')
-if len(physical_devices) > 0:
-    logger.info(f"พบ GPU {len(physical_devices)} เครื่อง: {physical_devices}")
-    try:
-        # ให้ TensorFlow จองหน่วยความจำตามที่จำเป็น
-        for device in physical_devices:
-            tf.config.experimental.set_memory_growth(device, True)
-        logger.info("ตั้งค่า GPU memory growth สำเร็จ")
-    except Exception as e:
-        logger.error(f"ไม่สามารถตั้งค่า GPU memory growth: {e}")
-else:
-    logger.warning("ไม่พบ GPU - การประมวลผลจะช้ากว่าปกติ")
+_gpus_configured = False
+
+def configure_gpus():
+    """
+    ตรวจหา GPU และเปิด memory growth ครั้งเดียวต่อ process (เรียกตอนสร้าง FaceRecognition ไม่ใช่ตอน import
+    เพื่อไม่ให้การ import โมดูลนี้ต้องรอการตรวจหาอุปกรณ์)
+    """
+    global _gpus_configured
+    if _gpus_configured:
+        return
+    _gpus_configured = True
+    import tensorflow as tf
+    logger.info(f"TensorFlow built with CUDA: {tf.test.is_built_with_cuda()}")
+    physical_devices = tf.config.list_physical_devices('GPU')
+    if len(physical_devices) > 0:
+        logger.info(f"พบ GPU {len(physical_devices)} เครื่อง: {physical_devices}")
+        try:
+            # ให้ TensorFlow จองหน่วยความจำตามที่จำเป็น
+            for device in physical_devices:
+                tf.config.experimental.set_memory_growth(device, True)
+            logger.info("ตั้งค่า GPU memory growth สำเร็จ")
+        except Exception as e:
+            logger.error(f"ไม่สามารถตั้งค่า GPU memory growth: {e}")
+    else:
+        logger.warning("ไม่พบ GPU - การประมวลผลจะช้ากว่าปกติ")
 
 # ปิดการแจ้งเตือน TensorFlow
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
 class FaceRecognition:
-    def __init__(self, model_path, threshold=0.6):
+    def __init__(self, model_path, threshold=0.6, batch_window_ms=0, max_batch_size=32,
+                 preprocess_profile='quality', max_concurrency=1, max_queue=64, queue_timeout=10.0,
+                 intra_op_threads=0, inter_op_threads=0, backend='session', jit_compile=False,
+                 model_replicas=1, use_xnnpack=True):
         """
         เริ่มต้นคลาส FaceRecognition
 
         Args:
             model_path: path ไปยังโมเดล FaceNet
             threshold: ค่าเริ่มต้นสำหรับการเปรียบเทียบใบหน้า (ค่าต่ำ = เข้มงวดมากขึ้น)
+            batch_window_ms: เวลารอรวม get_embeddings จากหลายคำขอเป็น batch เดียว (0 = ปิด)
+            max_batch_size: จำนวนใบหน้าสูงสุดต่อ batch เมื่อเปิด micro-batching
+            preprocess_profile: โปรไฟล์การ preprocess ใบหน้า ('quality' หรือ 'fast')
+            max_concurrency: จำนวนการรัน FaceNet ที่ทำพร้อมกันได้ (micro-batch หนึ่งชุดนับเป็นการรันครั้งเดียว
+                ไม่ว่าจะรวมกี่คำขอ เมื่อเปิด micro-batching จะมี batcher worker เท่ากับจำนวนนี้)
+            max_queue: จำนวนคำขอที่รอคิวได้สูงสุด (ทั้งคิวของ executor และของ micro-batcher)
+                เกินจากนี้จะได้ InferenceBusyError
+            queue_timeout: เวลารอคิวสูงสุด (วินาที) รวมถึงเวลารอผลจาก micro-batcher
+            intra_op_threads: จำนวน thread ภายใน op ของ TensorFlow (0 = ให้ TensorFlow เลือก)
+            inter_op_threads: จำนวน op ที่รันพร้อมกันได้ของ TensorFlow (0 = ให้ TensorFlow เลือก)
+            backend: วิธีรันโมเดล 'session' (frozen graph ผ่าน tf.compat.v1.Session),
+                'function' (แปลง frozen graph เป็น tf.function), 'savedmodel' (model_path เป็นโฟลเดอร์ SavedModel)
+                หรือ 'tflite' (model_path เป็นไฟล์ .tflite แบบ quantize จาก scripts/convert_tflite.py)
+            jit_compile: compile ด้วย XLA (เฉพาะ backend='function')
+            model_replicas: จำนวนสำเนาของโมเดลสำหรับ backend ที่รันพร้อมกันหลาย thread ไม่ได้ (tflite)
+                ใช้แทน max_concurrency สำหรับ backend นี้
+            use_xnnpack: ใช้ XNNPACK delegate กับ backend 'tflite'
         """
+        # import TensorFlow เมื่อสร้างโมเดลเท่านั้น การ import โมดูลนี้จึงไม่ต้องโหลด TensorFlow
+        import tensorflow as tf
+        from src.services.facenet_graph import FACENET_BACKENDS
+        configure_gpus()
         self.model_path = model_path
+        # ใช้เป็นส่วนหนึ่งของกุญแจแคช เพื่อไม่ให้ embeddings จากโมเดลต่างรุ่นปนกัน
+        self.model_version = os.path.splitext(os.path.basename(model_path))[0]
         self.default_threshold = threshold
+        self.preprocessor = FacePreprocessor(preprocess_profile)
         self.graph = tf.Graph()
         self.sess = None
         self.embeddings = None
         self.images_placeholder = None
         self.phase_train_placeholder = None
         self.batch_size_placeholder = None
+        self.model_fn = None
+        self.batcher = None
+        if backend not in FACENET_BACKENDS:
+            raise ValueError(f"backend ต้องเป็นหนึ่งใน {FACENET_BACKENDS} ไม่ใช่ {backend!r}")
+        self.backend = backend
+        self.jit_compile = jit_compile
+        self.model_replicas = model_replicas
+        self.use_xnnpack = use_xnnpack
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.queue_timeout = queue_timeout
         self.load_model()
+        if self.backend == 'tflite':
+            # interpreter ของ TFLite ใช้พร้อมกันหลาย thread ไม่ได้ จึงให้ executor ยืม interpreter ทีละตัวโดยตรง
+            # จำนวนการรันพร้อมกันจึงเท่ากับ model_replicas (ไม่ใช่ max_concurrency)
+            replicas = self.model_fn.replicas
+        else:
+            # tf Session.run และ tf.function ปลอดภัยต่อหลาย thread จึงใช้โมเดลเดียวเป็น replica ซ้ำตามจำนวน max_concurrency
+            model = self.model_fn if self.model_fn is not None else self.sess
+            replicas = [model] * max(1, int(max_concurrency))
+        self.executor = InferenceExecutor(replicas, max_queue=max_queue, queue_timeout=queue_timeout, name='facenet')
+        if batch_window_ms and batch_window_ms > 0:
+            self.enable_batching(batch_window_ms, max_batch_size)
         
     def load_model(self):
         """โหลดโมเดล FaceNet และตั้งค่า TensorFlow session"""
+        if self.backend != 'session':
+            self._load_function()
+            return
+        
+        import tensorflow as tf
         try:
             with self.graph.as_default():
                 with tf.io.gfile.GFile(self.model_path, 'rb') as f:
@@ -57,6 +130,8 @@ class FaceRecognition:
                 # สร้าง TensorFlow session ที่ใช้ GPU ถ้ามี
                 config = tf.compat.v1.ConfigProto()
                 config.gpu_options.allow_growth = True
+                config.intra_op_parallelism_threads = self.intra_op_threads
+                config.inter_op_parallelism_threads = self.inter_op_threads
                 self.sess = tf.compat.v1.Session(graph=self.graph, config=config)
                 
                 # ดึง placeholders จากโมเดล
@@ -65,7 +140,7 @@ class FaceRecognition:
                 self.phase_train_placeholder = self.graph.get_tensor_by_name("phase_train:0")
                 
                 # ทดสอบโมเดลด้วย dummy input เพื่อให้แน่ใจว่าทุกอย่างทำงานได้
-                dummy_input = np.zeros((1, 160, 160, 3))
+                dummy_input = np.zeros((1, 160, 160, 3), dtype=np.float32)
                 feed_dict = {
                     self.images_placeholder: dummy_input,
                     self.phase_train_placeholder: False
@@ -77,6 +152,121 @@ class FaceRecognition:
             logger.error(f"ไม่สามารถโหลดโมเดล FaceNet: {e}")
             raise
     
+    def _load_function(self):
+        """โหลดโมเดล FaceNet เป็น callable ที่รับ numpy array (backend 'function', 'savedmodel' หรือ 'tflite')"""
+        import tensorflow as tf
+        try:
+            # eager runtime ไม่มี ConfigProto ต่อ session จึงตั้งจำนวน thread ที่ระดับ process
+            # (ตั้งได้เฉพาะก่อน TensorFlow เริ่มทำงาน)
+            try:
+                if self.intra_op_threads:
+                    tf.config.threading.set_intra_op_parallelism_threads(self.intra_op_threads)
+                if self.inter_op_threads:
+                    tf.config.threading.set_inter_op_parallelism_threads(self.inter_op_threads)
+            except RuntimeError as e:
+                logger.warning(f"ไม่สามารถตั้งจำนวน thread ของ TensorFlow: {e}")
+            
+            if self.backend == 'tflite':
+                from src.services.facenet_tflite import FaceNetTFLite
+                self.model_fn = FaceNetTFLite(self.model_path, replicas=self.model_replicas,
+                                              num_threads=self.intra_op_threads or None,
+                                              use_xnnpack=self.use_xnnpack, timeout=self.queue_timeout)
+            else:
+                from src.services.facenet_graph import FaceNetFunction
+                self.model_fn = FaceNetFunction(self.model_path, self.backend, self.jit_compile)
+            
+            # ทดสอบโมเดลด้วย dummy input (และ trace/compile function ล่วงหน้า)
+            self.model_fn(np.zeros((1, 160, 160, 3), dtype=np.float32))
+            
+            logger.info(f"โหลดโมเดล FaceNet (backend={self.backend}, xla={self.jit_compile}) สำเร็จและพร้อมใช้งาน")
+        except Exception as e:
+            logger.error(f"ไม่สามารถโหลดโมเดล FaceNet: {e}")
+            raise
+    
+    def enable_batching(self, window_ms=5.0, max_batch_size=32):
+        """
+        เปิด micro-batching ให้ get_embeddings จากหลาย thread ถูกรวมเป็น sess.run ครั้งเดียว
+        
+        Args:
+            window_ms: เวลารอรวบรวมคำขอสูงสุด (มิลลิวินาที)
+            max_batch_size: จำนวนใบหน้าสูงสุดต่อ batch
+        """
+        if self.batcher is not None:
+            self.batcher.close()
+        # worker หนึ่งตัวต่อ replica ของ executor เพื่อให้ batch หลายชุดรันพร้อมกันได้ตาม max_concurrency
+        # คิวของ batcher นับเป็นใบหน้า จึงให้รับได้อย่างน้อยหนึ่ง batch เต็มแม้ max_queue จะน้อยกว่า
+        self.batcher = MicroBatcher(self._run_embeddings_locked, max_batch_size=max_batch_size,
+                                    window_ms=window_ms, name='facenet-batcher',
+                                    max_queue=max(self.executor.max_queue, max_batch_size),
+                                    workers=self.executor.size)
+        logger.info(f"เปิด micro-batching: window={window_ms}ms, max_batch_size={max_batch_size}, "
+                    f"workers={self.executor.size}")
+    
+    def _run_embeddings(self, processed_imgs, model=None):
+        """
+        รัน FaceNet กับภาพที่ preprocess แล้วทั้ง batch และ normalize ผลลัพธ์
+        
+        Args:
+            processed_imgs: numpy array (N, 160, 160, 3) แบบ float32
+            model: replica ที่ยืมจาก executor (None = ใช้โมเดลหลัก)
+            
+        Returns:
+            embeddings: numpy array (N, 512) ที่ normalize แล้ว
+        """
+        BATCH_SIZE.observe(len(processed_imgs), 'facenet')
+        if model is None:
+            model = self.model_fn if self.model_fn is not None else self.sess
+        if model is not self.sess:
+            embeddings = model(processed_imgs)
+        else:
+            feed_dict = {
+                self.images_placeholder: processed_imgs,
+                self.phase_train_placeholder: False
+            }
+            embeddings = self.sess.run(self.embeddings, feed_dict=feed_dict)
+        
+        # Normalize embeddings เพื่อให้ค่าที่ได้มีความแม่นยำมากขึ้น
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    
+    def _run_embeddings_locked(self, processed_imgs):
+        """รัน _run_embeddings โดยยืม replica จาก executor หนึ่งครั้งต่อทั้ง batch (ใช้กับ micro-batching)"""
+        with self.executor.acquire() as model:
+            return self._run_embeddings(processed_imgs, model)
+    
+    def embed_preprocessed(self, processed_imgs):
+        """
+        สร้าง embeddings จากภาพที่ preprocess แล้ว (เช่นผลของ preprocessor.preprocess_batch)
+        
+        ใช้เมื่อต้องป้อนภาพชุดเดียวกันให้หลายโมเดล (เช่นเทียบโมเดล quantize กับต้นฉบับ) โดยไม่ preprocess ซ้ำ
+        
+        Args:
+            processed_imgs: numpy array (N, 160, 160, 3) แบบ float32
+            
+        Returns:
+            embeddings: numpy array (N, 512) ที่ normalize แล้ว
+            
+        Raises:
+            InferenceBusyError: ถ้าคิวของ executor เต็มหรือรอเกิน queue_timeout
+        """
+        with stage('facenet'):
+            return self._run_embeddings_locked(processed_imgs)
+    
+    def _run_embedding_batched(self, processed_img):
+        """
+        ส่งภาพที่ preprocess แล้วหนึ่งภาพเข้า micro-batcher และรอผลไม่เกิน queue_timeout ของ executor
+        
+        Raises:
+            InferenceBusyError: ถ้าคิวของ batcher เต็มหรือรอผลเกิน queue_timeout
+        """
+        future = self.batcher.submit(processed_img)
+        try:
+            return future.result(timeout=self.executor.queue_timeout)
+        except FutureTimeoutError:
+            # ยกเลิกคำขอที่ยังไม่ถูกรวมเข้า batch เพื่อไม่ให้เสียเวลารันโมเดลให้คำขอที่ไม่มีผู้รอแล้ว
+            future.cancel()
+            logger.warning(f"facenet-batcher: รอผลเกิน {self.executor.queue_timeout}s")
+            raise InferenceBusyError('facenet', self.batcher.retry_after())
+    
     def get_embeddings(self, face_img, image_size=(160, 160)):
         """
         สร้าง face embeddings จากรูปภาพใบหน้า
@@ -95,23 +285,22 @@ class FaceRecognition:
                 return None
             
             # Preprocess ใบหน้า
-            processed_img = preprocess_face(face_img, image_size)
+            with stage('preprocess'):
+                processed_img = self.preprocessor.preprocess(face_img, required_size=image_size)
             if processed_img is None:
                 logger.warning("การ preprocess ใบหน้าล้มเหลว")
                 return None
             
-            # คำนวณ embeddings
-            feed_dict = {
-                self.images_placeholder: [processed_img],
-                self.phase_train_placeholder: False
-            }
-            embedding = self.sess.run(self.embeddings, feed_dict=feed_dict)[0]
-            
-            # Normalize embedding เพื่อให้ค่าที่ได้มีความแม่นยำมากขึ้น
-            embedding = embedding / np.linalg.norm(embedding)
-            
-            return embedding
+            # คำนวณ embeddings (ถ้าเปิด micro-batching จะถูกรวมกับคำขออื่นที่เข้ามาพร้อมกัน
+            # และ batcher ยืม replica ครั้งเดียวต่อทั้ง batch)
+            with stage('facenet'):
+                if self.batcher is not None:
+                    return self._run_embedding_batched(processed_img)
+                
+                return self._run_embeddings_locked(processed_img[np.newaxis])[0]
             
+        except InferenceBusyError:
+            raise
         except Exception as e:
             logger.error(f"เกิดข้อผิดพลาดในการสร้าง embedding: {e}")
             return None
@@ -133,35 +322,67 @@ class FaceRecognition:
                 logger.warning("ไม่สามารถสร้าง embeddings เนื่องจากไม่มีข้อมูลใบหน้า")
                 return None
             
-            # Preprocess ใบหน้าทั้งหมด
-            processed_imgs = []
-            for face_img in face_imgs:
-                if face_img is not None:
-                    processed_img = preprocess_face(face_img, image_size)
-                    if processed_img is not None:
-                        processed_imgs.append(processed_img)
+            # Preprocess ใบหน้าทั้งหมดลงใน batch tensor เดียว
+            with stage('preprocess'):
+                processed_imgs, _ = self.preprocessor.preprocess_batch(face_imgs, required_size=image_size)
             
-            if not processed_imgs:
+            if len(processed_imgs) == 0:
                 logger.warning("ไม่มีใบหน้าที่สามารถ preprocess ได้")
                 return None
             
             # คำนวณ embeddings
-            feed_dict = {
-                self.images_placeholder: processed_imgs,
-                self.phase_train_placeholder: False
-            }
-            embeddings = self.sess.run(self.embeddings, feed_dict=feed_dict)
-            
-            # Normalize embeddings
-            for i in range(len(embeddings)):
-                embeddings[i] = embeddings[i] / np.linalg.norm(embeddings[i])
-            
-            return embeddings
+            with stage('facenet'):
+                return self._run_embeddings_locked(processed_imgs)
             
+        except InferenceBusyError:
+            raise
         except Exception as e:
             logger.error(f"เกิดข้อผิดพลาดในการสร้าง embeddings แบบ batch: {e}")
             return None
     
+    def get_embeddings_aligned(self, faces, image_size=(160, 160)):
+        """
+        สร้าง face embeddings จากภาพต้นฉบับโดยจัดแนวด้วย 5 landmarks (similarity transform)
+        
+        ใบหน้าจากภาพเดียวกันที่อยู่ติดกันในรายการจะถูก warp ลงใน batch tensor เดียวกันโดยตรง
+        ไม่ต้องตัด crop แยก
+        
+        Args:
+            faces: รายการ (ภาพต้นฉบับ, keypoints) ของแต่ละใบหน้า
+            image_size: ขนาดภาพที่ต้องการ (default: 160x160)
+            
+        Returns:
+            embeddings: รายการ embedding ตามลำดับของ faces (None สำหรับใบหน้าที่จัดแนวไม่ได้)
+        """
+        width, height = image_size
+        processed_imgs = aligned_empty((len(faces), height, width, 3))
+        rows = []
+        start = 0
+        with stage('align'):
+            while start < len(faces):
+                image = faces[start][0]
+                end = start
+                while end < len(faces) and faces[end][0] is image:
+                    end += 1
+                _, valid = self.preprocessor.preprocess_aligned(
+                    image, [landmarks for _, landmarks in faces[start:end]],
+                    out=processed_imgs[len(rows):len(rows) + end - start], required_size=image_size)
+                rows.extend(start + j for j in valid)
+                start = end
+        
+        embeddings = [None] * len(faces)
+        if not rows:
+            return embeddings
+        
+        with stage('facenet'):
+            if len(rows) == 1 and self.batcher is not None:
+                computed = [self._run_embedding_batched(processed_imgs[0])]
+            else:
+                computed = self._run_embeddings_locked(processed_imgs[:len(rows)])
+        for i, embedding in zip(rows, computed):
+            embeddings[i] = embedding
+        return embeddings
+    
     def compare_faces(self, embedding1, embedding2, threshold=None):
         """
         เปรียบเทียบ embeddings สองชุดว่าเป็นคนเดียวกันหรือไม่
@@ -183,17 +404,23 @@ class FaceRecognition:
         if threshold is None:
             threshold = self.default_threshold
         
+        # คำนวณเป็น float32 ทั้งหมด (ชนิดเดียวกับ output ของ FaceNet) ไม่แปลงเป็น float64
+        embedding1 = np.asarray(embedding1, dtype=np.float32).reshape(-1)
+        embedding2 = np.asarray(embedding2, dtype=np.float32).reshape(-1)
+        
         # ทำให้ embeddings เป็น normalized vector (มีขนาด 1)
         # นี่จะช่วยให้การเปรียบเทียบมีความแม่นยำมากขึ้น
-        if np.linalg.norm(embedding1) > 0:
-            embedding1 = embedding1 / np.linalg.norm(embedding1)
-        if np.linalg.norm(embedding2) > 0:
-            embedding2 = embedding2 / np.linalg.norm(embedding2)
+        norm1 = np.linalg.norm(embedding1)
+        norm2 = np.linalg.norm(embedding2)
+        if norm1 > 0:
+            embedding1 = embedding1 / norm1
+        if norm2 > 0:
+            embedding2 = embedding2 / norm2
         
         # คำนวณ cosine similarity (ค่ายิ่งสูงยิ่งเหมือนกัน)
         similarity = np.dot(embedding1, embedding2)
         # คำนวณ distance (1 - similarity) เพื่อให้ค่าต่ำ = เหมือนกัน
-        distance = 1.0 - similarity
+        distance = np.float32(1.0) - similarity
         
         # ตัดสินใจว่าเป็นคนเดียวกันหรือไม่
         is_same_person = distance < threshold
@@ -206,26 +433,132 @@ class FaceRecognition:
         
         Args:
             embedding: embedding ที่ต้องการเปรียบเทียบ
-            embeddings_list: รายการ embeddings ที่ต้องการค้นหา
+            embeddings_list: รายการ embeddings ที่ต้องการค้นหา (รายการที่เป็น None จะถูกข้าม)
             threshold: ค่าขีดแบ่งสำหรับการตัดสินใจ
             
         Returns:
-            best_match_idx: ดัชนีของ embedding ที่ตรงมากที่สุด (-1 ถ้าไม่พบ)
+            best_match_idx: ดัชนีใน embeddings_list ของ embedding ที่ตรงมากที่สุด (-1 ถ้าไม่พบ)
             best_match_distance: ระยะห่างของ embedding ที่ตรงมากที่สุด
         """
-        if embedding is None or not embeddings_list:
+        if embedding is None or embeddings_list is None:
+            return -1, 1.0
+        
+        # ข้าม embedding ที่เป็น None เหมือนการวนเปรียบเทียบแบบเดิม โดยเก็บดัชนีเดิมไว้ให้ตรงกับรายการของผู้เรียก
+        valid = [i for i, candidate in enumerate(embeddings_list) if candidate is not None]
+        if not valid:
             return -1, 1.0
         
-        best_match_idx = -1
-        best_match_distance = 1.0
+        # คูณเมทริกซ์ครั้งเดียวโดยตรง ไม่สร้างดัชนีชั่วคราว
+        with stage('search'):
+            query = normalize_embeddings(np.asarray(embedding).reshape(-1))
+            candidates = np.stack([np.asarray(embeddings_list[i]).reshape(-1) for i in valid])
+            distances = 1.0 - normalize_embeddings(candidates) @ query
+            best = int(np.argmin(distances))
+        best_match_distance = float(distances[best])
+        if best_match_distance >= self._match_threshold(threshold):
+            return -1, 1.0
+        
+        return valid[best], best_match_distance
+    
+    def find_best_match_in_index(self, embedding, index, threshold=None):
+        """
+        ค้นหาผู้ที่ตรงกับ embedding มากที่สุดในดัชนีที่สร้างไว้แล้ว (GalleryIndex / IVFIndex)
+        
+        ค้นหาซ้ำกับ gallery เดิมควรใช้เมธอดนี้แทน find_best_match เพื่อไม่ต้อง normalize gallery ใหม่ทุกครั้ง
+        
+        Args:
+            embedding: embedding ที่ต้องการเปรียบเทียบ
+            index: ดัชนีที่มีเมธอด search(embedding, k, threshold)
+            threshold: ค่าขีดแบ่งสำหรับการตัดสินใจ
+            
+        Returns:
+            user_id: user id ของผู้ที่ตรงที่สุด (-1 ถ้าไม่พบ)
+            distance: ระยะห่างของผู้ที่ตรงที่สุด
+        """
+        if embedding is None or index is None or len(index) == 0:
+            return -1, 1.0
+        
+        with stage('search'):
+            matches = index.search(embedding, k=1, threshold=self._match_threshold(threshold))
+        return matches[0] if matches else (-1, 1.0)
+    
+    def _match_threshold(self, threshold):
+        """threshold ที่ระบุหรือค่าเริ่มต้น ผลที่ได้ต้องใกล้กว่า 1.0 ด้วยเสมอ (เหมือนการวนเปรียบเทียบแบบเดิมที่เริ่มจากระยะ 1.0)"""
+        if threshold is None:
+            threshold = self.default_threshold
+        return min(threshold, 1.0)
+    
+    def distance_matrix(self, embeddings1, embeddings2=None, block_size=4096):
+        """
+        คำนวณ cosine distance ของทุกคู่ระหว่าง embeddings สองชุด
+        
+        ใช้การคูณเมทริกซ์ float32 ทีละ block ของแถว เขียนลงเมทริกซ์ผลลัพธ์โดยตรง
+        
+        Args:
+            embeddings1: เมทริกซ์ embeddings (N, D)
+            embeddings2: เมทริกซ์ embeddings (M, D) (ถ้าไม่ระบุ จะเทียบ embeddings1 กับตัวเอง)
+            block_size: จำนวนแถวของ embeddings1 ต่อการคูณเมทริกซ์หนึ่งครั้ง
+            
+        Returns:
+            distances: เมทริกซ์ float32 (N, M) โดย distances[i, j] = 1 - cos(embeddings1[i], embeddings2[j])
+        """
+        left = normalize_embeddings(np.asarray(embeddings1).reshape(len(embeddings1), -1))
+        right = left if embeddings2 is None else normalize_embeddings(np.asarray(embeddings2).reshape(len(embeddings2), -1))
         
-        for i, emb in enumerate(embeddings_list):
-            is_same, distance = self.compare_faces(embedding, emb, threshold)
-            if is_same and distance < best_match_distance:
-                best_match_idx = i
-                best_match_distance = distance
+        distances = np.empty((len(left), len(right)), dtype=np.float32)
+        for start in range(0, len(left), block_size):
+            block = distances[start:start + block_size]
+            np.matmul(left[start:start + block_size], right.T, out=block)
+            np.subtract(1.0, block, out=block)
+        return distances
+    
+    def matching_pairs(self, embeddings1, embeddings2=None, threshold=None, block_size=1024, max_pairs=None):
+        """
+        หาคู่ที่ cosine distance ต่ำกว่า threshold โดยไม่สร้างเมทริกซ์ระยะห่างทั้งหมด
         
-        return best_match_idx, best_match_distance
+        หน่วยความจำชั่วคราวจำกัดอยู่ที่ block_size x M ค่า ใช้กับงานหาคนในรูปจำนวนมาก
+        หรือหาใบหน้าซ้ำ (ไม่ระบุ embeddings2 = เทียบกับตัวเอง คืนเฉพาะคู่ i < j)
+        
+        Args:
+            embeddings1: เมทริกซ์ embeddings (N, D)
+            embeddings2: เมทริกซ์ embeddings (M, D) หรือ None
+            threshold: ค่าขีดแบ่ง (ถ้าไม่ระบุจะใช้ค่าเริ่มต้น)
+            block_size: จำนวนแถวของ embeddings1 ต่อการคูณเมทริกซ์หนึ่งครั้ง
+            max_pairs: จำนวนคู่สูงสุดที่คืน (คู่ที่ใกล้ที่สุดก่อน)
+            
+        Returns:
+            rows, cols, distances: numpy arrays ของคู่ที่ผ่าน threshold เรียงจากใกล้ที่สุด
+        """
+        if threshold is None:
+            threshold = self.default_threshold
+        
+        left = normalize_embeddings(np.asarray(embeddings1).reshape(len(embeddings1), -1))
+        right = left if embeddings2 is None else normalize_embeddings(np.asarray(embeddings2).reshape(len(embeddings2), -1))
+        
+        rows, cols, distances = [], [], []
+        buffer = np.empty(min(block_size, len(left)) * len(right), dtype=np.float32)
+        for start in range(0, len(left), block_size):
+            n = min(block_size, len(left) - start)
+            # เทียบกับตัวเอง: คำนวณเฉพาะคอลัมน์ j >= start (สามเหลี่ยมบน) ใช้งานคำนวณครึ่งเดียว
+            col_start = start if embeddings2 is None else 0
+            out = buffer[:n * (len(right) - col_start)].reshape(n, len(right) - col_start)
+            np.matmul(left[start:start + n], right[col_start:].T, out=out)
+            np.subtract(1.0, out, out=out)
+            if embeddings2 is None:
+                # ตัดคู่ที่ j <= i ภายใน block
+                out[np.arange(n)[:, None] >= np.arange(out.shape[1])[None, :]] = np.inf
+            block_rows, block_cols = np.nonzero(out < threshold)
+            rows.append(block_rows + start)
+            cols.append(block_cols + col_start)
+            distances.append(out[block_rows, block_cols])
+        
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+        distances = np.concatenate(distances) if distances else np.zeros(0, dtype=np.float32)
+        order = np.argsort(distances, kind='stable')
+        if max_pairs is not None:
+            order = order[:max_pairs]
+        return rows[order], cols[order], distances[order]
         
     def quality_assessment(self, face_img):
         """
@@ -239,52 +572,32 @@ class FaceRecognition:
             feedback: คำแนะนำในการปรับปรุงคุณภาพ
         """
         if face_img is None:
-            return 0, "ไม่พบใบหน้าในภาพ"
-        
-        feedback = []
-        quality_scores = {}
-        
-        # ตรวจสอบความสว่างของภาพ
-        brightness = np.mean(face_img)
-        quality_scores['brightness'] = min(100, max(0, 100 * (brightness / 128.0)))
-        if brightness < 50:
-            feedback.append("ภาพมืดเกินไป เพิ่มแสงสว่าง")
-        elif brightness > 200:
-            feedback.append("ภาพสว่างเกินไป ลดแสงลง")
-        
-        # ตรวจสอบความคมชัด
-        if len(face_img.shape) > 2:
-            gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = face_img
-            
-        laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-        sharpness = np.var(laplacian)
-        quality_scores['sharpness'] = min(100, max(0, 100 * (sharpness / 500.0)))
-        if sharpness < 100:
-            feedback.append("ภาพไม่คมชัด อาจเป็นเพราะกล้องเคลื่อนไหวหรือโฟกัสไม่ดี")
-        
-        # ตรวจสอบคอนทราสต์
-        if len(face_img.shape) > 2:
-            gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = face_img
-            
-        contrast = gray.std()
-        quality_scores['contrast'] = min(100, max(0, 100 * (contrast / 80.0)))
-        if contrast < 20:
-            feedback.append("ภาพมีคอนทราสต์ต่ำ อาจทำให้ยากต่อการจดจำ")
+            return 0, NO_FACE_FEEDBACK
         
-        # คำนวณคะแนนเฉลี่ย
-        avg_quality = sum(quality_scores.values()) / len(quality_scores)
+        brightness, sharpness, contrast = quality_metrics(face_img)
+        return float(quality_score(brightness, sharpness, contrast)), quality_feedback(brightness, sharpness, contrast)
+    
+    def quality_assessment_batch(self, face_imgs, with_feedback=True, size=QUALITY_SIZE):
+        """
+        ประเมินคุณภาพของภาพใบหน้าหลายใบพร้อมกัน
         
-        # ถ้าไม่มีปัญหา
-        if not feedback:
-            feedback.append("คุณภาพภาพดี เหมาะสำหรับการจดจำใบหน้า")
+        ย่อ/ขยาย crop ทุกใบเป็นขนาดเดียวกัน แล้วคำนวณความสว่าง ความคมชัด และคอนทราสต์
+        ของทั้ง batch แบบ vectorized (float32) คะแนนจึงต่างจาก quality_assessment เล็กน้อย
         
-        return avg_quality, ", ".join(feedback)
+        Args:
+            face_imgs: รายการภาพใบหน้าที่ตัดมาแล้ว (รายการที่เป็น None ได้คะแนน 0)
+            with_feedback: สร้างคำแนะนำด้วยหรือไม่ (False = คืนเฉพาะคะแนน)
+            size: ขนาดมาตรฐานที่ใช้คำนวณ
+            
+        Returns:
+            scores: numpy array (N,) ของคะแนนคุณภาพ 0-100
+            feedback: รายการคำแนะนำของแต่ละใบ หรือ None ถ้า with_feedback=False
+        """
+        return quality_assessment_batch(face_imgs, with_feedback, size)
         
     def __del__(self):
         """ทำความสะอาดทรัพยากร"""
+        if getattr(self, 'batcher', None) is not None:
+            self.batcher.close()
         if self.sess:
             self.sess.close()
\ No newline at end of file
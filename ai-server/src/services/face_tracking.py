@@ -0,0 +1,296 @@
+import logging
+import itertools
+import cv2
+import numpy as np
+from src.services.face_detection import detect_faces
+from src.utils.preprocess import extract_face
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# จำนวนจุดสูงสุดที่ติดตามด้วย optical flow ต่อใบหน้า และจำนวนขั้นต่ำที่ยังเชื่อถือการเลื่อนกรอบได้
+MAX_TRACK_POINTS = 30
+MIN_TRACK_POINTS = 5
+
+_LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                  criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+def box_iou(a, b):
+    """IoU ของกรอบสองกรอบในรูปแบบ [x, y, width, height]"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+class FaceTrack:
+    """ใบหน้าหนึ่งที่ถูกติดตามข้ามเฟรม พร้อม embedding ที่ดีที่สุดและตัวตนล่าสุด"""
+
+    def __init__(self, track_id, face, frame_index):
+        self.track_id = track_id
+        self.box = list(face['box'])
+        self.keypoints = dict(face['keypoints'])
+        self.confidence = float(face['confidence'])
+        self.first_frame = frame_index
+        self.last_detected = frame_index
+        self.missed = 0
+        self.points = None
+        self.quality = None
+        self.embedding = None
+        self.user_id = None
+        self.distance = None
+
+    def update(self, face, frame_index):
+        self.box = list(face['box'])
+        self.keypoints = dict(face['keypoints'])
+        self.confidence = float(face['confidence'])
+        self.last_detected = frame_index
+        self.missed = 0
+
+    def shift(self, dx, dy, scale):
+        """เลื่อนและย่อ/ขยายกรอบและ landmarks ตามการเคลื่อนที่ที่วัดจาก optical flow"""
+        x, y, w, h = self.box
+        cx, cy = x + w / 2.0 + dx, y + h / 2.0 + dy
+        w, h = w * scale, h * scale
+        self.box = [int(round(cx - w / 2)), int(round(cy - h / 2)), int(round(w)), int(round(h))]
+        self.keypoints = {name: (int(round(cx + (px + dx - cx) * scale)), int(round(cy + (py + dy - cy) * scale)))
+                          for name, (px, py) in self.keypoints.items()}
+
+    def to_json(self):
+        return {
+            'track_id': self.track_id,
+            'box': self.box,
+            'confidence': self.confidence,
+            'landmarks': self.keypoints,
+            'user_id': self.user_id,
+            'distance': self.distance,
+            'quality': self.quality,
+        }
+
+
+class FaceStreamTracker:
+    """
+    จดจำใบหน้าจากลำดับเฟรมวิดีโอ / เว็บแคม โดยไม่ทำงานซ้ำทุกเฟรม
+
+    - ตรวจจับใบหน้า (MTCNN) ทุก detect_every เฟรม เฟรมระหว่างนั้นเลื่อนกรอบด้วย
+      Lucas-Kanade optical flow ซึ่งถูกกว่าการตรวจจับหลายเท่า
+    - จับคู่ใบหน้าที่ตรวจพบกับ track เดิมด้วย IoU ใบหน้าที่ไม่ตรงกับ track ใดเริ่ม track ใหม่
+    - สร้าง embedding (FaceNet) เฉพาะ track ใหม่ หรือเมื่อคุณภาพของใบหน้าดีขึ้นอย่างน้อย quality_margin
+      แล้วค้นหาตัวตนใน gallery และส่ง event เมื่อตัวตนของ track เปลี่ยน
+    """
+
+    def __init__(self, face_recognition, gallery=None, detect_every=5, threshold=None, iou_threshold=0.3,
+                 max_missed=2, quality_margin=5.0, detector=None, margin=20):
+        """
+        Args:
+            face_recognition: FaceRecognition ที่ใช้สร้าง embeddings และประเมินคุณภาพ
+            gallery: ดัชนีที่มี search_batch (EmbeddingStore / GalleryIndex) หรือ None ถ้าไม่ต้องระบุตัวตน
+            detect_every: ตรวจจับใบหน้าทุกกี่เฟรม (1 = ทุกเฟรม)
+            threshold: ระยะห่างสูงสุดที่ถือว่าเป็นคนเดียวกัน (ค่าเริ่มต้นจาก face_recognition)
+            iou_threshold: IoU ขั้นต่ำในการจับคู่ใบหน้าที่ตรวจพบกับ track เดิม
+            max_missed: จำนวนรอบการตรวจจับที่ไม่พบใบหน้าติดกันก่อนจบ track
+            quality_margin: คะแนนคุณภาพ (0-100) ที่ต้องดีขึ้นก่อนสร้าง embedding ใหม่
+            detector: backend ของการตรวจจับใบหน้า (None = ค่าเริ่มต้นของเซิร์ฟเวอร์)
+            margin: ระยะขอบเมื่อตัดใบหน้า
+        """
+        self.face_recognition = face_recognition
+        self.gallery = gallery
+        self.detect_every = max(1, int(detect_every))
+        self.threshold = face_recognition.default_threshold if threshold is None else threshold
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.quality_margin = quality_margin
+        self.detector = detector
+        self.margin = margin
+
+        self.tracks = {}
+        self.frame_index = -1
+        self.previous_gray = None
+        self._track_ids = itertools.count(1)
+        self.counters = {'frames': 0, 'detections': 0, 'embeddings': 0}
+
+    def process(self, frame, timestamp=None):
+        """
+        ประมวลผลเฟรมถัดไป
+
+        Args:
+            frame: รูปภาพ (numpy array)
+            timestamp: เวลาของเฟรม (ส่งต่อไปในผลลัพธ์)
+
+        Returns:
+            result: dict ที่มี frame, timestamp, detected (เฟรมนี้รันการตรวจจับหรือไม่),
+                embedded (จำนวน embeddings ที่สร้าง), tracks และ events
+        """
+        self.frame_index += 1
+        self.counters['frames'] += 1
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        events = []
+        embedded = 0
+
+        detected = self.frame_index % self.detect_every == 0 or self.previous_gray is None
+        if detected:
+            self.counters['detections'] += 1
+            events.extend(self._match(detect_faces(frame, backend=self.detector)))
+            embedded, identity_events = self._refresh_identities(frame)
+            events.extend(identity_events)
+            for track in self.tracks.values():
+                track.points = self._seed_points(gray, track.box)
+        else:
+            self._follow(gray)
+
+        self.previous_gray = gray
+        return {
+            'frame': self.frame_index,
+            'timestamp': timestamp,
+            'detected': detected,
+            'embedded': embedded,
+            'tracks': [track.to_json() for track in self.tracks.values()],
+            'events': events,
+        }
+
+    def finish(self):
+        """จบทุก track ที่ยังเปิดอยู่ (เมื่อสตรีมสิ้นสุด) และคืน event track_ended"""
+        events = [self._ended(track) for track in self.tracks.values()]
+        self.tracks = {}
+        return events
+
+    def stream(self, frames):
+        """
+        generator ที่รับลำดับเฟรม (รูปภาพ หรือ (รูปภาพ, timestamp)) แล้วส่งผลลัพธ์ของ process() ทีละเฟรม
+        และส่ง {'events': [...track_ended...]} เมื่อเฟรมหมด
+        """
+        for item in frames:
+            frame, timestamp = item if isinstance(item, tuple) else (item, None)
+            yield self.process(frame, timestamp)
+        yield {'frame': self.frame_index, 'events': self.finish(), 'summary': dict(self.counters)}
+
+    def _ended(self, track):
+        return {
+            'event': 'track_ended',
+            'track_id': track.track_id,
+            'frame': self.frame_index,
+            'user_id': track.user_id,
+            'frames': self.frame_index - track.first_frame + 1,
+        }
+
+    def _match(self, faces):
+        """จับคู่ใบหน้าที่ตรวจพบกับ track เดิมแบบ greedy ตาม IoU สูงสุด และเริ่ม / จบ track"""
+        events = []
+        pairs = sorted(((box_iou(track.box, face['box']), track_id, i)
+                        for track_id, track in self.tracks.items() for i, face in enumerate(faces)), reverse=True)
+        matched_tracks, matched_faces = set(), set()
+        for iou, track_id, i in pairs:
+            if iou < self.iou_threshold:
+                break
+            if track_id in matched_tracks or i in matched_faces:
+                continue
+            self.tracks[track_id].update(faces[i], self.frame_index)
+            matched_tracks.add(track_id)
+            matched_faces.add(i)
+
+        for track_id in list(self.tracks):
+            if track_id in matched_tracks:
+                continue
+            track = self.tracks[track_id]
+            track.missed += 1
+            if track.missed > self.max_missed:
+                events.append(self._ended(track))
+                del self.tracks[track_id]
+
+        for i, face in enumerate(faces):
+            if i in matched_faces:
+                continue
+            track = FaceTrack(next(self._track_ids), face, self.frame_index)
+            self.tracks[track.track_id] = track
+            events.append({'event': 'track_started', 'track_id': track.track_id,
+                           'frame': self.frame_index, 'box': track.box})
+        return events
+
+    def _refresh_identities(self, frame):
+        """
+        สร้าง embeddings ของ track ที่เพิ่งตรวจพบ เฉพาะที่เป็น track ใหม่หรือคุณภาพดีขึ้น
+        แล้วค้นหาตัวตนใน gallery ครั้งเดียวสำหรับทุกใบหน้า
+        """
+        seen = [track for track in self.tracks.values() if track.last_detected == self.frame_index]
+        crops = [extract_face(frame, track.box, self.margin) for track in seen]
+        if not seen:
+            return 0, []
+        scores, _ = self.face_recognition.quality_assessment_batch(crops, with_feedback=False)
+
+        pending = [(track, crop, float(score)) for track, crop, score in zip(seen, crops, scores)
+                   if crop is not None and (track.embedding is None or score >= track.quality + self.quality_margin)]
+        if not pending:
+            return 0, []
+
+        if len(pending) == 1:
+            embeddings = [self.face_recognition.get_embeddings(pending[0][1])]
+        else:
+            embeddings = self.face_recognition.get_embeddings_batch([crop for _, crop, _ in pending])
+            # get_embeddings_batch ข้ามใบหน้าที่ preprocess ไม่ได้ ถ้าจำนวนไม่ตรงให้คำนวณทีละใบแทน
+            if embeddings is None or len(embeddings) != len(pending):
+                embeddings = [self.face_recognition.get_embeddings(crop) for _, crop, _ in pending]
+
+        updated = []
+        for (track, _, score), embedding in zip(pending, embeddings):
+            if embedding is None:
+                continue
+            track.embedding = embedding
+            track.quality = score
+            updated.append(track)
+        self.counters['embeddings'] += len(updated)
+        if not updated or self.gallery is None:
+            return len(updated), []
+
+        events = []
+        matches = self.gallery.search_batch([track.embedding for track in updated], k=1)
+        for track, candidates in zip(updated, matches):
+            user_id, distance = candidates[0] if candidates else (None, None)
+            if distance is not None and distance >= self.threshold:
+                user_id = None
+            changed = user_id != track.user_id or track.distance is None
+            track.user_id = user_id
+            track.distance = distance
+            if changed:
+                events.append({
+                    'event': 'identity',
+                    'track_id': track.track_id,
+                    'frame': self.frame_index,
+                    'user_id': user_id,
+                    'distance': distance,
+                    'confidence': 1.0 - distance if distance is not None else None,
+                    'quality': track.quality,
+                })
+        return len(updated), events
+
+    def _seed_points(self, gray, box):
+        """เลือกจุดมุม (good features) ภายในกรอบใบหน้าสำหรับติดตามด้วย optical flow"""
+        x, y, w, h = box
+        mask = np.zeros_like(gray)
+        mask[max(0, y):max(0, y + h), max(0, x):max(0, x + w)] = 255
+        return cv2.goodFeaturesToTrack(gray, MAX_TRACK_POINTS, 0.01, max(3, min(w, h) // 10), mask=mask)
+
+    def _follow(self, gray):
+        """เลื่อนทุก track ตาม optical flow ระหว่างเฟรมก่อนหน้ากับเฟรมนี้"""
+        for track in self.tracks.values():
+            if track.points is None or len(track.points) < MIN_TRACK_POINTS:
+                continue
+            points, status, _ = cv2.calcOpticalFlowPyrLK(self.previous_gray, gray, track.points, None, **_LK_PARAMS)
+            good = status.reshape(-1) == 1
+            if good.sum() < MIN_TRACK_POINTS:
+                # ติดตามไม่ได้ (เช่นหันหน้าเร็ว) คงกรอบเดิมไว้จนกว่าจะตรวจจับรอบถัดไป
+                track.points = None
+                continue
+            old, new = track.points[good].reshape(-1, 2), points[good].reshape(-1, 2)
+            dx, dy = np.median(new - old, axis=0)
+            # อัตราส่วนการกระจายของจุดรอบจุดศูนย์กลาง ใช้ประมาณการย่อ/ขยายของใบหน้า
+            old_spread = np.median(np.linalg.norm(old - np.median(old, axis=0), axis=1))
+            new_spread = np.median(np.linalg.norm(new - np.median(new, axis=0), axis=1))
+            scale = float(np.clip(new_spread / old_spread, 0.8, 1.25)) if old_spread > 0 else 1.0
+            track.shift(float(dx), float(dy), scale)
+            track.points = new.reshape(-1, 1, 2)
@@ -0,0 +1,138 @@
+import logging
+import numpy as np
+import tensorflow as tf
+from src.utils.preprocess import aligned_empty, TENSOR_ALIGNMENT
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# รูปแบบ input ของ FaceNet (20180402-114759): batch ของภาพ 160x160 RGB ที่ normalize แล้ว
+INPUT_SIGNATURE = [tf.TensorSpec([None, 160, 160, 3], tf.float32, name='input')]
+
+# วิธีโหลดโมเดล FaceNet ที่รองรับ
+FACENET_BACKENDS = ('session', 'function', 'savedmodel', 'tflite')
+
+
+def load_graph_def(model_path):
+    """อ่าน frozen graph (.pb) ของ FaceNet"""
+    graph_def = tf.compat.v1.GraphDef()
+    with tf.io.gfile.GFile(model_path, 'rb') as f:
+        graph_def.ParseFromString(f.read())
+    return graph_def
+
+
+def frozen_graph_function(graph_def, jit_compile=False):
+    """
+    แปลง frozen graph ของ FaceNet เป็น tf.function ที่มี input signature คงที่
+
+    phase_train ถูกแทนด้วยค่าคงที่ False ตอน import graph (inference เสมอ) จึงเหลือ input เดียว
+    คือ input:0 [None, 160, 160, 3] float32 และ output คือ embeddings:0
+
+    Args:
+        graph_def: GraphDef จาก load_graph_def
+        jit_compile: compile ด้วย XLA (รวม op ทั้ง graph เป็น kernel เดียว ใช้ได้ทั้ง CPU และ GPU)
+
+    Returns:
+        function: tf.function ที่รับ tensor (N, 160, 160, 3) และคืน embeddings (N, 512)
+    """
+    def _import():
+        tf.compat.v1.import_graph_def(graph_def, name='', input_map={'phase_train:0': tf.constant(False)})
+
+    wrapped = tf.compat.v1.wrap_function(_import, [])
+    pruned = wrapped.prune(wrapped.graph.get_tensor_by_name('input:0'),
+                           wrapped.graph.get_tensor_by_name('embeddings:0'))
+
+    @tf.function(input_signature=INPUT_SIGNATURE, jit_compile=jit_compile)
+    def embed(images):
+        return pruned(images)
+
+    return embed
+
+
+class FaceNetModule(tf.Module):
+    """tf.Module ที่ห่อ FaceNet ไว้สำหรับ export เป็น SavedModel (signature: embed)"""
+
+    def __init__(self, graph_def, jit_compile=False):
+        super().__init__()
+        self.embed = frozen_graph_function(graph_def, jit_compile)
+
+
+def export_saved_model(model_path, export_dir, jit_compile=False):
+    """
+    แปลง frozen graph (.pb) เป็น SavedModel เพื่อให้โหลดด้วย backend='savedmodel' ได้เร็วขึ้น
+
+    Args:
+        model_path: path ไปยัง frozen graph ของ FaceNet
+        export_dir: โฟลเดอร์ปลายทางของ SavedModel
+        jit_compile: บันทึก function ที่ compile ด้วย XLA
+    """
+    module = FaceNetModule(load_graph_def(model_path), jit_compile)
+    tf.saved_model.save(module, export_dir, signatures={'serving_default': module.embed})
+    logger.info(f"บันทึก FaceNet เป็น SavedModel ที่ {export_dir}")
+
+
+def to_tensor(array):
+    """
+    แปลง numpy array เป็น tf.Tensor โดยใช้ buffer เดิมผ่าน DLPack ถ้าทำได้
+
+    TensorFlow ใช้ buffer ร่วมได้เฉพาะ array ที่ต่อเนื่องและจัดแนว 64 ไบต์ (เช่นจาก aligned_empty)
+    กรณีอื่นจะคัดลอกด้วย tf.convert_to_tensor ตามปกติ
+    """
+    if array.flags.c_contiguous and array.ctypes.data % TENSOR_ALIGNMENT == 0 and array.size > 0:
+        return tf.experimental.dlpack.from_dlpack(array.__dlpack__())
+    return tf.convert_to_tensor(array)
+
+
+def _bucket_size(n):
+    """ปัดจำนวนภาพขึ้นเป็นกำลังของ 2 เพื่อลดจำนวนรูปร่าง input ที่ XLA ต้อง compile ใหม่"""
+    return 1 << max(0, int(n - 1).bit_length())
+
+
+class FaceNetFunction:
+    """
+    รัน FaceNet ผ่าน tf.function (จาก frozen graph หรือ SavedModel) แทน tf.compat.v1.Session
+
+    batch จาก FacePreprocessor.preprocess_batch / MicroBatcher ถูกจองแบบจัดแนวไว้แล้ว
+    จึงส่งเข้า TensorFlow ได้โดยไม่คัดลอก (ดู to_tensor)
+    """
+
+    def __init__(self, model_path, backend='function', jit_compile=False):
+        """
+        เริ่มต้น FaceNetFunction
+
+        Args:
+            model_path: frozen graph (.pb) สำหรับ backend='function' หรือโฟลเดอร์ SavedModel
+                สำหรับ backend='savedmodel'
+            backend: 'function' หรือ 'savedmodel'
+            jit_compile: compile ด้วย XLA (เฉพาะ backend='function')
+        """
+        self.jit_compile = jit_compile
+        if backend == 'savedmodel':
+            self._module = tf.saved_model.load(model_path)
+            self._fn = self._module.embed
+        elif backend == 'function':
+            self._fn = frozen_graph_function(load_graph_def(model_path), jit_compile)
+        else:
+            raise ValueError(f"backend ต้องเป็น 'function' หรือ 'savedmodel' ไม่ใช่ {backend!r}")
+
+    def __call__(self, images):
+        """
+        คำนวณ embeddings
+
+        Args:
+            images: numpy array (N, 160, 160, 3)
+
+        Returns:
+            embeddings: numpy array (N, 512) float32
+        """
+        images = np.ascontiguousarray(images, dtype=np.float32)
+        n = len(images)
+        if self.jit_compile and _bucket_size(n) != n:
+            # เติม batch ให้เต็ม bucket เพื่อใช้ kernel ที่ compile ไว้แล้วซ้ำ
+            padded = aligned_empty((_bucket_size(n),) + images.shape[1:])
+            padded[:n] = images
+            padded[n:] = 0
+            images = padded
+        return self._fn(to_tensor(images)).numpy()[:n]
+
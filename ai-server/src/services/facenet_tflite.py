@@ -0,0 +1,141 @@
+import queue
+import logging
+import numpy as np
+import tensorflow as tf
+from src.services.facenet_graph import load_graph_def, frozen_graph_function
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# รูปแบบการ quantize ที่รองรับ
+QUANTIZATION_MODES = ('float16', 'dynamic', 'int8')
+
+
+def convert_tflite(model_path, output_path, quantization='float16', calibration_images=None):
+    """
+    แปลง frozen graph ของ FaceNet เป็นโมเดล TFLite แบบ quantize สำหรับรันบน CPU
+
+    Args:
+        model_path: path ไปยัง frozen graph (.pb) ของ FaceNet
+        output_path: path ของไฟล์ .tflite ที่จะบันทึก
+        quantization: 'float16' (น้ำหนัก float16), 'dynamic' (น้ำหนัก int8, activation float)
+            หรือ 'int8' (น้ำหนักและ activation int8 ต้องมี calibration_images)
+        calibration_images: numpy array (N, 160, 160, 3) ที่ preprocess แล้ว ใช้ปรับช่วงค่าของ activation
+            สำหรับ int8 (ควรเป็นภาพใบหน้าจริงอย่างน้อย 100 ภาพ)
+
+    Returns:
+        size: ขนาดไฟล์ที่บันทึก (ไบต์)
+    """
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"quantization ต้องเป็นหนึ่งใน {QUANTIZATION_MODES} ไม่ใช่ {quantization!r}")
+
+    embed = frozen_graph_function(load_graph_def(model_path))
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([embed.get_concrete_function()], embed)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if calibration_images is None or len(calibration_images) == 0:
+            raise ValueError("การ quantize แบบ int8 ต้องมี calibration_images")
+
+        def representative_dataset():
+            for image in calibration_images:
+                yield [image[np.newaxis].astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+        # input/output ยังเป็น float32 เพื่อให้ใช้ร่วมกับ preprocess และการ normalize เดิมได้
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+
+    tflite_model = converter.convert()
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    logger.info(f"บันทึก FaceNet แบบ {quantization} ที่ {output_path} ({len(tflite_model) / 1e6:.1f}MB)")
+    return len(tflite_model)
+
+
+class TFLiteReplica:
+    """
+    interpreter ของ FaceNet แบบ TFLite หนึ่งตัว (ใช้ได้ครั้งละหนึ่ง thread)
+
+    ขนาด batch ที่เปลี่ยนจะทำให้ต้อง allocate_tensors ใหม่ จึงจำขนาดล่าสุดไว้
+    """
+
+    def __init__(self, model_path, num_threads=None, op_resolver=None):
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads,
+                                               experimental_op_resolver_type=op_resolver)
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.batch_size = None
+
+    def __call__(self, images):
+        """
+        คำนวณ embeddings
+
+        Args:
+            images: numpy array (N, 160, 160, 3)
+
+        Returns:
+            embeddings: numpy array (N, 512) float32
+        """
+        images = np.ascontiguousarray(images, dtype=np.float32)
+        if self.batch_size != len(images):
+            self.interpreter.resize_tensor_input(self.input_index, images.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(images)
+        self.interpreter.set_tensor(self.input_index, images)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index).copy()
+
+
+class FaceNetTFLite:
+    """
+    รัน FaceNet แบบ TFLite บน CPU
+
+    tf.lite.Interpreter ใช้พร้อมกันหลาย thread ไม่ได้ จึงสร้าง interpreter (TFLiteReplica) ตามจำนวน replicas
+    FaceRecognition ส่ง replicas ให้ InferenceExecutor ยืมทีละตัวโดยตรง (คิวและ timeout อยู่ที่ executor)
+    ส่วนการเรียก object นี้โดยตรงจะยืม interpreter จากคิวภายในและรอได้ไม่เกิน timeout
+    """
+
+    def __init__(self, model_path, replicas=1, num_threads=None, use_xnnpack=True, timeout=None):
+        """
+        เริ่มต้น FaceNetTFLite
+
+        Args:
+            model_path: path ไปยังไฟล์ .tflite
+            replicas: จำนวน interpreter (จำนวนการเรียกที่รันพร้อมกันได้)
+            num_threads: จำนวน thread ต่อ interpreter (None = ให้ TFLite เลือก)
+            use_xnnpack: ใช้ XNNPACK delegate (เร็วกว่าบน CPU) ปิดได้ถ้าการตรวจสอบความแม่นยำพบว่าผลผิดปกติ
+            timeout: เวลารอ interpreter ว่างสูงสุดเมื่อเรียกโดยตรง (วินาที, None = รอจนกว่าจะว่าง)
+        """
+        op_resolver = (tf.lite.experimental.OpResolverType.AUTO if use_xnnpack
+                       else tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES)
+        self.replicas = [TFLiteReplica(model_path, num_threads, op_resolver) for _ in range(max(1, int(replicas)))]
+        self.timeout = timeout
+        self._free = queue.Queue()
+        for replica in self.replicas:
+            self._free.put(replica)
+
+    def __call__(self, images):
+        """
+        คำนวณ embeddings ด้วย interpreter ที่ว่างตัวใดตัวหนึ่ง
+
+        Args:
+            images: numpy array (N, 160, 160, 3)
+
+        Returns:
+            embeddings: numpy array (N, 512) float32
+
+        Raises:
+            TimeoutError: ถ้ารอ interpreter ว่างเกิน timeout
+        """
+        try:
+            replica = self._free.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"รอ interpreter ของ TFLite เกิน {self.timeout}s")
+        try:
+            return replica(images)
+        finally:
+            self._free.put(replica)
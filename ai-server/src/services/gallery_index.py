@@ -0,0 +1,241 @@
+import os
+import numpy as np
+import logging
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# จำนวนผลลัพธ์ (k) สูงสุดที่ผู้เรียกขอได้ต่อ query (/identify, /cluster, /gallery/search)
+MAX_SEARCH_K = int(os.environ.get('MAX_SEARCH_K', '100'))
+
+
+def parse_k(value, default, max_k=None):
+    """
+    แปลงค่า k ที่ผู้ใช้ส่งมาและตรวจสอบว่าอยู่ในช่วง 1..max_k
+
+    Raises:
+        ValueError: ถ้า k ไม่ใช่จำนวนเต็มหรืออยู่นอกช่วง
+    """
+    max_k = MAX_SEARCH_K if max_k is None else max_k
+    k = int(default if value is None else value)
+    if not 1 <= k <= max_k:
+        raise ValueError(f"k ต้องอยู่ระหว่าง 1 ถึง {max_k}")
+    return k
+
+
+def normalize_embeddings(embeddings):
+    """
+    ทำให้ embeddings เป็น unit vector แบบ float32 (รองรับทั้งเวกเตอร์เดียวและเมทริกซ์)
+
+    Args:
+        embeddings: embedding หนึ่งชุด (D,) หรือหลายชุด (N, D)
+
+    Returns:
+        normalized: embeddings ที่ normalize แล้ว (แถวที่เป็นศูนย์จะคงเป็นศูนย์)
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    # ป้องกันการหารด้วยศูนย์ เหมือนกับที่ compare_faces ข้าม vector ที่มีขนาดเป็นศูนย์
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+class GalleryIndex:
+    """
+    ดัชนีของ embeddings ที่ลงทะเบียนไว้ (gallery) สำหรับค้นหาใบหน้าแบบ cosine
+
+    เก็บ embeddings ที่ normalize แล้วไว้ในเมทริกซ์ float32 ต่อเนื่องก้อนเดียว
+    การค้นหาจึงเป็นการคูณเมทริกซ์กับเวกเตอร์ครั้งเดียวตามด้วย partial sort
+    ผู้ใช้หนึ่งคนสามารถมีได้หลาย embeddings (หลายแถว)
+    """
+
+    def __init__(self, dim=512, capacity=1024):
+        """
+        เริ่มต้น GalleryIndex
+
+        Args:
+            dim: จำนวนมิติของ embedding (FaceNet = 512)
+            capacity: จำนวนแถวที่จองไว้ล่วงหน้า (ขยายอัตโนมัติเมื่อเต็ม)
+        """
+        self.dim = dim
+        self._matrix = np.empty((max(1, capacity), dim), dtype=np.float32)
+        self._size = 0
+        self._ids = []
+        self._rows = {}
+
+    @classmethod
+    def from_embeddings(cls, embeddings, ids=None):
+        """
+        สร้าง GalleryIndex จากรายการ embeddings
+
+        Args:
+            embeddings: รายการหรือเมทริกซ์ embeddings (N, D)
+            ids: รายการ user id ของแต่ละแถว (ถ้าไม่ระบุจะใช้ลำดับ 0..N-1)
+
+        Returns:
+            index: GalleryIndex ที่มี embeddings ทั้งหมด
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        index = cls(dim=matrix.shape[1], capacity=len(matrix))
+        index.add_many(range(len(matrix)) if ids is None else ids, matrix)
+        return index
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, user_id):
+        return user_id in self._rows
+
+    @property
+    def ids(self):
+        """รายการ user id เรียงตามแถวในเมทริกซ์"""
+        return list(self._ids)
+
+    @property
+    def embeddings(self):
+        """เมทริกซ์ embeddings ที่ normalize แล้ว (view ไม่มีการคัดลอก)"""
+        return self._matrix[:self._size]
+
+    def _reserve(self, extra):
+        """ขยายเมทริกซ์ให้รองรับแถวเพิ่มอีก extra แถว"""
+        needed = self._size + extra
+        if needed <= len(self._matrix):
+            return
+        capacity = max(needed, 2 * len(self._matrix))
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
+    def add(self, user_id, embedding):
+        """
+        เพิ่ม embedding ของผู้ใช้เข้า gallery
+
+        Args:
+            user_id: รหัสผู้ใช้
+            embedding: embedding (D,)
+        """
+        self.add_many([user_id], np.asarray(embedding).reshape(1, -1))
+
+    def add_many(self, user_ids, embeddings):
+        """
+        เพิ่ม embeddings หลายชุดเข้า gallery ในครั้งเดียว
+
+        Args:
+            user_ids: รายการรหัสผู้ใช้ (ยาวเท่ากับจำนวนแถวของ embeddings)
+            embeddings: เมทริกซ์ embeddings (N, D)
+        """
+        user_ids = list(user_ids)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.dim:
+            raise ValueError(f"embeddings ต้องมีขนาด (N, {self.dim}) แต่ได้ {embeddings.shape}")
+        if len(user_ids) != len(embeddings):
+            raise ValueError("จำนวน user id ไม่ตรงกับจำนวน embeddings")
+
+        self._reserve(len(embeddings))
+        start = self._size
+        self._matrix[start:start + len(embeddings)] = normalize_embeddings(embeddings)
+        for offset, user_id in enumerate(user_ids):
+            self._rows.setdefault(user_id, []).append(start + offset)
+            self._ids.append(user_id)
+        self._size += len(embeddings)
+
+    def remove(self, user_id):
+        """
+        ลบ embeddings ทั้งหมดของผู้ใช้ออกจาก gallery
+
+        ใช้วิธีย้ายแถวสุดท้ายมาแทนที่ เพื่อให้เมทริกซ์ยังต่อเนื่องโดยไม่ต้องคัดลอกทั้งก้อน
+
+        Args:
+            user_id: รหัสผู้ใช้
+
+        Returns:
+            removed: จำนวนแถวที่ถูกลบ
+        """
+        rows = self._rows.pop(user_id, None)
+        if not rows:
+            return 0
+
+        # ลบจากแถวท้ายสุดก่อน เพื่อไม่ให้การย้ายแถวไปทับแถวที่ยังต้องลบ
+        for row in sorted(rows, reverse=True):
+            last = self._size - 1
+            if row != last:
+                moved_id = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved_id
+                moved_rows = self._rows[moved_id]
+                moved_rows[moved_rows.index(last)] = row
+            self._ids.pop()
+            self._size -= 1
+
+        return len(rows)
+
+    def search(self, embedding, k=1, threshold=None):
+        """
+        ค้นหา k ใบหน้าที่ใกล้เคียงที่สุดด้วย cosine distance
+
+        Args:
+            embedding: embedding ที่ต้องการค้นหา (D,)
+            k: จำนวนผลลัพธ์สูงสุด
+            threshold: ถ้าระบุ จะคืนเฉพาะผลที่ distance < threshold
+
+        Returns:
+            matches: รายการ (user_id, distance) เรียงจากใกล้ที่สุด
+        """
+        if self._size == 0 or embedding is None:
+            return []
+
+        query = normalize_embeddings(np.asarray(embedding).reshape(-1))
+        distances = 1.0 - self.embeddings @ query
+
+        k = min(k, self._size)
+        if k < self._size:
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(self._size)
+        top = top[np.argsort(distances[top], kind='stable')]
+
+        matches = []
+        for row in top:
+            distance = float(distances[row])
+            if threshold is not None and distance >= threshold:
+                break
+            matches.append((self._ids[row], distance))
+        return matches
+
+    def search_batch(self, embeddings, k=1, threshold=None):
+        """
+        ค้นหาหลาย embeddings พร้อมกันด้วยการคูณเมทริกซ์ครั้งเดียว (เช่นทุกใบหน้าในรูปหมู่)
+
+        Args:
+            embeddings: เมทริกซ์ query (Q, D)
+            k: จำนวนผลลัพธ์สูงสุดต่อ query
+            threshold: ถ้าระบุ จะคืนเฉพาะผลที่ distance < threshold
+
+        Returns:
+            matches: รายการผลลัพธ์ของแต่ละ query ในรูปแบบเดียวกับ search()
+        """
+        queries = normalize_embeddings(np.asarray(embeddings).reshape(-1, self.dim))
+        if self._size == 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+
+        distances = 1.0 - queries @ self.embeddings.T
+
+        k = min(k, self._size)
+        if k < self._size:
+            top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(self._size), distances.shape)
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_distances = np.take_along_axis(top_distances, order, axis=1)
+
+        results = []
+        for rows, row_distances in zip(top, top_distances):
+            if threshold is not None:
+                rows = rows[row_distances < threshold]
+            results.append([(self._ids[row], float(distance)) for row, distance in zip(rows, row_distances)])
+        return results
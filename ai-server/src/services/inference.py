@@ -0,0 +1,135 @@
+import math
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+from src.utils.metrics import record_stage
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class InferenceBusyError(RuntimeError):
+    """คิวของ InferenceExecutor เต็มหรือรอนานเกินกำหนด (ควรตอบกลับเป็น 503 พร้อม Retry-After)"""
+
+    def __init__(self, name, retry_after=1):
+        super().__init__(f"{name}: ระบบกำลังประมวลผลคำขออื่นอยู่ กรุณาลองใหม่ภายหลัง")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    ควบคุมการเข้าถึงโมเดลจากหลาย thread ด้วยกลุ่ม replica ที่มีจำนวนจำกัดและคิวรอที่มีขนาดจำกัด
+
+    แต่ละคำขอยืม replica หนึ่งตัวผ่าน acquire() ถ้าไม่มี replica ว่างจะรอในคิว
+    ถ้าคิวเต็มหรือรอเกิน queue_timeout จะได้ InferenceBusyError แทนการรอไม่มีกำหนด
+    เก็บสถิติความยาวคิว เวลารอ และเวลาประมวลผลไว้สำหรับ monitoring
+    """
+
+    def __init__(self, replicas, max_queue=64, queue_timeout=10.0, name='inference'):
+        """
+        เริ่มต้น InferenceExecutor
+
+        Args:
+            replicas: รายการ replica ของโมเดล (ใส่ object เดียวกันซ้ำได้ เพื่อจำกัดจำนวนคำขอพร้อมกัน
+                บนโมเดลที่ thread-safe อยู่แล้ว เช่น tf Session)
+            max_queue: จำนวนคำขอที่รอ replica ได้สูงสุด ก่อนจะปฏิเสธทันที
+            queue_timeout: เวลารอ replica สูงสุด (วินาที)
+            name: ชื่อของ executor (ใช้ใน log และข้อความผิดพลาด)
+        """
+        if not replicas:
+            raise ValueError("ต้องมี replica อย่างน้อยหนึ่งตัว")
+        self.name = name
+        self.size = len(replicas)
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = float(queue_timeout)
+        self._free = queue.Queue()
+        for replica in replicas:
+            self._free.put(replica)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_use = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._max_waiting = 0
+        self._waits = deque(maxlen=1024)
+        self._service_times = deque(maxlen=1024)
+
+    def _retry_after(self, waiting):
+        """ประมาณเวลาที่คิวปัจจุบันจะว่าง (วินาที) จากเวลาประมวลผลเฉลี่ยล่าสุด"""
+        service = np.mean(self._service_times) if self._service_times else 1.0
+        return max(1, math.ceil(service * (waiting + 1) / self.size))
+
+    @contextmanager
+    def acquire(self):
+        """
+        ยืม replica หนึ่งตัว และคืนให้อัตโนมัติเมื่อออกจาก with
+
+        Raises:
+            InferenceBusyError: ถ้าคิวเต็มหรือรอเกิน queue_timeout
+        """
+        start = time.monotonic()
+        with self._lock:
+            if self._in_use >= self.size and self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise InferenceBusyError(self.name, self._retry_after(self._waiting))
+            self._waiting += 1
+            self._max_waiting = max(self._max_waiting, self._waiting)
+
+        try:
+            replica = self._free.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            with self._lock:
+                self._waiting -= 1
+                self._timeouts += 1
+                retry_after = self._retry_after(self._waiting)
+            logger.warning(f"{self.name}: รอ replica เกิน {self.queue_timeout}s")
+            raise InferenceBusyError(self.name, retry_after)
+
+        acquired = time.monotonic()
+        record_stage(f'{self.name}_wait', acquired - start)
+        with self._lock:
+            self._waiting -= 1
+            self._in_use += 1
+            self._waits.append(acquired - start)
+
+        try:
+            yield replica
+        finally:
+            self._free.put(replica)
+            with self._lock:
+                self._in_use -= 1
+                self._completed += 1
+                self._service_times.append(time.monotonic() - acquired)
+
+    def stats(self):
+        """สถิติของ executor: ความยาวคิว, จำนวนที่ถูกปฏิเสธ, เวลารอและเวลาประมวลผล (มิลลิวินาที)"""
+        with self._lock:
+            waits = np.array(self._waits) * 1000
+            service_times = np.array(self._service_times) * 1000
+            stats = {
+                'replicas': self.size,
+                'in_use': self._in_use,
+                'queue_depth': self._waiting,
+                'max_queue_depth': self._max_waiting,
+                'max_queue': self.max_queue,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+            }
+        stats['wait_ms'] = {
+            'mean': float(waits.mean()) if len(waits) else 0.0,
+            'p50': float(np.percentile(waits, 50)) if len(waits) else 0.0,
+            'p99': float(np.percentile(waits, 99)) if len(waits) else 0.0,
+            'max': float(waits.max()) if len(waits) else 0.0,
+        }
+        stats['service_ms'] = {
+            'mean': float(service_times.mean()) if len(service_times) else 0.0,
+            'p99': float(np.percentile(service_times, 99)) if len(service_times) else 0.0,
+        }
+        return stats
@@ -0,0 +1,166 @@
+import os
+import logging
+import cv2
+import numpy as np
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def list_images(directory, limit=None):
+    """รายการไฟล์รูปภาพในโฟลเดอร์ (รวมโฟลเดอร์ย่อย) เรียงตามชื่อ"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    paths.sort()
+    return paths[:limit] if limit else paths
+
+
+def load_pairs(pairs_file):
+    """
+    อ่านชุดคู่ภาพสำหรับทดสอบการยืนยันตัวตน
+
+    แต่ละบรรทัดคือ "ภาพที่1 ภาพที่2 label" (คั่นด้วยช่องว่างหรือ comma, label 1 = คนเดียวกัน, 0 = ต่างคน)
+    path เป็น path สัมพัทธ์กับโฟลเดอร์ของไฟล์คู่ภาพได้ บรรทัดที่ขึ้นต้นด้วย # จะถูกข้าม
+
+    Returns:
+        pairs: รายการ (path1, path2, label)
+    """
+    base_dir = os.path.dirname(os.path.abspath(pairs_file))
+    pairs = []
+    with open(pairs_file, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            path1, path2, label = line.replace(',', ' ').split()
+            pairs.append((os.path.join(base_dir, path1), os.path.join(base_dir, path2), int(label)))
+    return pairs
+
+
+def best_threshold(distances, labels):
+    """
+    หา threshold ของ cosine distance ที่ให้ความแม่นยำสูงสุด (distance < threshold = คนเดียวกัน)
+
+    Returns:
+        threshold, accuracy
+    """
+    order = np.argsort(distances)
+    sorted_distances = distances[order]
+    sorted_labels = labels[order].astype(np.int64)
+    # ถ้าตัดหลังตำแหน่ง i: คู่ 0..i ถูกทายว่าเหมือน ที่เหลือถูกทายว่าต่าง
+    same_below = np.concatenate([[0], np.cumsum(sorted_labels)])
+    diff_above = np.concatenate([[0], np.cumsum((1 - sorted_labels)[::-1])])[::-1]
+    correct = same_below + diff_above
+    cut = int(np.argmax(correct))
+    if cut == 0:
+        threshold = float(sorted_distances[0])
+    elif cut == len(sorted_distances):
+        threshold = float(sorted_distances[-1]) + 1e-6
+    else:
+        threshold = float((sorted_distances[cut - 1] + sorted_distances[cut]) / 2)
+    return threshold, float(correct[cut] / len(labels))
+
+
+def accuracy_at(distances, labels, threshold):
+    """ความแม่นยำของการยืนยันตัวตนที่ threshold ที่กำหนด"""
+    return float(np.mean((distances < threshold) == labels.astype(bool)))
+
+
+def _embed_all(face_recognition, batch, chunk_size):
+    return np.concatenate([face_recognition.embed_preprocessed(batch[start:start + chunk_size])
+                           for start in range(0, len(batch), chunk_size)])
+
+
+def compare_embedding_models(reference, candidate, images, pairs=None, chunk_size=32):
+    """
+    เปรียบเทียบ embeddings ของโมเดลที่ปรับแต่ง (เช่น quantize) กับโมเดลต้นฉบับ float32
+
+    ภาพทุกภาพถูก preprocess ครั้งเดียวด้วย preprocessor ของ reference แล้วส่งเข้าทั้งสองโมเดล
+    ความต่างที่วัดได้จึงมาจากโมเดลเท่านั้น
+
+    Args:
+        reference: FaceRecognition ของโมเดลต้นฉบับ
+        candidate: FaceRecognition ของโมเดลที่ต้องการตรวจสอบ
+        images: dict ของ path -> ภาพใบหน้าที่ตัดมาแล้ว (BGR)
+        pairs: รายการ (path1, path2, label) จาก load_pairs (ถ้ามี จะวัดความแม่นยำการยืนยันตัวตนด้วย)
+        chunk_size: จำนวนภาพต่อ batch
+
+    Returns:
+        report: dict ของความต่างเชิงมุม (cosine drift) และความแม่นยำที่เปลี่ยนไป
+    """
+    paths = list(images)
+    batch, valid = reference.preprocessor.preprocess_batch([images[path] for path in paths])
+    paths = [paths[i] for i in valid]
+    index = {path: i for i, path in enumerate(paths)}
+
+    ref_embeddings = _embed_all(reference, batch, chunk_size)
+    cand_embeddings = _embed_all(candidate, batch, chunk_size)
+
+    # cosine drift ต่อภาพ: 1 - cos(embedding ต้นฉบับ, embedding ใหม่)
+    drift = 1.0 - np.sum(ref_embeddings * cand_embeddings, axis=1)
+    report = {
+        'images': len(paths),
+        'cosine_drift': {
+            'mean': float(drift.mean()),
+            'p50': float(np.percentile(drift, 50)),
+            'p99': float(np.percentile(drift, 99)),
+            'max': float(drift.max()),
+        },
+    }
+
+    if not pairs:
+        return report
+
+    pairs = [(a, b, label) for a, b, label in pairs if a in index and b in index]
+    if not pairs:
+        logger.warning("ไม่มีคู่ภาพที่อ่านและ preprocess ได้")
+        return report
+
+    left = np.array([index[a] for a, _, _ in pairs])
+    right = np.array([index[b] for _, b, _ in pairs])
+    labels = np.array([label for _, _, label in pairs])
+
+    ref_distances = 1.0 - np.sum(ref_embeddings[left] * ref_embeddings[right], axis=1)
+    cand_distances = 1.0 - np.sum(cand_embeddings[left] * cand_embeddings[right], axis=1)
+
+    ref_threshold, ref_best = best_threshold(ref_distances, labels)
+    cand_threshold, cand_best = best_threshold(cand_distances, labels)
+    default_threshold = reference.default_threshold
+    cand_at_ref = accuracy_at(cand_distances, labels, ref_threshold)
+
+    report['verification'] = {
+        'pairs': len(pairs),
+        'positive_pairs': int(labels.sum()),
+        'reference': {
+            'best_threshold': ref_threshold,
+            'best_accuracy': ref_best,
+            'accuracy_at_default': accuracy_at(ref_distances, labels, default_threshold),
+        },
+        'candidate': {
+            'best_threshold': cand_threshold,
+            'best_accuracy': cand_best,
+            'accuracy_at_default': accuracy_at(cand_distances, labels, default_threshold),
+            'accuracy_at_reference_threshold': cand_at_ref,
+        },
+        'default_threshold': default_threshold,
+        # ความแม่นยำที่เปลี่ยนไปเมื่อใช้ threshold เดิมของโมเดลต้นฉบับ (ค่าลบ = แย่ลง)
+        'accuracy_change': cand_at_ref - ref_best,
+        'pair_distance_drift_max': float(np.abs(cand_distances - ref_distances).max()),
+    }
+    return report
+
+
+def read_images(paths):
+    """อ่านรูปภาพตาม path (ข้ามไฟล์ที่อ่านไม่ได้)"""
+    images = {}
+    for path in dict.fromkeys(paths):
+        image = cv2.imread(path)
+        if image is None:
+            logger.warning(f"อ่านรูปภาพไม่ได้: {path}")
+            continue
+        images[path] = image
+    return images
@@ -0,0 +1,282 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = '../models/facenet/20180402-114759/20180402-114759.pb'
+# คลัง embeddings อยู่ใน ai-server/data เสมอ ไม่ขึ้นกับโฟลเดอร์ที่รัน process (ตั้ง EMBEDDING_STORE_PATH เพื่อย้ายที่)
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                  'data', 'embedding_store')
+
+# วิธีโหลดโมเดลตอนเริ่ม process (AI_SERVER_WARMUP): blocking = โหลดและ warm-up ก่อนรับคำขอ,
+# background = รับคำขอทันทีและโหลดใน thread แยก (/api/ready ตอบ 503 จนกว่าจะเสร็จ), lazy = โหลดเมื่อมีคำขอแรก
+WARMUP_MODES = ('blocking', 'background', 'lazy')
+
+_lock = threading.Lock()
+_face_recognition = None
+_face_analyzer = None
+_embedding_store = None
+_warm_up_thread = None
+
+# สถานะของแต่ละโมเดล: not_loaded, loading, ready หรือ failed (พร้อมเวลาที่ใช้และข้อผิดพลาด)
+_status_lock = threading.Lock()
+_status = {name: {'state': 'not_loaded'} for name in ('detector', 'facenet', 'warm_up')}
+
+
+def _set_status(name, state, **info):
+    with _status_lock:
+        _status[name] = dict(state=state, **info)
+
+
+@contextmanager
+def _loading(name):
+    """บันทึกสถานะ loading -> ready / failed ของโมเดลระหว่างโหลด"""
+    _set_status(name, 'loading')
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        _set_status(name, 'failed', error=str(e))
+        raise
+    _set_status(name, 'ready', seconds=round(time.perf_counter() - start, 3))
+
+
+def get_face_recognition():
+    """
+    คืน FaceRecognition ของ process นี้ (โหลดโมเดล FaceNet ครั้งแรกที่เรียก)
+
+    อ่านการตั้งค่าจาก environment variables: FACENET_MODEL_PATH, FACENET_BATCH_WINDOW_MS,
+    FACENET_MAX_BATCH_SIZE, PREPROCESS_PROFILE, FACENET_CONCURRENCY, FACENET_MAX_QUEUE,
+    INFERENCE_QUEUE_TIMEOUT, TF_INTRA_OP_THREADS, TF_INTER_OP_THREADS, FACENET_BACKEND, FACENET_XLA,
+    FACENET_MODEL_REPLICAS, FACENET_TFLITE_XNNPACK
+    """
+    global _face_recognition
+    if _face_recognition is None:
+        with _lock:
+            if _face_recognition is None:
+                with _loading('facenet'):
+                    _face_recognition = _create_face_recognition()
+    return _face_recognition
+
+
+def _create_face_recognition():
+    from src.services.face_recognition import FaceRecognition
+    max_batch_size = int(os.environ.get('FACENET_MAX_BATCH_SIZE', '32'))
+    return FaceRecognition(
+        os.environ.get('FACENET_MODEL_PATH', DEFAULT_MODEL_PATH),
+        # รวม get_embeddings จากคำขอที่เข้ามาพร้อมกันเป็น batch เดียว (ตั้งเป็น 0 เพื่อปิด)
+        batch_window_ms=float(os.environ.get('FACENET_BATCH_WINDOW_MS', '5')),
+        max_batch_size=max_batch_size,
+        preprocess_profile=os.environ.get('PREPROCESS_PROFILE', 'quality'),
+        # micro-batch หนึ่งชุดยืม replica ครั้งเดียว 2 = micro-batch กับ batch จาก /embeddings/batch รันพร้อมกันได้
+        max_concurrency=int(os.environ.get('FACENET_CONCURRENCY', '2')),
+        max_queue=int(os.environ.get('FACENET_MAX_QUEUE', '64')),
+        queue_timeout=float(os.environ.get('INFERENCE_QUEUE_TIMEOUT', '10')),
+        intra_op_threads=int(os.environ.get('TF_INTRA_OP_THREADS', '0')),
+        inter_op_threads=int(os.environ.get('TF_INTER_OP_THREADS', '0')),
+        backend=os.environ.get('FACENET_BACKEND', 'session'),
+        jit_compile=os.environ.get('FACENET_XLA', '0').lower() in ('1', 'true', 'yes'),
+        model_replicas=int(os.environ.get('FACENET_MODEL_REPLICAS', '1')),
+        use_xnnpack=os.environ.get('FACENET_TFLITE_XNNPACK', '1').lower() not in ('0', 'false', 'no')
+    )
+
+
+def get_face_analyzer():
+    """
+    คืน FaceAnalyzer ที่ใช้ร่วมกันทุก endpoint (สร้างครั้งแรกที่เรียก)
+
+    FaceNet ถูกโหลดเมื่อ analyzer ต้องสร้าง embedding ครั้งแรก คำขอที่ใช้แค่การตรวจจับ
+    และคะแนนคุณภาพจึงไม่ต้องรอโหลด FaceNet
+    """
+    global _face_analyzer
+    if _face_analyzer is None:
+        with _lock:
+            if _face_analyzer is None:
+                from src.services.face_analysis import FaceAnalyzer
+                _face_analyzer = FaceAnalyzer(
+                    get_face_recognition,
+                    chunk_size=int(os.environ.get('EMBEDDING_CHUNK_SIZE', '32'))
+                )
+    return _face_analyzer
+
+
+def get_embedding_store():
+    """
+    คืนคลัง embeddings บนดิสก์ของ process นี้ (เปิดแบบ memmap ครั้งแรกที่เรียก)
+
+    อ่านการตั้งค่าจาก environment variables: EMBEDDING_STORE_PATH, EMBEDDING_STORE_DTYPE
+    """
+    global _embedding_store
+    if _embedding_store is None:
+        with _lock:
+            if _embedding_store is None:
+                from src.services.embedding_store import EmbeddingStore
+                _embedding_store = EmbeddingStore(
+                    os.environ.get('EMBEDDING_STORE_PATH', DEFAULT_STORE_PATH),
+                    dtype=os.environ.get('EMBEDDING_STORE_DTYPE', 'float32')
+                )
+    return _embedding_store
+
+
+def get_detector():
+    """คืน MTCNN detector ของ process นี้ (สร้างครั้งแรกที่เรียก)"""
+    from src.services.face_detection import get_detector as _get_detector
+    return _get_detector()
+
+
+def models_loaded():
+    """ตรวจสอบว่าโหลดโมเดลทั้งหมดของ process นี้แล้วหรือยัง"""
+    from src.services import face_detection
+    return _face_recognition is not None and face_detection.detector_pool is not None
+
+
+def model_status():
+    """
+    สถานะของแต่ละโมเดลใน process นี้ (สำหรับ /api/ready)
+
+    Returns:
+        status: dict ชื่อ -> {'state': not_loaded / loading / ready / failed, 'seconds', 'error'}
+    """
+    from src.services import face_detection
+    with _status_lock:
+        status = {name: dict(values) for name, values in _status.items()}
+    # โมเดลที่ถูกโหลดแบบ lazy จากคำขอแรก (ไม่ผ่าน load_models) ก็นับว่าพร้อมแล้ว
+    if face_detection.detector_pool is not None and status['detector']['state'] != 'ready':
+        status['detector'] = {'state': 'ready'}
+    if _face_recognition is not None and status['facenet']['state'] != 'ready':
+        status['facenet'] = {'state': 'ready'}
+    return status
+
+
+def is_ready():
+    """พร้อมรับคำขอหรือไม่: warm-up ที่เริ่มไว้เสร็จแล้ว และไม่มีโมเดลที่โหลดล้มเหลว"""
+    status = model_status()
+    if any(values['state'] == 'failed' for values in status.values()):
+        return False
+    # ไม่ได้เริ่ม warm-up (โหมด lazy) โมเดลจะถูกโหลดเมื่อมีคำขอแรก จึงถือว่าพร้อม
+    return status['warm_up']['state'] in ('ready', 'not_loaded')
+
+
+def load_models():
+    """โหลด MTCNN และ FaceNet ทันที (ใช้ใน worker หลัง fork หรือก่อนเริ่มรับคำขอ)"""
+    start = time.perf_counter()
+    from src.services.face_detection import get_detector_pool
+    with _loading('detector'):
+        get_detector_pool()
+    get_face_recognition()
+    get_face_analyzer()
+    logger.info(f"โหลดโมเดลทั้งหมดใน process {os.getpid()} สำเร็จ ({time.perf_counter() - start:.1f}s)")
+
+
+def warm_up():
+    """
+    รันโมเดลกับข้อมูลจำลองหนึ่งรอบ เพื่อให้ graph/kernel ถูกเตรียมก่อนคำขอจริงเข้ามา
+    """
+    start = time.perf_counter()
+    from src.services.face_detection import detect_faces
+    detect_faces(np.zeros((160, 160, 3), dtype=np.uint8))
+    face_recognition = get_face_recognition()
+    face_recognition.get_embeddings_batch([np.zeros((160, 160, 3), dtype=np.uint8)])
+    face_recognition.quality_assessment_batch([np.zeros((160, 160, 3), dtype=np.uint8)], with_feedback=False)
+    logger.info(f"warm-up โมเดลใน process {os.getpid()} เสร็จสิ้น ({time.perf_counter() - start:.1f}s)")
+
+
+def start_warm_up(mode=None):
+    """
+    โหลดและ warm-up โมเดลตามโหมด AI_SERVER_WARMUP (blocking / background / lazy)
+
+    Args:
+        mode: โหมดที่ต้องการ (None = อ่านจาก AI_SERVER_WARMUP ค่าเริ่มต้น blocking)
+
+    Returns:
+        thread: thread ที่กำลัง warm-up (โหมด background) หรือ None
+    """
+    global _warm_up_thread
+    mode = (mode or os.environ.get('AI_SERVER_WARMUP', 'blocking')).lower()
+    if mode not in WARMUP_MODES:
+        raise ValueError(f"AI_SERVER_WARMUP ต้องเป็นหนึ่งใน {', '.join(WARMUP_MODES)} ไม่ใช่ {mode!r}")
+    if mode == 'lazy':
+        return None
+
+    def run():
+        with _loading('warm_up'):
+            load_models()
+            warm_up()
+
+    if mode == 'blocking':
+        run()
+        return None
+
+    def run_in_background():
+        try:
+            run()
+        except Exception as e:
+            # สถานะ failed ถูกบันทึกแล้ว /api/ready จะรายงานข้อผิดพลาดนี้
+            logger.error(f"warm-up โมเดลใน background ล้มเหลว: {e}")
+
+    _warm_up_thread = threading.Thread(target=run_in_background, name='model-warm-up', daemon=True)
+    _warm_up_thread.start()
+    return _warm_up_thread
+
+
+def shutdown():
+    """ปิด micro-batcher หลังประมวลผลคำขอที่ค้างอยู่จนหมด (เรียกตอน worker ปิดตัว)"""
+    if _face_recognition is not None and _face_recognition.batcher is not None:
+        _face_recognition.batcher.close(timeout=10)
+        logger.info(f"ปิด micro-batcher ของ process {os.getpid()} แล้ว")
+
+
+def inference_stats():
+    """สถิติคิวและเวลารอของ executor ที่สร้างแล้วใน process นี้"""
+    from src.services import face_detection
+    stats = {}
+    for backend, pool in list(face_detection.detector_pools.items()):
+        stats[backend] = pool.stats()
+    if _face_recognition is not None:
+        stats['facenet'] = _face_recognition.executor.stats()
+        if _face_recognition.batcher is not None:
+            stats['facenet']['batches_run'] = _face_recognition.batcher.batches_run
+            stats['facenet']['batched_items'] = _face_recognition.batcher.items_run
+            stats['facenet']['batch_rejected'] = _face_recognition.batcher.rejected
+    return stats
+
+
+def metric_families():
+    """
+    สถิติของแคช คิว executor และสถานะโมเดลในรูปแบบที่ src.utils.metrics.register_collector ต้องการ
+    (อ่านตอน scrape จากตัวนับที่ service เก็บไว้อยู่แล้ว จึงไม่มีต้นทุนเพิ่มบน hot path)
+    """
+    from src.services.embedding_cache import face_cache
+
+    cache = face_cache.stats()
+    lookups, ratios = [], []
+    for kind, values in cache['kinds'].items():
+        for result in ('memory_hits', 'redis_hits', 'misses'):
+            lookups.append(({'kind': kind, 'result': result}, values[result]))
+        ratios.append(({'kind': kind}, values['hit_ratio']))
+
+    stats = inference_stats()
+    queue_depth = [({'executor': name}, values['queue_depth']) for name, values in stats.items()]
+    in_use = [({'executor': name}, values['in_use']) for name, values in stats.items()]
+    outcomes = [({'executor': name, 'outcome': outcome}, values[outcome])
+                for name, values in stats.items() for outcome in ('completed', 'rejected', 'timeouts')]
+
+    loaded = [({'model': name}, 1 if values['state'] == 'ready' else 0) for name, values in model_status().items()
+              if name != 'warm_up']
+
+    return [
+        ('ai_server_cache_lookups_total', 'counter', 'Face cache lookups by kind and result', lookups),
+        ('ai_server_cache_hit_ratio', 'gauge', 'Face cache hit ratio by kind', ratios),
+        ('ai_server_cache_bytes', 'gauge', 'Bytes held by the in-memory face cache', [({}, cache['bytes'])]),
+        ('ai_server_cache_evictions_total', 'counter', 'In-memory face cache evictions', [({}, cache['evictions'])]),
+        ('ai_server_inference_queue_depth', 'gauge', 'Requests waiting for a model replica', queue_depth),
+        ('ai_server_inference_in_use', 'gauge', 'Model replicas currently in use', in_use),
+        ('ai_server_inference_requests_total', 'counter', 'Model executor requests by outcome', outcomes),
+        ('ai_server_model_ready', 'gauge', 'Whether each model is loaded', loaded),
+    ]
@@ -0,0 +1,279 @@
+import os
+import cv2
+import numpy as np
+from mtcnn import MTCNN
+
+# The box arithmetic (NMS, padding, regression) is reused from the pinned mtcnn==0.1.1 so batched
+# results match MTCNN.detect_faces exactly; only how the networks are invoked differs
+_generate_bounding_box = MTCNN._MTCNN__generate_bounding_box
+_nms = MTCNN._MTCNN__nms
+_pad = MTCNN._MTCNN__pad
+_rerec = MTCNN._MTCNN__rerec
+_bbreg = MTCNN._MTCNN__bbreg
+_scale_image = MTCNN._MTCNN__scale_image
+
+# Upper bound on pixels (batch x height x width) per P-Net call; bounds peak memory of a batch
+DEFAULT_MAX_BATCH_PIXELS = 4_000_000
+# Extra area allowed when padding pyramid levels of different sizes into one P-Net batch.
+# Windows on the right/bottom edge of a padded level can score slightly differently than in
+# MTCNN.detect_faces; 0 only batches levels of identical size and gives bit-identical results
+DEFAULT_MAX_PADDING = float(os.environ.get('MTCNN_BATCH_MAX_PADDING', '0.25'))
+# Candidate windows per R-Net / O-Net call
+DEFAULT_WINDOW_BATCH = 2048
+
+
+class _Stage:
+    """Per-image pipeline state (candidate boxes and the padding status MTCNN threads between stages)"""
+
+    def __init__(self, image, min_face_size):
+        self.image = image
+        self.height, self.width = image.shape[:2]
+        self.min_face_size = min_face_size
+        self.level_boxes = {}
+        self.boxes = np.empty((0, 9))
+        self.status = None
+        self.points = np.empty((0,))
+
+
+class _Status:
+    """The padding tuple returned by MTCNN's __pad with the field names its stages use"""
+
+    def __init__(self, pad):
+        self.dy, self.edy, self.dx, self.edx, self.y, self.ey, self.x, self.ex, self.tmpw, self.tmph = pad
+
+
+def _pnet_output_size(size):
+    # conv3 (valid) -> maxpool 2x2/2 (same) -> conv3 (valid) -> conv3 (valid)
+    return int(np.ceil((size - 2) / 2)) - 4
+
+
+def _bucket_levels(levels, max_padding, max_batch_pixels):
+    """
+    Group pyramid levels into P-Net batches, padding levels of similar size to a common shape
+
+    Args:
+        levels: list of (key, scaled image) with scaled images transposed as P-Net expects
+        max_padding: extra padded area allowed relative to the real pixels in a batch
+        max_batch_pixels: upper bound on padded pixels per batch
+
+    Returns:
+        buckets: list of lists of levels
+    """
+    levels = sorted(levels, key=lambda level: level[1].shape[:2], reverse=True)
+    buckets = []
+    bucket, bucket_h, bucket_w, area = [], 0, 0, 0
+    for level in levels:
+        h, w = level[1].shape[:2]
+        new_h, new_w = max(bucket_h, h), max(bucket_w, w)
+        padded = new_h * new_w * (len(bucket) + 1)
+        if bucket and (padded > (1 + max_padding) * (area + h * w) or padded > max_batch_pixels):
+            buckets.append(bucket)
+            bucket, new_h, new_w, area = [], h, w, 0
+        bucket.append(level)
+        bucket_h, bucket_w, area = new_h, new_w, area + h * w
+    if bucket:
+        buckets.append(bucket)
+    return buckets
+
+
+def _run(model, inputs, batch_size):
+    """Call a Keras model directly (no predict() per-call overhead) in chunks of batch_size"""
+    outputs = [model(inputs[i:i + batch_size], training=False) for i in range(0, len(inputs), batch_size)]
+    return [np.concatenate([np.asarray(chunk[j]) for chunk in outputs]) for j in range(len(outputs[0]))]
+
+
+def _crop_windows(stage, status, size):
+    """
+    Cut the padded square around every candidate box and resize it to the network input size,
+    exactly as MTCNN's second and third stages do
+
+    Returns:
+        windows: float32 (N, size, size, 3) transposed and normalized as R-Net / O-Net expect,
+            or None if a box has an invalid extent (MTCNN drops every candidate of the image then)
+    """
+    num_boxes = stage.boxes.shape[0]
+    windows = np.zeros((num_boxes, size, size, 3), dtype=np.float32)
+    for k in range(num_boxes):
+        tmp = np.zeros((int(status.tmph[k]), int(status.tmpw[k]), 3))
+        tmp[status.dy[k] - 1:status.edy[k], status.dx[k] - 1:status.edx[k], :] = \
+            stage.image[status.y[k] - 1:status.ey[k], status.x[k] - 1:status.ex[k], :]
+        if tmp.shape[0] > 0 and tmp.shape[1] > 0 or tmp.shape[0] == 0 and tmp.shape[1] == 0:
+            windows[k] = np.transpose(cv2.resize(tmp, (size, size), interpolation=cv2.INTER_AREA), (1, 0, 2))
+        else:
+            return None
+    return (windows - 127.5) * 0.0078125
+
+
+def _stage1(detector, stages, max_padding, max_batch_pixels):
+    levels = []
+    for i, stage in enumerate(stages):
+        m = 12 / stage.min_face_size
+        min_layer = np.amin([stage.height, stage.width]) * m
+        for j, scale in enumerate(detector._MTCNN__compute_scale_pyramid(m, min_layer)):
+            scaled = np.transpose(_scale_image(stage.image, scale), (1, 0, 2)).astype(np.float32)
+            levels.append(((i, j, scale), scaled))
+
+    for bucket in _bucket_levels(levels, max_padding, max_batch_pixels):
+        height = max(scaled.shape[0] for _, scaled in bucket)
+        width = max(scaled.shape[1] for _, scaled in bucket)
+        batch = np.zeros((len(bucket), height, width, 3), dtype=np.float32)
+        for n, (_, scaled) in enumerate(bucket):
+            batch[n, :scaled.shape[0], :scaled.shape[1]] = scaled
+        reg, prob = [np.asarray(out) for out in detector._pnet(batch, training=False)]
+
+        for n, ((i, j, scale), scaled) in enumerate(bucket):
+            # Crop the output map to this level's own size so padding produces no windows
+            out_h, out_w = _pnet_output_size(scaled.shape[0]), _pnet_output_size(scaled.shape[1])
+            out0 = np.transpose(reg[n, :out_h, :out_w], (1, 0, 2))
+            out1 = np.transpose(prob[n, :out_h, :out_w], (1, 0, 2))
+            boxes, _ = _generate_bounding_box(out1[:, :, 1].copy(), out0.copy(), scale,
+                                              detector._steps_threshold[0])
+            pick = _nms(boxes.copy(), 0.5, 'Union')
+            if boxes.size > 0 and pick.size > 0:
+                stages[i].level_boxes[j] = boxes[pick, :]
+
+    for stage in stages:
+        # Merge levels in pyramid order, as MTCNN.detect_faces does
+        if stage.level_boxes:
+            stage.boxes = np.concatenate([stage.level_boxes[j] for j in sorted(stage.level_boxes)])
+        if stage.boxes.shape[0] == 0:
+            continue
+
+        total_boxes = stage.boxes[_nms(stage.boxes.copy(), 0.7, 'Union'), :]
+        regw = total_boxes[:, 2] - total_boxes[:, 0]
+        regh = total_boxes[:, 3] - total_boxes[:, 1]
+        qq1 = total_boxes[:, 0] + total_boxes[:, 5] * regw
+        qq2 = total_boxes[:, 1] + total_boxes[:, 6] * regh
+        qq3 = total_boxes[:, 2] + total_boxes[:, 7] * regw
+        qq4 = total_boxes[:, 3] + total_boxes[:, 8] * regh
+        total_boxes = np.transpose(np.vstack([qq1, qq2, qq3, qq4, total_boxes[:, 4]]))
+        total_boxes = _rerec(total_boxes.copy())
+        total_boxes[:, 0:4] = np.fix(total_boxes[:, 0:4]).astype(np.int32)
+        stage.boxes = total_boxes
+        stage.status = _pad(total_boxes.copy(), stage.width, stage.height)
+
+
+def _stage2(detector, stages, window_batch):
+    crops = []
+    for stage in stages:
+        windows = _crop_windows(stage, _Status(stage.status), 24) if stage.boxes.shape[0] else None
+        if windows is None:
+            stage.boxes = np.empty((0, 5))
+            continue
+        crops.append((stage, windows))
+    if not crops:
+        return
+
+    reg, prob = _run(detector._rnet, np.concatenate([windows for _, windows in crops]), window_batch)
+    offset = 0
+    for stage, windows in crops:
+        out0 = np.transpose(reg[offset:offset + len(windows)])
+        score = prob[offset:offset + len(windows), 1]
+        offset += len(windows)
+
+        ipass = np.where(score > detector._steps_threshold[1])
+        total_boxes = np.hstack([stage.boxes[ipass[0], 0:4].copy(), np.expand_dims(score[ipass].copy(), 1)])
+        mv = out0[:, ipass[0]]
+        if total_boxes.shape[0] > 0:
+            pick = _nms(total_boxes, 0.7, 'Union')
+            total_boxes = total_boxes[pick, :]
+            total_boxes = _bbreg(total_boxes.copy(), np.transpose(mv[:, pick]))
+            total_boxes = _rerec(total_boxes.copy())
+        stage.boxes = total_boxes
+
+
+def _stage3(detector, stages, window_batch):
+    crops = []
+    for stage in stages:
+        if stage.boxes.shape[0] == 0:
+            continue
+        stage.boxes = np.fix(stage.boxes).astype(np.int32)
+        windows = _crop_windows(stage, _Status(_pad(stage.boxes.copy(), stage.width, stage.height)), 48)
+        if windows is None:
+            stage.boxes = np.empty((0, 5))
+            continue
+        crops.append((stage, windows))
+    if not crops:
+        return
+
+    reg, landmarks, prob = _run(detector._onet, np.concatenate([windows for _, windows in crops]), window_batch)
+    offset = 0
+    for stage, windows in crops:
+        out0 = np.transpose(reg[offset:offset + len(windows)])
+        points = np.transpose(landmarks[offset:offset + len(windows)])
+        score = prob[offset:offset + len(windows), 1]
+        offset += len(windows)
+
+        ipass = np.where(score > detector._steps_threshold[2])
+        points = points[:, ipass[0]]
+        total_boxes = np.hstack([stage.boxes[ipass[0], 0:4].copy(), np.expand_dims(score[ipass].copy(), 1)])
+        mv = out0[:, ipass[0]]
+
+        w = total_boxes[:, 2] - total_boxes[:, 0] + 1
+        h = total_boxes[:, 3] - total_boxes[:, 1] + 1
+        points[0:5, :] = np.tile(w, (5, 1)) * points[0:5, :] + np.tile(total_boxes[:, 0], (5, 1)) - 1
+        points[5:10, :] = np.tile(h, (5, 1)) * points[5:10, :] + np.tile(total_boxes[:, 1], (5, 1)) - 1
+
+        if total_boxes.shape[0] > 0:
+            total_boxes = _bbreg(total_boxes.copy(), np.transpose(mv))
+            pick = _nms(total_boxes.copy(), 0.7, 'Min')
+            total_boxes = total_boxes[pick, :]
+            points = points[:, pick]
+        stage.boxes = total_boxes
+        stage.points = points
+
+
+def _to_faces(stage):
+    faces = []
+    if stage.boxes.shape[0] == 0:
+        return faces
+    for bounding_box, keypoints in zip(stage.boxes, stage.points.T):
+        x = max(0, int(bounding_box[0]))
+        y = max(0, int(bounding_box[1]))
+        faces.append({
+            'box': [x, y, int(bounding_box[2] - x), int(bounding_box[3] - y)],
+            'confidence': bounding_box[-1],
+            'keypoints': {
+                'left_eye': (int(keypoints[0]), int(keypoints[5])),
+                'right_eye': (int(keypoints[1]), int(keypoints[6])),
+                'nose': (int(keypoints[2]), int(keypoints[7])),
+                'mouth_left': (int(keypoints[3]), int(keypoints[8])),
+                'mouth_right': (int(keypoints[4]), int(keypoints[9])),
+            }
+        })
+    return faces
+
+
+def detect_faces_batch(detector, images, min_face_sizes=None, max_padding=None,
+                       max_batch_pixels=DEFAULT_MAX_BATCH_PIXELS, window_batch=DEFAULT_WINDOW_BATCH):
+    """
+    Run MTCNN on several images at once
+
+    Instead of one P-Net call per pyramid level per image and one R-Net / O-Net call per image,
+    pyramid levels of every image are grouped by size into a few P-Net batches and the candidate
+    windows of all images go through R-Net and O-Net together.
+
+    Args:
+        detector: an MTCNN instance (its networks and thresholds are used)
+        images: list of RGB numpy arrays
+        min_face_sizes: minimum face size per image (default: the detector's min_face_size)
+        max_padding: extra area allowed when padding differently sized levels into one batch
+            (default: MTCNN_BATCH_MAX_PADDING; 0 = only batch levels of identical size,
+            results bit-identical to detect_faces)
+        max_batch_pixels: upper bound on pixels per P-Net batch
+        window_batch: candidate windows per R-Net / O-Net call
+
+    Returns:
+        List with one detect_faces()-format face list per image
+    """
+    if max_padding is None:
+        max_padding = DEFAULT_MAX_PADDING
+    if min_face_sizes is None:
+        min_face_sizes = [detector.min_face_size] * len(images)
+    stages = [_Stage(image, min_face_size) for image, min_face_size in zip(images, min_face_sizes)]
+
+    _stage1(detector, stages, max_padding, max_batch_pixels)
+    _stage2(detector, stages, window_batch)
+    _stage3(detector, stages, window_batch)
+
+    return [_to_faces(stage) for stage in stages]
@@ -0,0 +1,111 @@
+import re
+import base64
+import binascii
+import logging
+import numpy as np
+from flask import request
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# รูปแบบการส่ง embeddings: json = รายการตัวเลข (ค่าเริ่มต้น)
+# f32 / f16 = base64 ของไบต์ little-endian float32 / float16 (ขนาด 2.7KB / 1.4KB ต่อ 512 มิติ แทน ~10KB)
+EMBEDDING_ENCODINGS = ('json', 'f32', 'f16')
+
+ENCODING_FIELD = 'embedding_encoding'
+
+_DTYPES = {'f32': np.dtype('<f4'), 'f16': np.dtype('<f2')}
+
+# Accept: application/json; embedding=f16
+_ACCEPT_PATTERN = re.compile(r'embedding\s*=\s*"?(json|f32|f16)"?', re.IGNORECASE)
+
+
+class EmbeddingFormatError(ValueError):
+    """ข้อผิดพลาดของ embedding ที่ส่งมาในคำขอ (ตอบกลับเป็น 400)"""
+    pass
+
+
+def _check_encoding(encoding):
+    encoding = str(encoding).lower()
+    if encoding not in EMBEDDING_ENCODINGS:
+        raise EmbeddingFormatError(f"embedding_encoding ต้องเป็นหนึ่งใน {', '.join(EMBEDDING_ENCODINGS)}")
+    return encoding
+
+
+def request_encoding(data):
+    """
+    เลือกรูปแบบ embeddings ของคำขอนี้ จากฟิลด์ embedding_encoding หรือ header Accept
+    (เช่น "Accept: application/json; embedding=f16") ค่าเริ่มต้นคือ json
+
+    Args:
+        data: พารามิเตอร์ของคำขอจาก get_request_data()
+
+    Returns:
+        encoding: 'json', 'f32' หรือ 'f16'
+    """
+    if data.get(ENCODING_FIELD):
+        return _check_encoding(data[ENCODING_FIELD])
+    match = _ACCEPT_PATTERN.search(request.headers.get('Accept', ''))
+    return match.group(1).lower() if match else 'json'
+
+
+def encode_embedding(embedding, encoding='json'):
+    """
+    แปลง embedding เป็นค่าที่ใส่ใน JSON ได้
+
+    Args:
+        embedding: numpy array (D,) หรือ None
+        encoding: 'json' (รายการตัวเลข), 'f32' หรือ 'f16' (สตริง base64)
+
+    Returns:
+        value: list, str หรือ None
+    """
+    if embedding is None:
+        return None
+    if encoding == 'json':
+        return np.asarray(embedding, dtype=np.float32).tolist()
+    return base64.b64encode(np.asarray(embedding, dtype=_DTYPES[encoding]).tobytes()).decode('ascii')
+
+
+def decode_embedding(value, encoding='f32'):
+    """
+    แปลง embedding จากคำขอเป็น numpy array float32
+
+    Args:
+        value: รายการตัวเลข หรือสตริง base64 ของไบต์ float32 / float16 little-endian
+        encoding: รูปแบบของสตริง base64 ('f32' หรือ 'f16' ค่าอื่นถือเป็น f32)
+
+    Returns:
+        embedding: numpy array (D,) float32
+
+    Raises:
+        EmbeddingFormatError: ถ้าอ่านค่าไม่ได้
+    """
+    if isinstance(value, str):
+        dtype = _DTYPES.get(encoding, _DTYPES['f32'])
+        try:
+            raw = base64.b64decode(value, validate=True)
+        except (binascii.Error, ValueError):
+            raise EmbeddingFormatError("embedding แบบ base64 ไม่ถูกต้อง")
+        if len(raw) == 0 or len(raw) % dtype.itemsize:
+            raise EmbeddingFormatError(f"ขนาดของ embedding ({len(raw)} ไบต์) ไม่ตรงกับ {encoding}")
+        return np.frombuffer(raw, dtype=dtype).astype(np.float32)
+
+    try:
+        embedding = np.asarray(value, dtype=np.float32)
+    except (TypeError, ValueError):
+        raise EmbeddingFormatError("embedding ต้องเป็นรายการตัวเลขหรือสตริง base64")
+    if embedding.ndim != 1 or embedding.size == 0:
+        raise EmbeddingFormatError("embedding ต้องเป็นเวกเตอร์หนึ่งมิติ")
+    return embedding
+
+
+def decode_embeddings(values, encoding='f32'):
+    """แปลงรายการ embeddings จากคำขอเป็นเมทริกซ์ float32 (N, D)"""
+    if not isinstance(values, (list, tuple)) or not values:
+        raise EmbeddingFormatError("embeddings ต้องเป็นรายการที่ไม่ว่าง")
+    embeddings = [decode_embedding(value, encoding) for value in values]
+    if len({len(embedding) for embedding in embeddings}) != 1:
+        raise EmbeddingFormatError("embeddings ทุกตัวต้องมีจำนวนมิติเท่ากัน")
+    return np.stack(embeddings)
@@ -0,0 +1,185 @@
+import base64
+import binascii
+import logging
+import cv2
+import numpy as np
+from flask import request
+from src.utils.metrics import stage
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Content-Type ที่รับเป็นไฟล์รูปภาพดิบใน body ของคำขอ
+RAW_IMAGE_TYPES = ('image/jpeg', 'image/jpg', 'image/png', 'image/webp', 'image/bmp', 'application/octet-stream')
+
+MISSING_IMAGE_MESSAGE = "กรุณาส่งรูปภาพในรูปแบบ Base64, multipart/form-data หรือ image/jpeg, image/png"
+INVALID_IMAGE_MESSAGE = "ไม่สามารถอ่านรูปภาพได้"
+
+
+class ImageInputError(ValueError):
+    """ข้อผิดพลาดจากข้อมูลรูปภาพที่ผู้ใช้ส่งมา (ควรตอบกลับเป็น 400)"""
+
+
+def decode_image_bytes(buffer):
+    """
+    แปลงไบต์ของไฟล์รูปภาพ (JPEG/PNG/...) เป็นรูปภาพ BGR โดยไม่คัดลอกข้อมูลเพิ่ม
+
+    Args:
+        buffer: bytes, bytearray หรือ memoryview ของไฟล์รูปภาพ
+
+    Returns:
+        image: numpy array ของรูปภาพ หรือ None ถ้าอ่านไม่ได้
+    """
+    if buffer is None or len(buffer) == 0:
+        return None
+    img_array = np.frombuffer(buffer, np.uint8)
+    with stage('imdecode'):
+        return cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+
+
+def decode_base64_image(image_data):
+    """
+    แปลง Base64 (รองรับ data URL เช่น data:image/jpeg;base64,...) เป็นรูปภาพ BGR
+
+    Args:
+        image_data: สตริง Base64
+
+    Returns:
+        image: numpy array ของรูปภาพ หรือ None ถ้าอ่านไม่ได้
+    """
+    if not isinstance(image_data, str):
+        return None
+    image_data = image_data.split(',', 1)[1] if ',' in image_data else image_data
+    try:
+        with stage('base64_decode'):
+            img_bytes = base64.b64decode(image_data)
+    except (binascii.Error, ValueError):
+        return None
+    return decode_image_bytes(img_bytes)
+
+
+def decode_image_payload(payload):
+    """
+    แปลงข้อมูลรูปภาพหนึ่งชิ้น ไม่ว่าจะเป็นสตริง Base64 หรือไบต์ของไฟล์ เป็นรูปภาพ BGR
+
+    Returns:
+        image: numpy array ของรูปภาพ หรือ None ถ้าอ่านไม่ได้
+    """
+    if isinstance(payload, str):
+        return decode_base64_image(payload)
+    return decode_image_bytes(payload)
+
+
+def encode_image_base64(image, ext='.jpg'):
+    """
+    แปลงรูปภาพ BGR เป็นสตริง data URL แบบ Base64 (ใช้ส่งภาพใบหน้าที่ตัดแล้วกลับไปยังผู้เรียก)
+
+    Returns:
+        data_url: สตริง data:image/...;base64,... หรือ None ถ้าแปลงไม่ได้
+    """
+    with stage('encode'):
+        ok, buffer = cv2.imencode(ext, image)
+    if not ok:
+        return None
+    mime = 'image/png' if ext == '.png' else 'image/jpeg'
+    return f"data:{mime};base64,{base64.b64encode(buffer).decode('ascii')}"
+
+
+def _file_buffer(file_storage):
+    """อ่านไบต์จากไฟล์ที่อัปโหลดแบบ multipart (ใช้ buffer เดิมถ้า werkzeug เก็บไว้ในหน่วยความจำ)"""
+    stream = file_storage.stream
+    if hasattr(stream, 'getbuffer'):
+        return stream.getbuffer()
+    stream.seek(0)
+    return stream.read()
+
+
+def is_raw_image_request():
+    """ตรวจสอบว่า body ของคำขอเป็นไฟล์รูปภาพดิบหรือไม่"""
+    return request.mimetype in RAW_IMAGE_TYPES
+
+
+def get_request_data():
+    """
+    ดึงพารามิเตอร์อื่น ๆ ของคำขอ (threshold, all_faces, ...) ไม่ว่าจะส่งมาแบบ JSON, form หรือ query string
+
+    Returns:
+        data: dict ของพารามิเตอร์
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        return data if isinstance(data, dict) else {}
+    data = request.args.to_dict()
+    data.update(request.form.to_dict())
+    return data
+
+
+def get_image_payload(field='image'):
+    """
+    ดึงข้อมูลรูปภาพดิบ (ยังไม่ decode) ของฟิลด์ที่กำหนดจากคำขอ
+
+    รองรับ 3 รูปแบบ:
+        - body เป็นไฟล์รูปภาพโดยตรง (Content-Type: image/jpeg, image/png) ใช้ได้เฉพาะฟิลด์ image
+        - multipart/form-data ที่มีไฟล์ชื่อตรงกับฟิลด์
+        - JSON ที่มีฟิลด์เป็นสตริง Base64
+
+    Returns:
+        payload: memoryview/bytes ของไฟล์ หรือสตริง Base64 หรือ None ถ้าไม่มีข้อมูล
+    """
+    if is_raw_image_request():
+        return request.get_data(cache=False) if field == 'image' else None
+
+    if field in request.files:
+        return _file_buffer(request.files[field])
+
+    if field in request.form:
+        return request.form[field]
+
+    return get_request_data().get(field)
+
+
+def has_image(field='image'):
+    """ตรวจสอบว่าคำขอมีรูปภาพในฟิลด์ที่กำหนดหรือไม่ (ไม่อ่าน body ของรูปภาพดิบ)"""
+    if is_raw_image_request():
+        return field == 'image' and (request.content_length or 0) > 0
+    return field in request.files or field in request.form or field in get_request_data()
+
+
+def read_request_image(field='image'):
+    """
+    อ่านและ decode รูปภาพของฟิลด์ที่กำหนดจากคำขอ
+
+    Args:
+        field: ชื่อฟิลด์ของรูปภาพ (เช่น image, image1, image2)
+
+    Returns:
+        image: numpy array ของรูปภาพ BGR
+
+    Raises:
+        ImageInputError: ถ้าไม่มีรูปภาพหรืออ่านรูปภาพไม่ได้
+    """
+    payload = get_image_payload(field)
+    if payload is None:
+        raise ImageInputError(MISSING_IMAGE_MESSAGE)
+
+    image = decode_image_payload(payload)
+    if image is None:
+        raise ImageInputError(INVALID_IMAGE_MESSAGE)
+    return image
+
+
+def get_image_payloads(field='images'):
+    """
+    ดึงข้อมูลรูปภาพหลายรูป (ยังไม่ decode) จาก multipart (หลายไฟล์ชื่อเดียวกัน) หรือ JSON list
+
+    Returns:
+        payloads: รายการข้อมูลรูปภาพ หรือ None ถ้าไม่มีข้อมูล
+    """
+    if field in request.files:
+        return [_file_buffer(f) for f in request.files.getlist(field)]
+
+    payloads = get_request_data().get(field)
+    if not isinstance(payloads, list):
+        return None
+    return payloads
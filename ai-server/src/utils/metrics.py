@@ -0,0 +1,251 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from contextvars import ContextVar
+
+# ตั้งค่า logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# เปิด/ปิดการเก็บ metrics ทั้งหมด (ปิดแล้ว stage() คืนตัวจับเวลาเปล่า การ observe จบทันที และไม่มี /metrics)
+ENABLED = os.environ.get('AI_SERVER_METRICS', '1').lower() not in ('0', 'false', 'no')
+
+# แนบ header Server-Timing (เวลาของแต่ละขั้นตอนในคำขอนั้น) กับทุกคำตอบ
+# (ถ้าปิด client ขอเป็นรายคำขอได้ด้วย header X-Server-Timing: 1)
+SERVER_TIMING = os.environ.get('AI_SERVER_SERVER_TIMING', '0').lower() in ('1', 'true', 'yes')
+
+# ขอบเขต bucket ของ histogram เวลา (วินาที)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ขอบเขต bucket ของ histogram ขนาด batch และจำนวนใบหน้าต่อรูป
+SIZE_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_registry = []
+_collectors = []
+_request_timings = ContextVar('request_timings', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """ตัวนับที่เพิ่มขึ้นอย่างเดียว แยกตามชุดค่า label"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def expose(self):
+        with self._lock:
+            values = list(self._values.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for label_values, value in values:
+            lines.append(f'{self.name}{_format_labels(list(zip(self.labels, label_values)))} {value}')
+        return lines
+
+
+class Histogram:
+    """histogram แบบ bucket คงที่ (รูปแบบเดียวกับ Prometheus) แยกตามชุดค่า label"""
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        if not ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def expose(self):
+        with self._lock:
+            series = [(label_values, list(counts), total) for label_values, (counts, total) in self._series.items()]
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values, counts, total in series:
+            pairs = list(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{self.name}_bucket{_format_labels(pairs + [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(pairs)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(pairs)} {cumulative}')
+        return lines
+
+
+STAGE_SECONDS = Histogram('ai_server_stage_seconds', 'Time spent in each processing stage', ('stage',))
+REQUEST_SECONDS = Histogram('ai_server_request_duration_seconds', 'Request latency by endpoint',
+                            ('method', 'endpoint'))
+REQUESTS = Counter('ai_server_requests_total', 'Requests by endpoint and status', ('method', 'endpoint', 'status'))
+BATCH_SIZE = Histogram('ai_server_batch_size', 'Items per model call', ('model',), buckets=SIZE_BUCKETS)
+FACES_PER_IMAGE = Histogram('ai_server_faces_per_image', 'Faces detected per image', ('detector',),
+                            buckets=SIZE_BUCKETS)
+
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.name, time.perf_counter() - self.start)
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+def stage(name):
+    """
+    ตัวจับเวลาของขั้นตอนหนึ่ง ใช้กับ with (เวลาถูกบันทึกแม้ขั้นตอนจะ raise)
+
+    Args:
+        name: ชื่อขั้นตอน (เช่น 'decode', 'detect', 'facenet')
+
+    Returns:
+        context manager ที่บันทึกเวลาลง ai_server_stage_seconds และ Server-Timing ของคำขอปัจจุบัน
+    """
+    return _Stage(name) if ENABLED else _NOOP_STAGE
+
+
+def record_stage(name, seconds):
+    """บันทึกเวลาของขั้นตอนที่จับเวลาไว้เอง (วินาที)"""
+    if not ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def register_collector(collector):
+    """
+    ลงทะเบียนฟังก์ชันที่อ่านค่าตอน scrape (สำหรับสถิติที่ service เก็บไว้เองอยู่แล้ว เช่นแคชและคิว)
+
+    Args:
+        collector: ฟังก์ชันที่คืนรายการ (ชื่อ, ชนิด 'gauge'/'counter', คำอธิบาย, [(dict ของ label, ค่า), ...])
+            (ลงทะเบียนซ้ำได้ เช่นเมื่อสร้าง app หลายครั้ง จะถูกเก็บไว้ครั้งเดียว)
+    """
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+def expose():
+    """metrics ทั้งหมดในรูปแบบข้อความของ Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.expose())
+    for collector in _collectors:
+        try:
+            families = collector()
+        except Exception as e:
+            logger.warning(f"อ่าน metrics จาก {getattr(collector, '__name__', collector)} ไม่ได้: {e}")
+            continue
+        for name, kind, documentation, samples in families:
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(list(labels.items()))} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def server_timing_header(timings, total):
+    """สร้างค่า header Server-Timing จากเวลาของแต่ละขั้นตอน (วินาที)"""
+    entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items()]
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def init_app(app):
+    """
+    ติดตั้ง metrics กับ Flask app: เวลาและจำนวนคำขอต่อ endpoint, เวลา serialize JSON,
+    header Server-Timing และ endpoint /metrics (ไม่ทำอะไรถ้าปิด AI_SERVER_METRICS)
+    """
+    if not ENABLED:
+        return
+    from flask import Response, g, request
+    from flask.json.provider import DefaultJSONProvider
+
+    class TimedJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            with stage('serialize'):
+                return super().dumps(obj, **kwargs)
+
+    app.json_provider_class = TimedJSONProvider
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def _start_request():
+        g.metrics_start = time.perf_counter()
+        if SERVER_TIMING or request.headers.get('X-Server-Timing') == '1':
+            g.metrics_token = _request_timings.set({})
+
+    @app.after_request
+    def _finish_request(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        total = time.perf_counter() - start
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(total, request.method, endpoint)
+        REQUESTS.inc(request.method, endpoint, str(response.status_code))
+        timings = _request_timings.get()
+        if timings is not None:
+            response.headers['Server-Timing'] = server_timing_header(timings, total)
+        return response
+
+    @app.teardown_request
+    def _reset_request(exc):
+        token = g.pop('metrics_token', None)
+        if token is not None:
+            _request_timings.reset(token)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """metrics ของ worker นี้ในรูปแบบข้อความของ Prometheus"""
+        return Response(expose(), content_type=CONTENT_TYPE)
@@ -1,71 +1,303 @@
 import cv2
 import numpy as np
+import time
 import logging
+import threading
 
 # ตั้งค่า logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def preprocess_face(img, required_size=(160, 160)):
+# โปรไฟล์การ preprocess
+#   quality: พฤติกรรมเดิม - CLAHE บนภาพความละเอียดเต็ม, bilateral filter 9 pixel แล้วจึงปรับขนาด
+#   fast: ปรับขนาดก่อน, CLAHE บนช่องความสว่างโดยแปลงสีครั้งเดียว และไม่ใช้ bilateral filter
+PREPROCESS_PROFILES = ('quality', 'fast')
+
+# เก็บ CLAHE object แยกตาม thread (createCLAHE มีต้นทุน และ object เดียวกันใช้ข้าม thread ไม่ได้อย่างปลอดภัย)
+_thread_state = threading.local()
+
+# การจัดแนวหน่วยความจำที่ TensorFlow ต้องการเพื่อใช้ buffer ของ numpy ได้โดยไม่คัดลอก
+TENSOR_ALIGNMENT = 64
+
+# การจัดแนวใบหน้าก่อนสร้าง embedding
+#   none: ตัด crop ตามกรอบ + margin แล้ว preprocess (พฤติกรรมเดิม)
+#   similarity: similarity transform จาก 5 landmarks ไปยังตำแหน่งมาตรฐาน ด้วย warpAffine ครั้งเดียวจากภาพต้นฉบับ
+ALIGNMENT_MODES = ('none', 'similarity')
+
+# ชื่อและลำดับของ 5 landmarks จาก MTCNN / YuNet
+LANDMARK_NAMES = ('left_eye', 'right_eye', 'nose', 'mouth_left', 'mouth_right')
+
+# ตำแหน่งมาตรฐานของ 5 landmarks บนภาพ 112x112 (แม่แบบของ ArcFace)
+_REFERENCE_LANDMARKS_112 = np.array([
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [41.5493, 92.3655],
+    [70.7299, 92.2041],
+], dtype=np.float32)
+
+# สัดส่วนของแม่แบบต่อภาพผลลัพธ์ (< 1 เว้นขอบรอบใบหน้า ใกล้เคียงกับ crop + margin ที่ FaceNet ถูกฝึกมา)
+ALIGNMENT_TEMPLATE_SCALE = 0.8
+
+def aligned_empty(shape, dtype=np.float32, alignment=TENSOR_ALIGNMENT):
     """
-    แปลงภาพใบหน้าให้พร้อมสำหรับการวิเคราะห์
-    
-    Args:
-        img: ภาพใบหน้า
-        required_size: ขนาดที่ต้องการ (default: 160x160)
-        
+    จอง numpy array ที่ที่อยู่เริ่มต้นจัดแนวตาม alignment ไบต์ (ส่งต่อให้ TensorFlow ผ่าน DLPack ได้โดยไม่คัดลอก)
+
     Returns:
-        preprocessed_face: ภาพที่ผ่านการแปลงแล้ว หรือ None ในกรณีที่มีข้อผิดพลาด
+        array: numpy array ที่ยังไม่กำหนดค่า
     """
-    try:
-        # ตรวจสอบว่า img ไม่เป็น None และมีข้อมูล
-        if img is None or img.size == 0:
-            logger.error("ภาพใบหน้าเป็น None หรือไม่มีข้อมูล")
-            return None
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    buffer = np.empty(nbytes + alignment, dtype=np.uint8)
+    offset = (-buffer.ctypes.data) % alignment
+    return buffer[offset:offset + nbytes].view(dtype).reshape(shape)
+
+def _get_clahe():
+    clahe = getattr(_thread_state, 'clahe', None)
+    if clahe is None:
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        _thread_state.clahe = clahe
+    return clahe
+
+class FacePreprocessor:
+    """
+    แปลงภาพใบหน้าให้พร้อมสำหรับ FaceNet ตามโปรไฟล์ที่เลือก และเก็บเวลาที่ใช้ในแต่ละขั้นตอน
+
+    ผลลัพธ์ถูกเขียนลงใน tensor float32 ที่จองไว้ล่วงหน้าได้โดยตรง จึงไม่ต้อง np.stack ภายหลัง
+    """
+
+    def __init__(self, profile='quality', required_size=(160, 160)):
+        """
+        เริ่มต้น FacePreprocessor
+
+        Args:
+            profile: 'quality' (ค่าเริ่มต้น, เหมือน preprocess_face เดิม) หรือ 'fast'
+            required_size: ขนาดภาพผลลัพธ์ (กว้าง, สูง)
+        """
+        if profile not in PREPROCESS_PROFILES:
+            raise ValueError(f"ไม่รู้จักโปรไฟล์ preprocess: {profile} (รองรับ {', '.join(PREPROCESS_PROFILES)})")
+        self.profile = profile
+        self.required_size = required_size
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def _record(self, timings):
+        with self._lock:
+            for stage, seconds in timings:
+                total = self._timings.setdefault(stage, [0, 0.0])
+                total[0] += 1
+                total[1] += seconds
+
+    def stage_timings(self, reset=False):
+        """
+        เวลาเฉลี่ยของแต่ละขั้นตอน
+
+        Args:
+            reset: ล้างสถิติหลังอ่าน
+
+        Returns:
+            timings: dict ของ {ขั้นตอน: {'count': จำนวนครั้ง, 'avg_ms': เวลาเฉลี่ย, 'total_ms': เวลารวม}}
+        """
+        with self._lock:
+            report = {
+                stage: {'count': count, 'avg_ms': 1000.0 * seconds / count, 'total_ms': 1000.0 * seconds}
+                for stage, (count, seconds) in self._timings.items()
+            }
+            if reset:
+                self._timings = {}
+        return report
+
+    def preprocess(self, img, out=None, required_size=None):
+        """
+        แปลงภาพใบหน้าหนึ่งภาพ
+
+        Args:
+            img: ภาพใบหน้า (BGR, grayscale หรือ 4 channels)
+            out: array float32 (สูง, กว้าง, 3) สำหรับเขียนผลลัพธ์ (ถ้าไม่ระบุจะจองใหม่)
+            required_size: ขนาดภาพผลลัพธ์ (ถ้าไม่ระบุใช้ค่าของ preprocessor)
+
+        Returns:
+            preprocessed_face: ภาพที่อยู่ในช่วง [-1, 1] หรือ None ในกรณีที่มีข้อผิดพลาด
+        """
+        try:
+            # ตรวจสอบว่า img ไม่เป็น None และมีข้อมูล
+            if img is None or img.size == 0:
+                logger.error("ภาพใบหน้าเป็น None หรือไม่มีข้อมูล")
+                return None
+                
+            # ตรวจสอบขนาดรูปภาพ
+            if img.shape[0] == 0 or img.shape[1] == 0:
+                logger.error(f"รูปภาพมีขนาดไม่ถูกต้อง: {img.shape}")
+                return None
             
-        # ตรวจสอบขนาดรูปภาพ
-        if img.shape[0] == 0 or img.shape[1] == 0:
-            logger.error(f"รูปภาพมีขนาดไม่ถูกต้อง: {img.shape}")
-            return None
+            required_size = required_size or self.required_size
+            # ตรวจสอบว่า required_size เป็น tuple ที่ถูกต้อง
+            if not isinstance(required_size, tuple) or len(required_size) != 2:
+                logger.warning(f"required_size ไม่ถูกต้อง: {required_size}, ใช้ค่าเริ่มต้น (160, 160)")
+                required_size = (160, 160)
             
-        # ตรวจสอบว่า required_size เป็น tuple ที่ถูกต้อง
-        if not isinstance(required_size, tuple) or len(required_size) != 2:
-            logger.warning(f"required_size ไม่ถูกต้อง: {required_size}, ใช้ค่าเริ่มต้น (160, 160)")
-            required_size = (160, 160)
+            if out is None:
+                out = np.empty((required_size[1], required_size[0], 3), dtype=np.float32)
             
-        # แปลงเป็น RGB ถ้าจำเป็น
-        if len(img.shape) == 2:  # Grayscale
-            img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
-        elif img.shape[2] == 4:  # RGBA
-            img = cv2.cvtColor(img, cv2.COLOR_RGBA2RGB)
+            timings = []
+            clock = time.perf_counter()
             
-        # เพิ่มขั้นตอนการปรับแสงและปรับคอนทราสต์
-        # ใช้ CLAHE (Contrast Limited Adaptive Histogram Equalization)
-        # เป็นวิธีที่ดีกว่าการปรับ histogram ทั้งภาพเพราะสามารถรักษารายละเอียดได้ดีกว่า
-        img_yuv = cv2.cvtColor(img, cv2.COLOR_BGR2YUV)
-        
-        # สร้าง CLAHE object สำหรับปรับความสว่าง/คอนทราสต์
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        img_yuv[:,:,0] = clahe.apply(img_yuv[:,:,0])
-        
-        # แปลงกลับไปเป็น BGR
-        img = cv2.cvtColor(img_yuv, cv2.COLOR_YUV2BGR)
-        
-        # ลด noise ด้วย Bilateral Filter ซึ่งลด noise แต่รักษาขอบของวัตถุไว้
-        img = cv2.bilateralFilter(img, 9, 75, 75)
-        
-        # ปรับขนาด
-        img = cv2.resize(img, (required_size[0], required_size[1]))
+            # แปลงเป็น RGB ถ้าจำเป็น
+            if len(img.shape) == 2:  # Grayscale
+                img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+            elif img.shape[2] == 4:  # RGBA
+                img = cv2.cvtColor(img, cv2.COLOR_RGBA2RGB)
+            now = time.perf_counter()
+            timings.append(('convert', now - clock))
+            clock = now
+            
+            if self.profile == 'fast':
+                # ปรับขนาดก่อน ทุกขั้นตอนถัดไปจึงทำงานบนภาพ 160x160 เท่านั้น
+                shrinking = img.shape[1] > required_size[0] or img.shape[0] > required_size[1]
+                img = cv2.resize(img, (required_size[0], required_size[1]),
+                                 interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR)
+                now = time.perf_counter()
+                timings.append(('resize', now - clock))
+                clock = now
+                
+                # CLAHE บนช่องความสว่าง: Y ของ YUV คือค่า grayscale และการแปลง YUV กลับเป็น BGR
+                # เท่ากับการบวกผลต่างของ Y เข้าทุก channel จึงแปลงสีเพียงครั้งเดียว
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                delta = _get_clahe().apply(gray).astype(np.float32) - gray
+                out[...] = img
+                out += delta[:, :, np.newaxis]
+                np.clip(out, 0, 255, out=out)
+                now = time.perf_counter()
+                timings.append(('clahe', now - clock))
+                clock = now
+            else:
+                # เพิ่มขั้นตอนการปรับแสงและปรับคอนทราสต์
+                # ใช้ CLAHE (Contrast Limited Adaptive Histogram Equalization)
+                # เป็นวิธีที่ดีกว่าการปรับ histogram ทั้งภาพเพราะสามารถรักษารายละเอียดได้ดีกว่า
+                img_yuv = cv2.cvtColor(img, cv2.COLOR_BGR2YUV)
+                img_yuv[:,:,0] = _get_clahe().apply(img_yuv[:,:,0])
+                
+                # แปลงกลับไปเป็น BGR
+                img = cv2.cvtColor(img_yuv, cv2.COLOR_YUV2BGR)
+                now = time.perf_counter()
+                timings.append(('clahe', now - clock))
+                clock = now
+                
+                # ลด noise ด้วย Bilateral Filter ซึ่งลด noise แต่รักษาขอบของวัตถุไว้
+                img = cv2.bilateralFilter(img, 9, 75, 75)
+                now = time.perf_counter()
+                timings.append(('bilateral', now - clock))
+                clock = now
+                
+                # ปรับขนาด
+                img = cv2.resize(img, (required_size[0], required_size[1]))
+                out[...] = img
+                now = time.perf_counter()
+                timings.append(('resize', now - clock))
+                clock = now
+            
+            # แปลงให้อยู่ในช่วง [-1, 1] ((x - 127.5) / 128 คำนวณในที่เดิม ได้ค่าเท่ากันทุกบิต)
+            out *= 1.0 / 128.0
+            out -= 127.5 / 128.0
+            timings.append(('normalize', time.perf_counter() - clock))
+            self._record(timings)
+            
+            return out
+            
+        except Exception as e:
+            logger.error(f"เกิดข้อผิดพลาดในการ preprocess ใบหน้า: {str(e)}")
+            return None
+
+    def preprocess_batch(self, imgs, out=None, required_size=None):
+        """
+        แปลงภาพใบหน้าหลายภาพลงใน batch tensor เดียว
+
+        Args:
+            imgs: รายการภาพใบหน้า
+            out: array float32 (N, สูง, กว้าง, 3) ที่จองไว้ (ถ้าไม่ระบุจะจองใหม่)
+            required_size: ขนาดภาพผลลัพธ์ (ถ้าไม่ระบุใช้ค่าของ preprocessor)
+
+        Returns:
+            batch: tensor (M, สูง, กว้าง, 3) ของภาพที่ preprocess สำเร็จ (ต่อกันเรียงตามลำดับเดิม)
+            valid: รายการดัชนีของภาพใน imgs ที่ preprocess สำเร็จ
+        """
+        width, height = required_size or self.required_size
+        if out is None:
+            out = aligned_empty((len(imgs), height, width, 3))
         
-        # แปลงให้อยู่ในช่วง [-1, 1]
-        img = img.astype(np.float32)
-        img = (img - 127.5) / 128.0
+        valid = []
+        for i, img in enumerate(imgs):
+            if img is None:
+                continue
+            # เขียนลงตำแหน่งถัดไปของ tensor ภาพที่ล้มเหลวจะถูกเขียนทับด้วยภาพถัดไป
+            if self.preprocess(img, out=out[len(valid)], required_size=(width, height)) is not None:
+                valid.append(i)
         
-        return img
+        return out[:len(valid)], valid
+
+    def preprocess_aligned(self, img, landmarks_list, out=None, required_size=None):
+        """
+        จัดแนวและแปลงทุกใบหน้าในภาพเดียวลงใน batch tensor เดียว
+
+        แต่ละใบหน้าใช้ warpAffine ครั้งเดียวจากภาพต้นฉบับไปยังขนาดผลลัพธ์ (แทนการตัด หมุน
+        bilateral filter และปรับขนาดแยกกัน) แล้วปรับ CLAHE บนช่องความสว่างของภาพขนาดเล็ก
+
+        Args:
+            img: ภาพต้นฉบับทั้งภาพ (BGR, grayscale หรือ 4 channels)
+            landmarks_list: รายการ keypoints ของแต่ละใบหน้า (dict ตาม LANDMARK_NAMES)
+            out: array float32 (N, สูง, กว้าง, 3) ที่จองไว้ (ถ้าไม่ระบุจะจองใหม่)
+            required_size: ขนาดภาพผลลัพธ์ (ถ้าไม่ระบุใช้ค่าของ preprocessor)
+
+        Returns:
+            batch: tensor (M, สูง, กว้าง, 3) ของใบหน้าที่จัดแนวสำเร็จ (ช่วง [-1, 1] เรียงตามลำดับเดิม)
+            valid: รายการดัชนีของใบหน้าใน landmarks_list ที่จัดแนวสำเร็จ
+        """
+        width, height = required_size or self.required_size
+        if out is None:
+            out = aligned_empty((len(landmarks_list), height, width, 3))
+
+        clock = time.perf_counter()
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        elif img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        aligned, valid = align_faces(img, landmarks_list, (width, height))
+        now = time.perf_counter()
+        timings = [('warp', now - clock)]
+        clock = now
+
+        for j, face in enumerate(aligned):
+            # CLAHE บนช่องความสว่างแบบเดียวกับโปรไฟล์ fast (แปลงสีครั้งเดียว)
+            gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+            delta = _get_clahe().apply(gray).astype(np.float32) - gray
+            out[j] = face
+            out[j] += delta[:, :, np.newaxis]
+        batch = out[:len(valid)]
+        np.clip(batch, 0, 255, out=batch)
+        now = time.perf_counter()
+        timings.append(('clahe', now - clock))
+        clock = now
+
+        batch *= 1.0 / 128.0
+        batch -= 127.5 / 128.0
+        timings.append(('normalize', time.perf_counter() - clock))
+        self._record(timings)
+        return batch, valid
+
+_default_preprocessor = FacePreprocessor('quality')
+
+def preprocess_face(img, required_size=(160, 160)):
+    """
+    แปลงภาพใบหน้าให้พร้อมสำหรับการวิเคราะห์ (โปรไฟล์ quality)
+    
+    Args:
+        img: ภาพใบหน้า
+        required_size: ขนาดที่ต้องการ (default: 160x160)
         
-    except Exception as e:
-        logger.error(f"เกิดข้อผิดพลาดในการ preprocess ใบหน้า: {str(e)}")
-        return None
+    Returns:
+        preprocessed_face: ภาพที่ผ่านการแปลงแล้ว หรือ None ในกรณีที่มีข้อผิดพลาด
+    """
+    return _default_preprocessor.preprocess(img, required_size=required_size)
 
 def extract_face(img, face_box, margin=20):
     """
@@ -183,6 +415,105 @@ def align_face(img, landmarks):
         logger.error(f"เกิดข้อผิดพลาดในการจัดใบหน้าให้ตรง: {str(e)}")
         return img  # ส่งคืนภาพเดิมในกรณีที่มีข้อผิดพลาด
 
+def landmark_template(size=(160, 160), scale=ALIGNMENT_TEMPLATE_SCALE):
+    """
+    ตำแหน่งเป้าหมายของ 5 landmarks บนภาพผลลัพธ์ขนาด size (กว้าง, สูง)
+
+    Returns:
+        template: numpy array (5, 2) ของพิกัด (x, y)
+    """
+    template = (_REFERENCE_LANDMARKS_112 / 112.0 - 0.5) * scale + 0.5
+    return template * np.array(size, dtype=np.float32)
+
+def similarity_transforms(src, dst):
+    """
+    หา similarity transform (หมุน + ย่อ/ขยายเท่ากันทุกทิศ + เลื่อน) ที่ส่ง src ไปใกล้ dst ที่สุดแบบ least squares
+    สำหรับหลายใบหน้าพร้อมกัน (ผลเท่ากับวิธีของ Umeyama โดยไม่อนุญาตการสะท้อน)
+
+    Args:
+        src: numpy array (N, K, 2) ของ landmarks แต่ละใบหน้า
+        dst: numpy array (K, 2) ของตำแหน่งเป้าหมาย
+
+    Returns:
+        matrices: numpy array (N, 2, 3) สำหรับ cv2.warpAffine (NaN ถ้า landmarks ซ้อนกันทั้งหมด)
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    src_mean = src.mean(axis=1, keepdims=True)
+    dst_mean = dst.mean(axis=0)
+    src_c = src - src_mean
+    dst_c = dst - dst_mean
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (src_c ** 2).sum(axis=(1, 2))
+        a = (src_c * dst_c).sum(axis=(1, 2)) / variance
+        b = (src_c[:, :, 0] * dst_c[:, 1] - src_c[:, :, 1] * dst_c[:, 0]).sum(axis=1) / variance
+
+    matrices = np.empty((len(src), 2, 3))
+    matrices[:, 0, 0] = a
+    matrices[:, 0, 1] = -b
+    matrices[:, 1, 0] = b
+    matrices[:, 1, 1] = a
+    matrices[:, :, 2] = dst_mean - np.einsum('nij,nj->ni', matrices[:, :, :2], src_mean[:, 0])
+    return matrices
+
+def align_faces(img, landmarks_list, size=(160, 160)):
+    """
+    จัดแนวทุกใบหน้าในภาพด้วย 5 landmarks ไปยังภาพขนาด size โดยตรงจากภาพต้นฉบับ
+
+    ใบหน้าที่ต้องย่อมากกว่า 2 เท่าจะถูกย่อเฉพาะบริเวณใบหน้าด้วย INTER_AREA ก่อน warp
+    เพื่อไม่ให้เกิด aliasing จากการสุ่มตัวอย่างแบบ bilinear
+
+    Args:
+        img: ภาพต้นฉบับ BGR
+        landmarks_list: รายการ keypoints ของแต่ละใบหน้า (dict ตาม LANDMARK_NAMES)
+        size: ขนาดผลลัพธ์ (กว้าง, สูง)
+
+    Returns:
+        aligned: numpy array uint8 (M, สูง, กว้าง, 3) ของใบหน้าที่จัดแนวสำเร็จ
+        valid: รายการดัชนีของใบหน้าใน landmarks_list ที่จัดแนวสำเร็จ
+    """
+    width, height = size
+    valid, points = [], []
+    for i, landmarks in enumerate(landmarks_list):
+        if landmarks and all(name in landmarks for name in LANDMARK_NAMES):
+            valid.append(i)
+            points.append([landmarks[name] for name in LANDMARK_NAMES])
+    if not valid:
+        return np.empty((0, height, width, 3), dtype=np.uint8), []
+
+    matrices = similarity_transforms(np.array(points, dtype=np.float64), landmark_template(size))
+    aligned = np.empty((len(valid), height, width, 3), dtype=np.uint8)
+    img_height, img_width = img.shape[:2]
+    corners = np.array([[0, 0, 1], [width, 0, 1], [0, height, 1], [width, height, 1]], dtype=np.float64)
+
+    kept = []
+    for j, matrix in enumerate(matrices):
+        scale = float(np.hypot(matrix[0, 0], matrix[1, 0]))
+        if not np.isfinite(scale) or scale <= 0:
+            continue
+        source = img
+        if scale < 0.5:
+            # บริเวณของภาพต้นฉบับที่ warp ใช้ (มุมทั้งสี่ของผลลัพธ์ที่แปลงกลับ)
+            inverse = cv2.invertAffineTransform(matrix)
+            region = corners @ inverse.T
+            x0, y0 = np.floor(region.min(axis=0)).astype(int)
+            x1, y1 = np.ceil(region.max(axis=0)).astype(int)
+            x0, y0 = max(0, x0), max(0, y0)
+            x1, y1 = min(img_width, x1), min(img_height, y1)
+            if x1 - x0 >= 2 and y1 - y0 >= 2:
+                factor = 2 * scale
+                source = cv2.resize(img[y0:y1, x0:x1], (max(1, round((x1 - x0) * factor)),
+                                                        max(1, round((y1 - y0) * factor))),
+                                    interpolation=cv2.INTER_AREA)
+                fx, fy = source.shape[1] / (x1 - x0), source.shape[0] / (y1 - y0)
+                # พิกัดในภาพที่ย่อแล้ว p' ตรงกับ p = (p'.x / fx + x0, p'.y / fy + y0) ในภาพต้นฉบับ
+                matrix = np.hstack([matrix[:, :2] / [fx, fy], (matrix[:, :2] @ [x0, y0] + matrix[:, 2])[:, None]])
+        cv2.warpAffine(source, matrix, (width, height), dst=aligned[len(kept)], flags=cv2.INTER_LINEAR,
+                       borderMode=cv2.BORDER_REPLICATE)
+        kept.append(valid[j])
+    return aligned[:len(kept)], kept
+
 def crop_and_resize_multiple_faces(img, faces, margin=20, required_size=(160, 160)):
     """
     ตัดและปรับขนาดใบหน้าหลายใบในภาพเดียว
@@ -0,0 +1,150 @@
+import cv2
+import numpy as np
+from src.utils.metrics import stage
+
+# ขนาดมาตรฐานที่ใช้ย่อ/ขยาย crop ทุกใบก่อนคำนวณคุณภาพแบบ batch
+# variance ของ Laplacian ขึ้นกับความละเอียด ความคมชัดที่วัดบนภาพ 112 พิกเซลจึงไม่เท่ากับที่วัดบน crop ขนาดจริง
+# endpoint รูปเดียว (/quality, /embeddings, /analyze, /identify) จึงวัดบน crop ขนาดจริงเหมือนเดิม (size=None)
+QUALITY_SIZE = 112
+
+# ค่าที่ใช้แปลงค่าวัดเป็นคะแนน 0-100 (ความสว่าง, ความคมชัด, คอนทราสต์)
+BRIGHTNESS_SCALE = 128.0
+SHARPNESS_SCALE = 500.0
+CONTRAST_SCALE = 80.0
+
+# เกณฑ์ที่ใช้ให้คำแนะนำ
+DARK_THRESHOLD = 50
+BRIGHT_THRESHOLD = 200
+BLUR_THRESHOLD = 100
+LOW_CONTRAST_THRESHOLD = 20
+
+NO_FACE_FEEDBACK = "ไม่พบใบหน้าในภาพ"
+GOOD_QUALITY_FEEDBACK = "คุณภาพภาพดี เหมาะสำหรับการจดจำใบหน้า"
+
+
+def quality_score(brightness, sharpness, contrast):
+    """
+    แปลงค่าวัด (scalar หรือ numpy array) เป็นคะแนนคุณภาพ 0-100 (ค่าเฉลี่ยของทั้งสามด้าน)
+    """
+    scores = (
+        np.clip(100 * (np.asarray(brightness, dtype=np.float32) / BRIGHTNESS_SCALE), 0, 100)
+        + np.clip(100 * (np.asarray(sharpness, dtype=np.float32) / SHARPNESS_SCALE), 0, 100)
+        + np.clip(100 * (np.asarray(contrast, dtype=np.float32) / CONTRAST_SCALE), 0, 100)
+    )
+    return scores / 3
+
+
+def quality_feedback(brightness, sharpness, contrast):
+    """
+    สร้างคำแนะนำ (ภาษาไทย) จากค่าวัดของใบหน้าหนึ่งใบ
+
+    Returns:
+        feedback: คำแนะนำคั่นด้วย comma
+    """
+    feedback = []
+    if brightness < DARK_THRESHOLD:
+        feedback.append("ภาพมืดเกินไป เพิ่มแสงสว่าง")
+    elif brightness > BRIGHT_THRESHOLD:
+        feedback.append("ภาพสว่างเกินไป ลดแสงลง")
+    if sharpness < BLUR_THRESHOLD:
+        feedback.append("ภาพไม่คมชัด อาจเป็นเพราะกล้องเคลื่อนไหวหรือโฟกัสไม่ดี")
+    if contrast < LOW_CONTRAST_THRESHOLD:
+        feedback.append("ภาพมีคอนทราสต์ต่ำ อาจทำให้ยากต่อการจดจำ")
+
+    # ถ้าไม่มีปัญหา
+    if not feedback:
+        feedback.append(GOOD_QUALITY_FEEDBACK)
+    return ", ".join(feedback)
+
+
+def quality_metrics(face_img):
+    """
+    ค่าวัดคุณภาพของใบหน้าหนึ่งใบบน crop ขนาดจริง (ความหมายเดียวกับ FaceRecognition.quality_assessment เดิม)
+
+    Returns:
+        brightness, sharpness, contrast: ค่าวัดแต่ละด้าน (float)
+    """
+    brightness = np.mean(face_img)
+    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY) if face_img.ndim > 2 else face_img
+    sharpness = np.var(cv2.Laplacian(gray, cv2.CV_64F))
+    contrast = gray.std()
+    return float(brightness), float(sharpness), float(contrast)
+
+
+def _stack_faces(face_imgs, size):
+    """ย่อ/ขยาย crop ทุกใบเป็นขนาดเดียวกันแล้วรวมเป็น array (N, size, size, 3) ชนิด uint8"""
+    batch = np.empty((len(face_imgs), size, size, 3), dtype=np.uint8)
+    for i, face_img in enumerate(face_imgs):
+        if face_img.ndim == 2:
+            face_img = cv2.cvtColor(face_img, cv2.COLOR_GRAY2BGR)
+        # INTER_LINEAR เร็วกว่า INTER_AREA หลายเท่าเมื่ออัตราส่วนไม่ลงตัว และเพียงพอสำหรับค่าวัดคุณภาพ
+        cv2.resize(face_img, (size, size), dst=batch[i], interpolation=cv2.INTER_LINEAR)
+    return batch
+
+
+def quality_metrics_batch(face_imgs, size=QUALITY_SIZE):
+    """
+    คำนวณค่าวัดคุณภาพของใบหน้าหลายใบพร้อมกัน (float32, แปลงเป็นภาพขาวดำครั้งเดียว)
+
+    Args:
+        face_imgs: รายการภาพใบหน้าที่ตัดมาแล้ว (BGR หรือขาวดำ ขนาดต่างกันได้ ห้ามเป็น None)
+        size: ขนาดมาตรฐานที่ย่อ/ขยาย crop ก่อนคำนวณ
+
+    Returns:
+        brightness, sharpness, contrast: numpy array ขนาด (N,) ของแต่ละค่าวัด
+    """
+    if len(face_imgs) == 0:
+        empty = np.zeros(0, dtype=np.float32)
+        return empty, empty, empty
+
+    batch = _stack_faces(face_imgs, size)
+
+    # ความสว่าง: ค่าเฉลี่ยของทุกช่องสี
+    brightness = batch.reshape(len(batch), -1).mean(axis=1, dtype=np.float32)
+
+    # ภาพขาวดำของทั้ง batch ในครั้งเดียว (ต่อทุกภาพเป็นภาพสูงภาพเดียวแล้วแปลงด้วย cvtColor)
+    gray = cv2.cvtColor(batch.reshape(-1, size, 3), cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    # ความคมชัด: variance ของ Laplacian ของภาพสูงภาพเดียว โดยใช้เฉพาะพิกเซลด้านในของแต่ละภาพ
+    # (แถวขอบบน/ล่างของแต่ละภาพจะปนกับภาพข้างเคียง จึงตัดทิ้ง)
+    laplacian = cv2.Laplacian(gray, cv2.CV_32F).reshape(len(batch), size, size)[:, 1:-1, 1:-1]
+    sharpness = laplacian.reshape(len(batch), -1).var(axis=1)
+
+    # คอนทราสต์: ส่วนเบี่ยงเบนมาตรฐานของภาพขาวดำ
+    contrast = gray.reshape(len(batch), -1).std(axis=1)
+
+    return brightness, sharpness, contrast
+
+
+def quality_assessment_batch(face_imgs, with_feedback=True, size=QUALITY_SIZE):
+    """
+    ประเมินคุณภาพของภาพใบหน้าหลายใบพร้อมกัน (ไม่ต้องใช้โมเดล จึงไม่ต้องโหลด FaceNet)
+
+    Args:
+        face_imgs: รายการภาพใบหน้าที่ตัดมาแล้ว (รายการที่เป็น None ได้คะแนน 0)
+        with_feedback: สร้างคำแนะนำด้วยหรือไม่ (False = คืนเฉพาะคะแนน)
+        size: ขนาดมาตรฐานที่ใช้คำนวณแบบ vectorized (None = วัดทีละใบบน crop ขนาดจริง
+            ได้คะแนนและคำแนะนำตรงกับ quality_assessment เดิม)
+
+    Returns:
+        scores: numpy array (N,) ของคะแนนคุณภาพ 0-100
+        feedback: รายการคำแนะนำของแต่ละใบ หรือ None ถ้า with_feedback=False
+    """
+    valid = [i for i, face_img in enumerate(face_imgs) if face_img is not None]
+    with stage('quality'):
+        if size is None:
+            metrics = np.array([quality_metrics(face_imgs[i]) for i in valid], dtype=np.float64).reshape(-1, 3)
+            brightness, sharpness, contrast = metrics.T
+        else:
+            brightness, sharpness, contrast = quality_metrics_batch([face_imgs[i] for i in valid], size)
+
+    scores = np.zeros(len(face_imgs), dtype=np.float32)
+    scores[valid] = quality_score(brightness, sharpness, contrast)
+
+    if not with_feedback:
+        return scores, None
+
+    feedback = [NO_FACE_FEEDBACK] * len(face_imgs)
+    for j, i in enumerate(valid):
+        feedback[i] = quality_feedback(brightness[j], sharpness[j], contrast[j])
+    return scores, feedback
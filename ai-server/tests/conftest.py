@@ -0,0 +1,77 @@
+"""
+fixtures ร่วมของชุดทดสอบ AI Server
+
+การทดสอบ route ใช้ FaceNet ตัวแทนแบบสุ่มน้ำหนักจาก benchmarks/pipeline.py (ไม่ต้องมีไฟล์โมเดลจริง)
+และ detector ตัวแทนที่คืนใบหน้าหนึ่งใบกลางภาพเสมอ (ไม่ต้องโหลด MTCNN)
+"""
+import os
+import sys
+import base64
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+class StubDetector:
+    """detector ที่คืนใบหน้าหนึ่งใบกลางภาพ (ครึ่งหนึ่งของด้านกว้าง/สูง) พร้อม 5 landmarks ตามรูปแบบของ MTCNN"""
+
+    def __init__(self):
+        self.min_face_size = 20
+
+    def detect_faces(self, image):
+        height, width = image.shape[:2]
+        x, y, w, h = width // 4, height // 4, width // 2, height // 2
+        return [{
+            'box': [x, y, w, h],
+            'confidence': 0.99,
+            'keypoints': {
+                'left_eye': (x + w * 3 // 10, y + h * 2 // 5),
+                'right_eye': (x + w * 7 // 10, y + h * 2 // 5),
+                'nose': (x + w // 2, y + h * 3 // 5),
+                'mouth_left': (x + w * 7 // 20, y + h * 4 // 5),
+                'mouth_right': (x + w * 13 // 20, y + h * 4 // 5),
+            },
+        }]
+
+
+def make_image(seed=0, size=(320, 240)):
+    """ภาพ BGR ที่มีรายละเอียด (noise ที่ถูกขยาย) ขนาด size (กว้าง, สูง) จาก seed คงที่"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    small = rng.integers(0, 256, size=(height // 8, width // 8, 3), dtype=np.uint8)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+
+
+def encode_image(image):
+    """เข้ารหัสภาพเป็น JPEG แบบ Base64 (รูปแบบเดียวกับที่ client ส่งมา)"""
+    ok, buffer = cv2.imencode('.jpg', image)
+    assert ok
+    return base64.b64encode(buffer.tobytes()).decode('ascii')
+
+
+@pytest.fixture(scope='session')
+def stand_in_model(tmp_path_factory):
+    """frozen graph ตัวแทน FaceNet (input:0 / phase_train:0 / embeddings:0 ขนาด 512 มิติ)"""
+    from benchmarks.pipeline import build_stand_in_model
+    return build_stand_in_model(str(tmp_path_factory.mktemp('facenet') / 'stand_in.pb'))
+
+
+@pytest.fixture(scope='session')
+def app(stand_in_model, tmp_path_factory):
+    """Flask app ที่ใช้ FaceNet ตัวแทน, detector ตัวแทน และคลัง embeddings ในโฟลเดอร์ชั่วคราว"""
+    os.environ['FACENET_MODEL_PATH'] = stand_in_model
+    os.environ['EMBEDDING_STORE_PATH'] = str(tmp_path_factory.mktemp('embedding_store'))
+    import src.services.face_detection as face_detection
+    face_detection.detector = StubDetector()
+
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
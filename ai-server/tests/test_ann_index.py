@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from src.services.ann_index import IVFIndex, create_index
+from src.services.gallery_index import GalleryIndex
+
+
+def clustered_embeddings(n=3000, dim=64, clusters=48, seed=0):
+    """embeddings ที่เกาะกลุ่มกันรอบจุดศูนย์กลางสุ่ม (ใกล้เคียงการกระจายของ embeddings ใบหน้าจริง)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    data = centers[rng.integers(0, clusters, n)] + 0.35 * rng.normal(size=(n, dim))
+    return data.astype(np.float32)
+
+
+def recall_at_k(index, exact, queries, k, nprobe):
+    hits = 0
+    for query in queries:
+        expected = {user_id for user_id, _ in exact.search(query, k=k)}
+        hits += len(expected.intersection(user_id for user_id, _ in index.search(query, k=k, nprobe=nprobe)))
+    return hits / (k * len(queries))
+
+
+@pytest.fixture(scope='module')
+def gallery():
+    data = clustered_embeddings()
+    queries = data[:50] + 0.05 * np.random.default_rng(1).normal(size=(50, data.shape[1])).astype(np.float32)
+    return data, queries, GalleryIndex.from_embeddings(data)
+
+
+def test_ivf_recall_matches_exact_when_probing_every_list(gallery):
+    data, queries, exact = gallery
+    index = create_index('ivf', data, nlist=32)
+    assert recall_at_k(index, exact, queries, k=10, nprobe=32) == 1.0
+    assert recall_at_k(index, exact, queries, k=10, nprobe=8) >= 0.9
+
+
+def test_ivfpq_recall(gallery):
+    data, queries, exact = gallery
+    index = create_index('ivfpq', data, nlist=32, pq_m=16)
+    # PQ เก็บเวกเตอร์แบบย่อ ระยะจึงเป็นค่าประมาณ: วัดว่าเพื่อนบ้านที่ใกล้ที่สุดจริงอยู่ใน 10 อันดับแรก (recall 1@10)
+    found = sum(exact.search(query, k=1)[0][0] in {user_id for user_id, _ in index.search(query, k=10, nprobe=32)}
+                for query in queries)
+    assert found / len(queries) >= 0.95
+
+
+def test_ivf_search_batch_matches_search(gallery):
+    data, queries, _ = gallery
+    index = create_index('ivf', data, nlist=32)
+    batched = index.search_batch(queries[:10], k=5, nprobe=4)
+    for query, matches in zip(queries[:10], batched):
+        expected = index.search(query, k=5, nprobe=4)
+        assert [user_id for user_id, _ in matches] == [user_id for user_id, _ in expected]
+        np.testing.assert_allclose([d for _, d in matches], [d for _, d in expected], atol=1e-5)
+
+
+def test_create_index_infers_dim_and_train_validates_it():
+    data = clustered_embeddings(n=500, dim=32, clusters=8)
+    index = create_index('ivf', data, nlist=8)
+    assert index.dim == 32
+    assert create_index('ivfpq', data, nlist=8, pq_m=8).dim == 32
+
+    with pytest.raises(ValueError):
+        IVFIndex(dim=64, nlist=8).train(data)
+
+
+def test_remove_drops_every_row_of_a_user():
+    data = clustered_embeddings(n=400, dim=32, clusters=8)
+    ids = [f'user{i % 100}' for i in range(len(data))]
+    index = create_index('ivf', data, ids=ids, nlist=8)
+
+    assert index.remove('user7') == 4
+    assert 'user7' not in index
+    assert len(index) == len(data) - 4
+    assert all(user_id != 'user7' for user_id, _ in index.search(data[7], k=20, nprobe=8))
+
+
+def test_save_and_load_round_trip_with_numpy_ids(tmp_path):
+    data = clustered_embeddings(n=500, dim=32, clusters=8)
+    index = create_index('ivfpq', data, ids=np.arange(len(data), dtype=np.int64), nlist=8, pq_m=8)
+    path = str(tmp_path / 'index.npz')
+    index.save(path)
+
+    loaded = IVFIndex.load(path)
+    assert len(loaded) == len(index)
+    for query in data[:5]:
+        assert loaded.search(query, k=3, nprobe=8) == index.search(query, k=3, nprobe=8)
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+AI_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def run_python(code):
+    result = subprocess.run([sys.executable, '-c', code], cwd=AI_SERVER, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip().splitlines()[-1]
+
+
+def test_create_app_does_not_import_tensorflow_or_models():
+    output = run_python(
+        "import sys\n"
+        "from app import create_app\n"
+        "app = create_app()\n"
+        "from src.services import models\n"
+        "print(sorted(m for m in ('tensorflow', 'mtcnn', 'keras') if m in sys.modules), models.models_loaded())"
+    )
+    assert output == "[] False"
+
+
+def test_ready_reports_failed_background_warm_up():
+    output = run_python(
+        "import os\n"
+        "os.environ['FACENET_MODEL_PATH'] = '/nonexistent/facenet.pb'\n"
+        "from app import create_app\n"
+        "from src.services import models\n"
+        "client = create_app().test_client()\n"
+        "lazy = client.get('/api/ready').status_code\n"
+        "models.start_warm_up('background').join()\n"
+        "response = client.get('/api/ready')\n"
+        "print(lazy, response.status_code, response.get_json()['models']['facenet']['state'],"
+        " client.get('/api/health').status_code)"
+    )
+    assert output == "200 503 failed 200"
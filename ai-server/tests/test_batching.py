@@ -0,0 +1,190 @@
+import time
+import threading
+import numpy as np
+import pytest
+from src.services.batching import MicroBatcher
+from src.services.inference import InferenceBusyError
+
+
+class RecordingModel:
+    """run_batch ตัวแทนที่จำขนาดของแต่ละ batch และคืน input * 2"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, batch):
+        self.batch_sizes.append(len(batch))
+        return batch * 2
+
+
+def test_micro_batcher_groups_concurrent_requests():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, max_batch_size=32, window_ms=200)
+    try:
+        futures = [batcher.submit(np.full(4, i, dtype=np.float32)) for i in range(8)]
+        results = [future.result(timeout=5) for future in futures]
+    finally:
+        batcher.close()
+
+    for i, result in enumerate(results):
+        np.testing.assert_array_equal(result, np.full(4, 2 * i))
+    assert sum(model.batch_sizes) == 8
+    assert len(model.batch_sizes) < 8
+
+
+def test_micro_batcher_respects_max_batch_size():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, max_batch_size=3, window_ms=100)
+    try:
+        futures = [batcher.submit(np.zeros(2, dtype=np.float32)) for _ in range(7)]
+        for future in futures:
+            future.result(timeout=5)
+    finally:
+        batcher.close()
+    assert max(model.batch_sizes) <= 3
+    assert sum(model.batch_sizes) == 7
+
+
+def test_micro_batcher_propagates_errors_to_every_request():
+    def failing(batch):
+        raise RuntimeError('model failed')
+
+    batcher = MicroBatcher(failing, window_ms=50)
+    try:
+        futures = [batcher.submit(np.zeros(2, dtype=np.float32)) for _ in range(3)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match='model failed'):
+                future.result(timeout=5)
+    finally:
+        batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(np.zeros(2, dtype=np.float32))
+
+
+def test_micro_batcher_groups_items_by_shape_and_dtype():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, window_ms=200)
+    try:
+        items = [np.ones(3, dtype=np.float32), np.ones(5, dtype=np.float32), np.ones(3, dtype=np.float64),
+                 np.full(3, 2, dtype=np.float32)]
+        results = [future.result(timeout=5) for future in [batcher.submit(item) for item in items]]
+    finally:
+        batcher.close()
+
+    for item, result in zip(items, results):
+        np.testing.assert_array_equal(result, item * 2)
+        assert result.dtype == item.dtype
+    assert sorted(model.batch_sizes) == [1, 1, 2]
+
+
+def test_micro_batcher_close_resolves_every_submitted_future():
+    batcher = MicroBatcher(RecordingModel(), max_batch_size=2, window_ms=1)
+    futures = []
+
+    def submit_until_closed():
+        while True:
+            try:
+                futures.append(batcher.submit(np.zeros(2, dtype=np.float32)))
+            except RuntimeError:
+                return
+
+    thread = threading.Thread(target=submit_until_closed)
+    thread.start()
+    while len(futures) < 20:
+        time.sleep(0.001)
+    batcher.close()
+    thread.join(timeout=5)
+
+    # ทุกคำขอที่เข้าคิวได้ต้องได้ผลลัพธ์หรือ exception ไม่ค้างตลอดไป
+    for future in futures:
+        assert future.exception(timeout=5) is None
+
+
+class BlockingModel:
+    """run_batch ตัวแทนที่รอ event ก่อนคืนผล และนับจำนวน batch ที่รันพร้อมกันสูงสุด"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, batch):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.release.wait(timeout=10)
+        with self.lock:
+            self.running -= 1
+        return batch
+
+
+def test_micro_batcher_rejects_when_queue_is_full():
+    model = BlockingModel()
+    batcher = MicroBatcher(model, max_batch_size=1, window_ms=0, max_queue=2)
+    try:
+        futures = [batcher.submit(np.zeros(2, dtype=np.float32))]
+        while model.running == 0:
+            time.sleep(0.001)
+        futures += [batcher.submit(np.zeros(2, dtype=np.float32)) for _ in range(2)]
+        with pytest.raises(InferenceBusyError) as error:
+            batcher.submit(np.zeros(2, dtype=np.float32))
+        assert error.value.retry_after >= 1
+        assert batcher.rejected == 1
+    finally:
+        model.release.set()
+        batcher.close()
+    for future in futures:
+        future.result(timeout=5)
+
+
+def test_micro_batcher_runs_one_batch_per_worker_concurrently():
+    model = BlockingModel()
+    batcher = MicroBatcher(model, max_batch_size=1, window_ms=0, workers=3)
+    try:
+        futures = [batcher.submit(np.zeros(2, dtype=np.float32)) for _ in range(3)]
+        deadline = time.monotonic() + 5
+        while model.running < 3 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        assert model.max_running == 3
+    finally:
+        model.release.set()
+        batcher.close()
+    for future in futures:
+        future.result(timeout=5)
+
+
+def test_face_recognition_batched_wait_times_out_as_busy(stand_in_model):
+    from src.services.face_recognition import FaceRecognition
+    face_recognition = FaceRecognition(stand_in_model, batch_window_ms=1, max_concurrency=1, queue_timeout=0.2)
+    face = np.random.default_rng(0).integers(0, 256, size=(120, 120, 3), dtype=np.uint8)
+    try:
+        # ยืม replica เดียวไว้ batcher จึงรันไม่ได้และผู้เรียกต้องได้ 503 แทนการรอไม่มีกำหนด
+        with face_recognition.executor.acquire():
+            with pytest.raises(InferenceBusyError):
+                face_recognition.get_embeddings(face)
+        assert face_recognition.get_embeddings(face).shape == (512,)
+    finally:
+        face_recognition.batcher.close()
+
+
+def test_face_recognition_batches_beyond_max_concurrency(stand_in_model):
+    """micro-batch ยืม replica ครั้งเดียวต่อ batch จึงรวมได้หลายคำขอแม้ max_concurrency=1"""
+    from src.services.face_recognition import FaceRecognition
+    face_recognition = FaceRecognition(stand_in_model, batch_window_ms=200, max_batch_size=8, max_concurrency=1)
+    faces = [np.random.default_rng(i).integers(0, 256, size=(120, 120, 3), dtype=np.uint8) for i in range(6)]
+    results = [None] * len(faces)
+
+    def embed(i):
+        results[i] = face_recognition.get_embeddings(faces[i])
+
+    threads = [threading.Thread(target=embed, args=(i,)) for i in range(len(faces))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert all(result is not None and result.shape == (512,) for result in results)
+    assert face_recognition.batcher.items_run == len(faces)
+    assert face_recognition.batcher.batches_run < len(faces)
+    face_recognition.batcher.close()
@@ -0,0 +1,87 @@
+import time
+import numpy as np
+from src.services.embedding_cache import LRUCache, FaceCache, content_hash
+
+
+def test_lru_evicts_least_recently_used_entry():
+    cache = LRUCache(max_bytes=30, ttl=60)
+    cache.set('a', 1, 10)
+    cache.set('b', 2, 10)
+    cache.set('c', 3, 10)
+    assert cache.get('a') == 1  # a ถูกใช้ล่าสุด b จึงเก่าที่สุด
+    cache.set('d', 4, 10)
+
+    assert cache.get('b') is None
+    assert [cache.get(key) for key in 'acd'] == [1, 3, 4]
+    assert cache.evictions == 1
+    assert cache.current_bytes == 30
+
+
+def test_lru_replaces_existing_key_and_skips_oversized_values():
+    cache = LRUCache(max_bytes=20, ttl=60)
+    cache.set('a', 1, 10)
+    cache.set('a', 2, 15)
+    assert cache.get('a') == 2
+    assert cache.current_bytes == 15
+
+    cache.set('huge', 3, 21)
+    assert cache.get('huge') is None
+    assert cache.get('a') == 2
+
+
+def test_lru_entries_expire_after_ttl():
+    cache = LRUCache(max_bytes=100, ttl=0.05)
+    cache.set('a', 1, 10)
+    assert cache.get('a') == 1
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+    assert cache.current_bytes == 0
+
+
+def test_face_cache_keys_include_params():
+    cache = FaceCache(max_bytes=1024 * 1024, ttl=60)
+    image_hash = content_hash(np.zeros((4, 4, 3), dtype=np.uint8))
+    embedding = np.arange(4, dtype=np.float64)
+    stored = cache.store('embedding', image_hash, embedding, model='a', box=(1, 2, 3, 4))
+    assert stored.dtype == np.float32
+
+    np.testing.assert_array_equal(cache.lookup('embedding', image_hash, model='a', box=(1, 2, 3, 4)), embedding)
+    assert cache.lookup('embedding', image_hash, model='b', box=(1, 2, 3, 4)) is None
+    assert cache.lookup('embedding', None, model='a', box=(1, 2, 3, 4)) is None
+
+    stats = cache.stats()['kinds']['embedding']
+    assert stats['memory_hits'] == 1
+    assert stats['misses'] == 1
+
+
+def test_face_cache_get_or_compute_calls_compute_once():
+    cache = FaceCache(max_bytes=1024 * 1024, ttl=60)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return [{'box': (np.int64(1), 2, 3, 4), 'confidence': np.float32(0.9),
+                 'keypoints': {'nose': (np.int64(5), 6)}}]
+
+    first = cache.get_or_compute('detections', 'hash', compute, detector='mtcnn')
+    second = cache.get_or_compute('detections', 'hash', compute, detector='mtcnn')
+    assert len(calls) == 1
+    assert first == second == [{'box': [1, 2, 3, 4], 'confidence': first[0]['confidence'],
+                                'keypoints': {'nose': [5, 6]}}]
+
+
+def test_disabled_face_cache_never_stores():
+    cache = FaceCache(enabled=False)
+    cache.store('embedding', 'hash', np.ones(4))
+    assert cache.lookup('embedding', 'hash') is None
+    assert len(cache.memory) == 0
+
+
+def test_content_hash_depends_on_shape_and_pixels():
+    image = np.zeros((4, 6, 3), dtype=np.uint8)
+    assert content_hash(image) == content_hash(image.copy())
+    assert content_hash(image) != content_hash(image.reshape(6, 4, 3))
+    changed = image.copy()
+    changed[0, 0, 0] = 1
+    assert content_hash(image) != content_hash(changed)
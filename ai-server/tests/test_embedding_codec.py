@@ -0,0 +1,59 @@
+import base64
+import numpy as np
+import pytest
+from flask import Flask
+from src.utils.embedding_codec import (
+    encode_embedding, decode_embedding, decode_embeddings, request_encoding, EmbeddingFormatError
+)
+
+
+@pytest.mark.parametrize('encoding,atol', [('json', 0), ('f32', 0), ('f16', 1e-3)])
+def test_round_trip(encoding, atol):
+    embedding = np.random.default_rng(0).normal(size=512).astype(np.float32)
+    embedding /= np.linalg.norm(embedding)
+    encoded = encode_embedding(embedding, encoding)
+    assert isinstance(encoded, list if encoding == 'json' else str)
+
+    decoded = decode_embedding(encoded, encoding)
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, embedding, atol=atol)
+
+
+def test_binary_encodings_are_smaller_than_json():
+    embedding = np.random.default_rng(0).normal(size=512).astype(np.float32)
+    assert len(base64.b64decode(encode_embedding(embedding, 'f32'))) == 512 * 4
+    assert len(base64.b64decode(encode_embedding(embedding, 'f16'))) == 512 * 2
+    assert encode_embedding(None, 'f16') is None
+
+
+@pytest.mark.parametrize('value,encoding', [
+    ('not base64!', 'f32'),
+    (base64.b64encode(b'abc').decode(), 'f32'),
+    ('', 'f16'),
+    ([[1.0, 2.0]], 'json'),
+    ([], 'json'),
+    (['a', 'b'], 'json'),
+])
+def test_decode_rejects_malformed_values(value, encoding):
+    with pytest.raises(EmbeddingFormatError):
+        decode_embedding(value, encoding)
+
+
+def test_decode_embeddings_requires_equal_dimensions():
+    matrix = decode_embeddings([[1, 2, 3], encode_embedding(np.ones(3), 'f32')], 'f32')
+    assert matrix.shape == (2, 3)
+    with pytest.raises(EmbeddingFormatError):
+        decode_embeddings([[1, 2, 3], [1, 2]], 'json')
+    with pytest.raises(EmbeddingFormatError):
+        decode_embeddings([], 'json')
+
+
+def test_request_encoding_from_field_or_accept_header():
+    app = Flask(__name__)
+    with app.test_request_context(headers={'Accept': 'application/json; embedding=f16'}):
+        assert request_encoding({}) == 'f16'
+        assert request_encoding({'embedding_encoding': 'F32'}) == 'f32'
+        with pytest.raises(EmbeddingFormatError):
+            request_encoding({'embedding_encoding': 'f64'})
+    with app.test_request_context():
+        assert request_encoding({}) == 'json'
@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import pytest
+from src.services.embedding_store import EmbeddingStore
+from src.services.gallery_index import GalleryIndex
+
+
+def unit_vectors(n, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_search_matches_in_memory_gallery(tmp_path):
+    vectors = unit_vectors(200)
+    ids = [f'u{i % 70}' for i in range(200)]
+    store = EmbeddingStore(str(tmp_path), dim=16, block_rows=64)
+    store.add_many(ids, vectors)
+    index = GalleryIndex.from_embeddings(vectors, ids)
+
+    queries = unit_vectors(10, seed=1)
+    for matches, expected in zip(store.search_batch(queries, k=5), index.search_batch(queries, k=5)):
+        assert [user_id for user_id, _ in matches] == [user_id for user_id, _ in expected]
+        np.testing.assert_allclose([d for _, d in matches], [d for _, d in expected], atol=1e-5)
+    assert store.search(vectors[3], k=1, threshold=0.5)[0][0] == 'u3'
+
+
+def test_other_instances_see_writes_and_deletes(tmp_path):
+    vectors = unit_vectors(4)
+    writer = EmbeddingStore(str(tmp_path), dim=16)
+    reader = EmbeddingStore(str(tmp_path))
+    assert len(reader) == 0
+
+    writer.add_many(['a', 'b', 'b', 'c'], vectors)
+    assert len(reader) == 4
+    assert reader.search(vectors[2], k=1)[0][0] == 'b'
+
+    assert writer.remove('b') == 2
+    assert writer.remove('b') == 0
+    assert 'b' not in reader
+    assert reader.ids == ['a', 'c']
+    assert all(user_id != 'b' for user_id, _ in reader.search(vectors[1], k=4))
+
+
+def test_compact_drops_deleted_rows_and_keeps_search_results(tmp_path):
+    vectors = unit_vectors(6)
+    store = EmbeddingStore(str(tmp_path), dim=16)
+    store.add_many(['a', 'b', 'c', 'd', 'e', 'f'], vectors)
+    other = EmbeddingStore(str(tmp_path))
+    store.remove('b')
+    store.remove('e')
+
+    assert store.compact() == 2
+    assert store.compact() == 0
+    stats = store.stats()
+    assert stats['generation'] == 1
+    assert stats['rows'] == stats['live_rows'] == 4
+    assert stats['file_bytes'] == 4 * 16 * 4
+    assert other.ids == ['a', 'c', 'd', 'f']
+    np.testing.assert_allclose(other.embeddings, vectors[[0, 2, 3, 5]], atol=1e-6)
+
+
+def test_float16_store_halves_the_file(tmp_path):
+    vectors = unit_vectors(10)
+    store = EmbeddingStore(str(tmp_path), dim=16, dtype='float16')
+    store.add_many(range(10), vectors)
+    assert store.stats()['file_bytes'] == 10 * 16 * 2
+    assert EmbeddingStore(str(tmp_path)).search(vectors[7], k=1)[0][0] == 7
+
+
+def test_snapshot_is_consistent_while_rows_are_appended(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=16)
+    store.add_many(['a', 'b'], unit_vectors(2))
+    matrix, ids, alive = store._snapshot()
+    store.add_many(['c'], unit_vectors(1, seed=3))
+    # snapshot เดิมไม่เปลี่ยนหลังมีการเพิ่มแถว
+    assert ids == ('a', 'b')
+    assert len(matrix) == len(alive) == 2
+    assert len(store._snapshot()[1]) == 3
+
+
+def test_rejects_wrong_shapes(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=16)
+    with pytest.raises(ValueError):
+        store.add_many(['a'], np.zeros((1, 8), dtype=np.float32))
+    with pytest.raises(ValueError):
+        store.add_many(['a', 'b'], unit_vectors(1))
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path / 'other'), dtype='int8')
+
+
+def test_default_store_path_does_not_depend_on_working_directory():
+    from src.services.models import DEFAULT_STORE_PATH
+    ai_server_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert DEFAULT_STORE_PATH == os.path.join(ai_server_dir, 'data', 'embedding_store')
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from src.services.face_clustering import FaceClusterer, exact_knn
+from src.services.gallery_index import normalize_embeddings
+
+
+def identities(people, per_person, dim=64, noise=0.15, seed=0):
+    """embeddings ของ people คน คนละ per_person ใบหน้า (จุดศูนย์กลางสุ่ม + noise) และ label จริง"""
+    rng = np.random.default_rng(seed)
+    centers = normalize_embeddings(rng.normal(size=(people, dim)))
+    labels = np.repeat(np.arange(people), per_person)
+    embeddings = centers[labels] + noise / np.sqrt(dim) * rng.normal(size=(len(labels), dim))
+    order = rng.permutation(len(labels))
+    return normalize_embeddings(embeddings[order]), labels[order]
+
+
+def same_partition(labels, expected):
+    pairs = set(zip(labels.tolist(), expected.tolist()))
+    return len(pairs) == len(set(labels.tolist())) == len(set(expected.tolist()))
+
+
+@pytest.mark.parametrize('method', ['exact', 'ivf'])
+def test_fit_recovers_identities(method):
+    embeddings, expected = identities(people=12, per_person=15)
+    labels = FaceClusterer(threshold=0.4, k=10, method=method).fit(embeddings)
+    assert same_partition(labels, expected)
+    # label 0 คือกลุ่มที่ใหญ่ที่สุด
+    assert np.bincount(labels).argmax() == 0
+
+
+def test_add_assigns_new_faces_without_relabelling_existing_ones():
+    embeddings, expected = identities(people=6, per_person=10, seed=1)
+    clusterer = FaceClusterer(threshold=0.4)
+    labels = clusterer.fit(embeddings[:40])
+    new_person = identities(people=1, per_person=5, seed=2)[0]
+
+    new_labels = clusterer.add(np.concatenate([embeddings[40:], new_person]))
+    np.testing.assert_array_equal(clusterer.labels[:40], labels)
+    assert same_partition(clusterer.labels[:60], expected)
+    # คนใหม่ได้ label ใหม่ต่อจาก label เดิม
+    assert set(new_labels[-5:].tolist()) == {labels.max() + 1}
+
+
+def test_from_labels_continues_a_previous_clustering():
+    embeddings, _ = identities(people=4, per_person=8, seed=3)
+    labels = FaceClusterer(threshold=0.4).fit(embeddings)
+    restored = FaceClusterer.from_labels(embeddings, labels, threshold=0.4)
+    assert restored.add(embeddings[:3]).tolist() == labels[:3].tolist()
+    assert sorted(len(rows) for rows in restored.clusters().values()) == [8, 8, 8, 8 + 3]
+
+    with pytest.raises(ValueError):
+        FaceClusterer.from_labels(embeddings, labels[:-1])
+
+
+def test_exact_knn_skips_self_and_applies_threshold():
+    embeddings, _ = identities(people=3, per_person=4, seed=4)
+    rows, cols, distances = exact_knn(embeddings, embeddings, k=3, threshold=0.4, self_offset=0)
+    assert not np.any(rows == cols)
+    assert np.all(distances < 0.4)
+    full = 1.0 - embeddings @ embeddings.T
+    np.testing.assert_allclose(distances, full[rows, cols], atol=1e-5)
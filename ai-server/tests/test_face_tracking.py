@@ -0,0 +1,98 @@
+import cv2
+import numpy as np
+import pytest
+from conftest import make_image
+import src.services.face_tracking as face_tracking
+from src.services.face_tracking import FaceStreamTracker, box_iou
+from src.services.gallery_index import GalleryIndex
+
+EMBEDDING = np.eye(8, dtype=np.float32)[0]
+
+
+class FakeRecognition:
+    """FaceRecognition ตัวแทน: คุณภาพคงที่และ embedding เดียวกันทุกใบหน้า นับจำนวนครั้งที่ถูกเรียก"""
+    default_threshold = 0.6
+
+    def __init__(self):
+        self.embedded = 0
+
+    def quality_assessment_batch(self, crops, with_feedback=True):
+        return np.full(len(crops), 50.0, dtype=np.float32), None
+
+    def get_embeddings(self, crop):
+        self.embedded += 1
+        return EMBEDDING
+
+    def get_embeddings_batch(self, crops):
+        self.embedded += len(crops)
+        return np.stack([EMBEDDING] * len(crops))
+
+
+def moving_frames(count, step=3):
+    """เฟรมของฉากที่เลื่อนไปทางขวา step พิกเซลต่อเฟรม และกรอบใบหน้าจริงของแต่ละเฟรม"""
+    base = make_image(7, size=(400, 240))
+    frames, boxes = [], []
+    for i in range(count):
+        matrix = np.float32([[1, 0, step * i], [0, 1, 0]])
+        frames.append(cv2.warpAffine(base, matrix, (320, 240), borderMode=cv2.BORDER_REFLECT))
+        boxes.append([100 + step * i, 80, 80, 80])
+    return frames, boxes
+
+
+@pytest.fixture
+def detections(monkeypatch):
+    """ให้ detect_faces ของ tracker คืนกรอบตามรายการ boxes[เฟรม] (None = ไม่พบใบหน้า)"""
+    state = {'boxes': [], 'calls': 0}
+
+    def detect(frame, backend=None):
+        box = state['boxes'][state['calls']]
+        state['calls'] += 1
+        if box is None:
+            return []
+        x, y, w, h = box
+        return [{'box': box, 'confidence': 0.99,
+                 'keypoints': {'nose': (x + w // 2, y + h // 2)}}]
+
+    monkeypatch.setattr(face_tracking, 'detect_faces', detect)
+    return state
+
+
+def test_tracker_follows_motion_between_detections(detections):
+    frames, boxes = moving_frames(8)
+    detections['boxes'] = [boxes[0], boxes[4]]
+    recognition = FakeRecognition()
+    tracker = FaceStreamTracker(recognition, detect_every=4)
+    results = [tracker.process(frame, i) for i, frame in enumerate(frames)]
+
+    assert [result['detected'] for result in results] == [True, False, False, False] * 2
+    assert detections['calls'] == 2
+    for result, box in zip(results, boxes):
+        assert len(result['tracks']) == 1
+        assert abs(result['tracks'][0]['box'][0] - box[0]) <= 2
+        assert result['tracks'][0]['box'][1:] == pytest.approx(box[1:], abs=2)
+    # track เดิมที่คุณภาพไม่ดีขึ้นไม่ต้องสร้าง embedding ใหม่
+    assert recognition.embedded == 1
+    assert tracker.counters == {'frames': 8, 'detections': 2, 'embeddings': 1}
+
+
+def test_tracker_reports_identity_once_and_ends_lost_tracks(detections):
+    frames, boxes = moving_frames(4)
+    detections['boxes'] = [boxes[0], boxes[1], None, None, None]
+    gallery = GalleryIndex.from_embeddings(EMBEDDING[np.newaxis], ['alice'])
+    tracker = FaceStreamTracker(FakeRecognition(), gallery=gallery, detect_every=1, max_missed=2, quality_margin=0)
+
+    results = list(tracker.stream(frames + [frames[-1]]))
+    events = [result['events'] for result in results]
+    assert [event['event'] for event in events[0]] == ['track_started', 'identity']
+    assert events[0][1]['user_id'] == 'alice'
+    # ตัวตนเดิม ไม่ส่ง event ซ้ำแม้สร้าง embedding ใหม่
+    assert events[1] == []
+    assert events[2] == events[3] == []
+    assert [event['event'] for event in events[4]] == ['track_ended']
+    assert results[-1] == {'frame': 4, 'events': [], 'summary': {'frames': 5, 'detections': 5, 'embeddings': 2}}
+
+
+def test_box_iou():
+    assert box_iou([0, 0, 10, 10], [0, 0, 10, 10]) == 1.0
+    assert box_iou([0, 0, 10, 10], [5, 0, 10, 10]) == pytest.approx(50 / 150)
+    assert box_iou([0, 0, 10, 10], [20, 20, 5, 5]) == 0.0
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from conftest import make_image
+
+
+@pytest.fixture(scope='module')
+def faces():
+    return [make_image(seed, size=(120, 144)) for seed in range(5)]
+
+
+@pytest.fixture(scope='module')
+def session_embeddings(stand_in_model, faces):
+    from src.services.face_recognition import FaceRecognition
+    return FaceRecognition(stand_in_model).get_embeddings_batch(faces)
+
+
+def test_function_backend_matches_session(stand_in_model, faces, session_embeddings):
+    from src.services.face_recognition import FaceRecognition
+    embeddings = FaceRecognition(stand_in_model, backend='function').get_embeddings_batch(faces)
+    np.testing.assert_allclose(embeddings, session_embeddings, atol=1e-5)
+
+
+def test_saved_model_backend_matches_session(stand_in_model, faces, session_embeddings, tmp_path):
+    from src.services.face_recognition import FaceRecognition
+    from src.services.facenet_graph import export_saved_model
+    export_saved_model(stand_in_model, str(tmp_path / 'facenet'))
+    embeddings = FaceRecognition(str(tmp_path / 'facenet'), backend='savedmodel').get_embeddings_batch(faces)
+    np.testing.assert_allclose(embeddings, session_embeddings, atol=1e-5)
+
+
+def test_to_tensor_accepts_aligned_and_unaligned_arrays():
+    from src.services.facenet_graph import to_tensor
+    from src.utils.preprocess import aligned_empty
+    aligned = aligned_empty((2, 4, 4, 3))
+    aligned[...] = np.arange(aligned.size, dtype=np.float32).reshape(aligned.shape)
+    np.testing.assert_array_equal(to_tensor(aligned).numpy(), aligned)
+    # ไม่ต่อเนื่องในหน่วยความจำ: คัดลอกแทนการใช้ buffer ร่วม
+    strided = aligned[:, ::2]
+    np.testing.assert_array_equal(to_tensor(strided).numpy(), strided)
+
+
+def test_unknown_backend_is_rejected(stand_in_model):
+    from src.services.face_recognition import FaceRecognition
+    with pytest.raises(ValueError):
+        FaceRecognition(stand_in_model, backend='onnx')
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from conftest import make_image
+
+
+@pytest.fixture(scope='module')
+def tflite_model(stand_in_model, tmp_path_factory):
+    from src.services.facenet_tflite import convert_tflite
+    path = str(tmp_path_factory.mktemp('tflite') / 'facenet_float16.tflite')
+    convert_tflite(stand_in_model, path, 'float16')
+    return path
+
+
+@pytest.fixture(scope='module')
+def models(stand_in_model, tflite_model):
+    from src.services.face_recognition import FaceRecognition
+    return FaceRecognition(stand_in_model), FaceRecognition(tflite_model, backend='tflite', model_replicas=2)
+
+
+def test_float16_model_stays_close_to_float32(models):
+    reference, candidate = models
+    faces = [make_image(seed, size=(120, 144)) for seed in range(4)]
+    expected = reference.get_embeddings_batch(faces)
+    embeddings = candidate.get_embeddings_batch(faces)
+    assert embeddings.shape == expected.shape
+    assert np.min(np.sum(embeddings * expected, axis=1)) > 0.99
+    # ขนาด batch ที่เปลี่ยนต้อง allocate tensors ใหม่โดยไม่กระทบผลลัพธ์
+    np.testing.assert_allclose(candidate.get_embeddings(faces[0]), embeddings[0], atol=1e-5)
+
+
+def test_compare_embedding_models_reports_drift_and_accuracy(models):
+    from src.services.model_eval import compare_embedding_models
+    reference, candidate = models
+    images = {f'person{i // 2}_{i % 2}.jpg': make_image(i // 2 * 10 + i % 2, size=(120, 144)) for i in range(6)}
+    pairs = [('person0_0.jpg', 'person0_1.jpg', 1), ('person0_0.jpg', 'person1_0.jpg', 0),
+             ('person1_0.jpg', 'person1_1.jpg', 1), ('person1_1.jpg', 'person2_0.jpg', 0)]
+    report = compare_embedding_models(reference, candidate, images, pairs, chunk_size=4)
+
+    assert report['images'] == 6
+    assert 0 <= report['cosine_drift']['max'] < 0.01
+    assert report['verification']['pairs'] == 4
+    assert abs(report['verification']['pair_distance_drift_max']) < 0.02
+
+
+def test_int8_conversion_requires_calibration_images(stand_in_model, tmp_path):
+    from src.services.facenet_tflite import convert_tflite
+    with pytest.raises(ValueError):
+        convert_tflite(stand_in_model, str(tmp_path / 'int8.tflite'), 'int8')
+    with pytest.raises(ValueError):
+        convert_tflite(stand_in_model, str(tmp_path / 'x.tflite'), 'int4')
+
+
+def test_executor_lends_each_interpreter_directly(models):
+    _, candidate = models
+    replicas = candidate.model_fn.replicas
+    assert candidate.executor.size == len(replicas) == 2
+    with candidate.executor.acquire() as first, candidate.executor.acquire() as second:
+        assert {id(first), id(second)} == {id(replica) for replica in replicas}
+
+
+def test_direct_call_times_out_when_interpreters_are_busy(tflite_model):
+    from src.services.facenet_tflite import FaceNetTFLite
+    model = FaceNetTFLite(tflite_model, timeout=0.1)
+    images = np.zeros((1, 160, 160, 3), dtype=np.float32)
+    held = model._free.get()
+    with pytest.raises(TimeoutError):
+        model(images)
+    model._free.put(held)
+    assert model(images).shape == (1, 512)
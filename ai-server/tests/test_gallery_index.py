@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from src.services.gallery_index import GalleryIndex, parse_k, MAX_SEARCH_K
+
+
+def unit_vectors(n, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_search_finds_exact_match_first():
+    vectors = unit_vectors(20)
+    index = GalleryIndex.from_embeddings(vectors, [f'u{i}' for i in range(20)])
+    matches = index.search(vectors[5], k=3)
+    assert matches[0][0] == 'u5'
+    assert matches[0][1] == pytest.approx(0.0, abs=1e-5)
+    assert [d for _, d in matches] == sorted(d for _, d in matches)
+
+
+def test_remove_moves_last_row_into_the_gap():
+    vectors = unit_vectors(5)
+    index = GalleryIndex(dim=16, capacity=2)
+    index.add_many(['a', 'b', 'c', 'b', 'd'], vectors)
+
+    assert index.remove('b') == 2
+    assert len(index) == 3
+    assert 'b' not in index
+    assert sorted(index.ids) == ['a', 'c', 'd']
+    # ทุกแถวที่เหลือยังชี้ไปยัง embedding ของผู้ใช้คนเดิมหลังการย้ายแถว
+    for user_id, vector in zip(['a', 'c', 'd'], vectors[[0, 2, 4]]):
+        assert index.search(vector, k=1)[0][0] == user_id
+    # เมทริกซ์ยังต่อเนื่อง: แถวของ d (แถวสุดท้ายเดิม) ถูกย้ายมาแทนที่
+    np.testing.assert_allclose(index.embeddings[index.ids.index('d')], vectors[4], atol=1e-6)
+
+    assert index.remove('missing') == 0
+    index.add('b', vectors[1])
+    assert index.search(vectors[1], k=1)[0][0] == 'b'
+
+
+def test_remove_last_remaining_rows():
+    vectors = unit_vectors(3)
+    index = GalleryIndex.from_embeddings(vectors, ['x', 'x', 'x'])
+    assert index.remove('x') == 3
+    assert len(index) == 0
+    assert index.search(vectors[0]) == []
+
+
+def test_search_batch_matches_search_with_threshold():
+    vectors = unit_vectors(50)
+    queries = unit_vectors(8, seed=1)
+    index = GalleryIndex.from_embeddings(vectors)
+    for query, matches in zip(queries, index.search_batch(queries, k=4, threshold=1.0)):
+        expected = index.search(query, k=4, threshold=1.0)
+        assert [user_id for user_id, _ in matches] == [user_id for user_id, _ in expected]
+        assert all(distance < 1.0 for _, distance in matches)
+
+
+def test_add_many_rejects_wrong_dimension():
+    index = GalleryIndex(dim=16)
+    with pytest.raises(ValueError):
+        index.add_many(['a'], np.zeros((1, 8), dtype=np.float32))
+
+
+@pytest.mark.parametrize('value', [0, -1, MAX_SEARCH_K + 1, 'x'])
+def test_parse_k_rejects_out_of_range(value):
+    with pytest.raises(ValueError):
+        parse_k(value, 3)
+
+
+def test_parse_k_default_and_bounds():
+    assert parse_k(None, 3) == 3
+    assert parse_k('5', 3) == 5
+    assert parse_k(MAX_SEARCH_K, 3) == MAX_SEARCH_K
+
+
+@pytest.fixture(scope='module')
+def face_recognition(stand_in_model):
+    from src.services.face_recognition import FaceRecognition
+    return FaceRecognition(stand_in_model)
+
+
+def test_find_best_match_skips_missing_embeddings(face_recognition):
+    gallery = unit_vectors(4, dim=512)
+    embeddings_list = [None, gallery[0], None, gallery[1], gallery[2]]
+
+    idx, distance = face_recognition.find_best_match(gallery[1], embeddings_list)
+    assert idx == 3
+    assert distance == pytest.approx(0, abs=1e-5)
+    assert face_recognition.find_best_match(gallery[3], embeddings_list, threshold=0.01) == (-1, 1.0)
+    assert face_recognition.find_best_match(gallery[0], [None, None]) == (-1, 1.0)
+    assert face_recognition.find_best_match(gallery[0], []) == (-1, 1.0)
+
+
+def test_find_best_match_in_index_returns_user_id(face_recognition):
+    gallery = unit_vectors(3, dim=512, seed=1)
+    index = GalleryIndex.from_embeddings(gallery, ['alice', 'bob', 'carol'])
+
+    user_id, distance = face_recognition.find_best_match_in_index(gallery[2], index)
+    assert user_id == 'carol'
+    assert distance == pytest.approx(0, abs=1e-5)
+    assert face_recognition.find_best_match_in_index(gallery[2], GalleryIndex()) == (-1, 1.0)
@@ -0,0 +1,59 @@
+import time
+import threading
+import pytest
+from src.services.inference import InferenceExecutor, InferenceBusyError
+
+
+def test_executor_rejects_when_queue_is_full():
+    executor = InferenceExecutor(['replica'], max_queue=0, queue_timeout=1.0, name='test')
+    with executor.acquire() as replica:
+        assert replica == 'replica'
+        with pytest.raises(InferenceBusyError) as error:
+            with executor.acquire():
+                pass
+        assert error.value.retry_after >= 1
+
+    stats = executor.stats()
+    assert stats['rejected'] == 1
+    assert stats['completed'] == 1
+    assert stats['in_use'] == 0
+
+
+def test_executor_times_out_waiting_for_a_replica():
+    executor = InferenceExecutor(['replica'], max_queue=4, queue_timeout=0.05, name='test')
+    errors = []
+
+    def waiter():
+        try:
+            with executor.acquire():
+                pass
+        except InferenceBusyError as e:
+            errors.append(e)
+
+    with executor.acquire():
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        thread.join(timeout=5)
+
+    assert len(errors) == 1
+    assert executor.stats()['timeouts'] == 1
+    assert executor.stats()['queue_depth'] == 0
+
+
+def test_executor_hands_replica_to_waiting_request():
+    executor = InferenceExecutor(['replica'], max_queue=4, queue_timeout=5.0, name='test')
+    acquired = []
+
+    def waiter():
+        with executor.acquire() as replica:
+            acquired.append(replica)
+
+    with executor.acquire():
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.05)
+        assert acquired == []
+    thread.join(timeout=5)
+
+    assert acquired == ['replica']
+    assert executor.stats()['completed'] == 2
@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+import pytest
+from src.services.mtcnn_batch import detect_faces_batch
+
+
+@pytest.fixture(scope='module')
+def detector():
+    mtcnn = pytest.importorskip('mtcnn')
+    from tensorflow import keras
+    keras.utils.disable_interactive_logging()
+    # threshold ต่ำมากเพื่อให้ภาพสังเคราะห์มีกรอบผ่านทั้งสามขั้น (ไม่มีรูปใบหน้าจริงใน repo)
+    return mtcnn.MTCNN(min_face_size=30, steps_threshold=[0.01, 0.01, 0.01])
+
+
+def synthetic_images():
+    rng = np.random.default_rng(0)
+    images = [cv2.resize(rng.integers(0, 256, size=(24, 32, 3), dtype=np.uint8), (160, 120),
+                         interpolation=cv2.INTER_CUBIC) for _ in range(2)]
+    # ขนาดต่างกันเพื่อให้ pyramid level ของแต่ละรูปไม่เท่ากัน
+    images.append(cv2.resize(images[0], (100, 140)))
+    return images
+
+
+def test_batch_detection_matches_serial_without_padding(detector):
+    images = synthetic_images()
+    serial = [detector.detect_faces(image) for image in images]
+    batched = detect_faces_batch(detector, images, max_padding=0)
+
+    assert sum(len(faces) for faces in serial) > 0
+    assert [len(faces) for faces in batched] == [len(faces) for faces in serial]
+    for expected_faces, faces in zip(serial, batched):
+        for expected, face in zip(expected_faces, faces):
+            assert face['box'] == expected['box']
+            assert face['keypoints'] == expected['keypoints']
+            assert face['confidence'] == pytest.approx(expected['confidence'], abs=1e-4)
+
+
+def test_batch_detection_handles_per_image_min_face_size(detector):
+    images = synthetic_images()
+    batched = detect_faces_batch(detector, images, min_face_sizes=[30, 60, 30], max_padding=0)
+    detector.min_face_size = 60
+    try:
+        expected = detector.detect_faces(images[1])
+    finally:
+        detector.min_face_size = 30
+    assert [face['box'] for face in batched[1]] == [face['box'] for face in expected]
@@ -0,0 +1,153 @@
+import threading
+import cv2
+import numpy as np
+import pytest
+from src.utils.preprocess import (
+    FacePreprocessor, similarity_transforms, align_faces, landmark_template, aligned_empty, _get_clahe,
+    LANDMARK_NAMES, TENSOR_ALIGNMENT
+)
+
+
+def face(seed=0, size=(120, 100)):
+    width, height = size
+    small = np.random.default_rng(seed).integers(0, 256, size=(height // 4, width // 4, 3), dtype=np.uint8)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+
+
+def reference_preprocess(img, size=(160, 160)):
+    """ขั้นตอนของ preprocess_face เดิม (CLAHE บน Y, bilateral filter, resize, normalize)"""
+    img_yuv = cv2.cvtColor(img, cv2.COLOR_BGR2YUV)
+    img_yuv[:, :, 0] = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(img_yuv[:, :, 0])
+    img = cv2.bilateralFilter(cv2.cvtColor(img_yuv, cv2.COLOR_YUV2BGR), 9, 75, 75)
+    return (cv2.resize(img, size).astype(np.float32) - 127.5) / 128.0
+
+
+def test_quality_profile_matches_original_preprocessing():
+    img = face()
+    np.testing.assert_allclose(FacePreprocessor('quality').preprocess(img), reference_preprocess(img), atol=1e-6)
+
+
+def test_fast_profile_stays_close_to_quality_profile():
+    img = face(1)
+    fast = FacePreprocessor('fast').preprocess(img)
+    assert fast.shape == (160, 160, 3) and fast.dtype == np.float32
+    assert fast.min() >= -1.0 and fast.max() <= 1.0
+    # ไม่มี bilateral filter และ resize ก่อน CLAHE: ภาพยังสอดคล้องกับโปรไฟล์ quality
+    quality = FacePreprocessor('quality').preprocess(img)
+    assert np.corrcoef(fast.ravel(), quality.ravel())[0, 1] > 0.95
+
+
+def test_preprocess_handles_other_channel_layouts_and_bad_input():
+    preprocessor = FacePreprocessor('fast')
+    gray = cv2.cvtColor(face(), cv2.COLOR_BGR2GRAY)
+    rgba = cv2.cvtColor(face(), cv2.COLOR_BGR2BGRA)
+    assert preprocessor.preprocess(gray).shape == (160, 160, 3)
+    assert preprocessor.preprocess(rgba).shape == (160, 160, 3)
+    assert preprocessor.preprocess(None) is None
+    assert preprocessor.preprocess(np.zeros((0, 10, 3), dtype=np.uint8)) is None
+    with pytest.raises(ValueError):
+        FacePreprocessor('bogus')
+
+
+def test_preprocess_batch_writes_into_aligned_tensor_and_skips_missing_faces():
+    preprocessor = FacePreprocessor('quality')
+    imgs = [face(0), None, face(2, size=(60, 80))]
+    out = aligned_empty((3, 160, 160, 3))
+    assert out.ctypes.data % TENSOR_ALIGNMENT == 0
+
+    batch, valid = preprocessor.preprocess_batch(imgs, out=out)
+    assert valid == [0, 2]
+    assert np.shares_memory(batch, out)
+    np.testing.assert_allclose(batch[1], preprocessor.preprocess(imgs[2]), atol=1e-6)
+    assert set(preprocessor.stage_timings()) >= {'clahe', 'bilateral', 'resize', 'normalize'}
+
+
+def test_clahe_is_created_once_per_thread():
+    main = _get_clahe()
+    assert _get_clahe() is main
+    other = []
+    thread = threading.Thread(target=lambda: other.append(_get_clahe()))
+    thread.start()
+    thread.join()
+    assert other[0] is not main
+
+
+def apply(matrix, points):
+    return points @ matrix[:, :2].T + matrix[:, 2]
+
+
+def similarity(points, angle, scale, shift):
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    return scale * points @ rotation.T + shift
+
+
+def test_similarity_transforms_recovers_exact_transforms():
+    dst = landmark_template()
+    # landmarks ของใบหน้าที่ถูกหมุน ย่อ/ขยาย และเลื่อน (สร้างจาก inverse ของ transform ที่ต้องการ)
+    cases = [(0.0, 1.0, (0, 0)), (0.3, 0.5, (40, -12)), (-1.1, 2.5, (-7, 90))]
+    src = np.stack([similarity(dst, angle, scale, shift) for angle, scale, shift in cases])
+
+    matrices = similarity_transforms(src, dst)
+    assert matrices.shape == (3, 2, 3)
+    for matrix, points, (_, scale, _) in zip(matrices, src, cases):
+        np.testing.assert_allclose(apply(matrix, points), dst, atol=1e-4)
+        assert abs(np.hypot(matrix[0, 0], matrix[1, 0]) - 1.0 / scale) < 1e-6
+
+
+def test_similarity_transforms_is_least_squares_for_noisy_landmarks():
+    dst = landmark_template()
+    rng = np.random.default_rng(0)
+    src = similarity(dst, 0.2, 0.8, (10, 5)) + rng.normal(0, 2.0, dst.shape)
+    matrix = similarity_transforms(src[np.newaxis], dst)[0]
+    error = np.sum((apply(matrix, src) - dst) ** 2)
+
+    # รบกวนพารามิเตอร์ใด ๆ แล้วความคลาดเคลื่อนต้องไม่ลดลง
+    for _ in range(20):
+        a, b = matrix[0, 0], matrix[1, 0]
+        da, db, tx, ty = rng.normal(0, 1e-3, 4)
+        perturbed = np.array([[a + da, -(b + db), matrix[0, 2] + tx], [b + db, a + da, matrix[1, 2] + ty]])
+        assert np.sum((apply(perturbed, src) - dst) ** 2) >= error - 1e-9
+
+
+def test_similarity_transforms_marks_degenerate_landmarks_as_nan():
+    src = np.full((1, 5, 2), 50.0)
+    assert np.isnan(similarity_transforms(src, landmark_template())).any()
+
+
+def landmarks_at(points):
+    return {name: tuple(point) for name, point in zip(LANDMARK_NAMES, points)}
+
+
+def test_align_faces_pure_translation_copies_the_region():
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, size=(300, 400, 3), dtype=np.uint8)
+    dst = landmark_template()
+    offset = np.array([120.0, 60.0])
+
+    aligned, valid = align_faces(img, [landmarks_at(dst + offset), None, {'nose': (1, 1)}])
+    assert valid == [0]
+    assert aligned.shape == (1, 160, 160, 3)
+    expected = img[60:220, 120:280].astype(np.int16)
+    assert np.abs(aligned[0].astype(np.int16) - expected).max() <= 1
+
+
+def test_align_faces_downscales_small_faces_without_failing():
+    img = np.random.default_rng(1).integers(0, 256, size=(1200, 1600, 3), dtype=np.uint8)
+    # ใบหน้าใหญ่กว่าผลลัพธ์ 4 เท่า (ต้องย่อบริเวณใบหน้าก่อน warp)
+    big = similarity(landmark_template(), 0.1, 4.0, (300, 200))
+    aligned, valid = align_faces(img, [landmarks_at(big)])
+    assert valid == [0]
+    assert aligned.shape == (1, 160, 160, 3)
+
+
+def test_preprocess_aligned_fills_batch_in_order():
+    img = np.random.default_rng(2).integers(0, 256, size=(300, 400, 3), dtype=np.uint8)
+    dst = landmark_template()
+    landmarks = [landmarks_at(dst + [10, 10]), {}, landmarks_at(dst + [200, 100])]
+    out = aligned_empty((3, 160, 160, 3))
+    assert out.ctypes.data % TENSOR_ALIGNMENT == 0
+
+    batch, valid = FacePreprocessor('quality').preprocess_aligned(img, landmarks, out=out)
+    assert valid == [0, 2]
+    assert batch.shape == (2, 160, 160, 3)
+    assert batch.min() >= -1.0 and batch.max() <= 1.0
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from src.utils.quality import (
+    quality_metrics, quality_metrics_batch, quality_assessment_batch, quality_score, quality_feedback,
+    NO_FACE_FEEDBACK
+)
+
+
+def faces():
+    rng = np.random.default_rng(0)
+    return [
+        rng.integers(0, 256, size=(90, 70, 3), dtype=np.uint8),
+        np.full((150, 150, 3), 20, dtype=np.uint8),
+        rng.integers(100, 140, size=(200, 160), dtype=np.uint8),
+    ]
+
+
+def test_native_size_matches_per_crop_metrics():
+    crops = faces()
+    scores, feedback = quality_assessment_batch(crops + [None], size=None)
+
+    for i, crop in enumerate(crops):
+        metrics = quality_metrics(crop)
+        assert scores[i] == pytest.approx(float(quality_score(*metrics)), abs=1e-4)
+        assert feedback[i] == quality_feedback(*metrics)
+    assert scores[3] == 0
+    assert feedback[3] == NO_FACE_FEEDBACK
+
+
+def test_fixed_size_metrics_are_computed_per_face():
+    crops = faces()
+    brightness, sharpness, contrast = quality_metrics_batch(crops, size=64)
+    assert brightness.shape == sharpness.shape == contrast.shape == (3,)
+    # ภาพสีเดียวต้องไม่มีความคมชัดหรือคอนทราสต์
+    assert sharpness[1] == pytest.approx(0, abs=1e-3)
+    assert contrast[1] == pytest.approx(0, abs=1e-3)
+    assert brightness[1] == pytest.approx(20)
+    # ภาพ noise คมชัดกว่าภาพ noise ช่วงแคบ
+    assert sharpness[0] > sharpness[2]
+
+
+def test_batch_without_faces_or_feedback():
+    scores, feedback = quality_assessment_batch([None, None], with_feedback=False)
+    np.testing.assert_array_equal(scores, [0, 0])
+    assert feedback is None
+    scores, feedback = quality_assessment_batch([])
+    assert scores.shape == (0,)
+    assert feedback == []
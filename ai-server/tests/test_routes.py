@@ -0,0 +1,336 @@
+import io
+import json
+import base64
+import numpy as np
+import pytest
+from conftest import StubDetector, make_image, encode_image
+from src.services.face_analysis import FaceAnalyzer
+from src.services.inference import InferenceBusyError
+from src.utils.embedding_codec import decode_embedding
+
+RECOGNITION = '/api/face/recognition'
+GALLERY = '/api/face/gallery'
+
+
+def post(client, path, **data):
+    response = client.post(path, json=data)
+    return response, response.get_json()
+
+
+def unit(rng, dim=512):
+    vector = rng.normal(size=dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def test_health(client):
+    response = client.get('/api/health')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'ok'
+
+
+def test_metrics_endpoint_and_server_timing(client):
+    client.post(f'{RECOGNITION}/quality', json={'image': encode_image(make_image())})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.data.decode()
+    assert '# TYPE ai_server_stage_seconds histogram' in text
+    assert 'ai_server_stage_seconds_count{stage="detect"}' in text
+    assert 'endpoint="/api/face/recognition/quality",status="200"' in text
+
+    response = client.post(f'{RECOGNITION}/quality', json={'image': encode_image(make_image())},
+                           headers={'X-Server-Timing': '1'})
+    assert 'total;dur=' in response.headers['Server-Timing']
+
+
+def test_detect_returns_face_in_original_coordinates(client):
+    image = encode_image(make_image())
+    response, body = post(client, '/api/face/detection/detect', image=image, max_side=0)
+    assert response.status_code == 200
+    assert body['count'] == 1
+    assert body['faces'][0]['box'] == [80, 60, 160, 120]
+    assert set(body['faces'][0]['landmarks']) == {'left_eye', 'right_eye', 'nose', 'mouth_left', 'mouth_right'}
+
+    # ย่อรูปเหลือครึ่งหนึ่งก่อนตรวจจับ กรอบที่ได้ต้องถูกขยายกลับเป็นพิกัดของรูปต้นฉบับ
+    response, body = post(client, '/api/face/detection/detect', image=image, max_side=160)
+    assert body['faces'][0]['box'] == [80, 60, 160, 120]
+
+    for params in ({'max_side': -1}, {'min_face_size': 0}, {'detector': 'bogus'}):
+        response, _ = post(client, '/api/face/detection/detect', image=image, **params)
+        assert response.status_code == 400
+
+
+def test_detect_uses_full_resolution_by_default(client, monkeypatch):
+    seen = []
+    detect = StubDetector.detect_faces
+
+    def recording(self, image):
+        seen.append(image.shape[:2])
+        return detect(self, image)
+
+    monkeypatch.setattr(StubDetector, 'detect_faces', recording)
+    response, body = post(client, '/api/face/detection/detect', image=encode_image(make_image(size=(2000, 1500))))
+    assert response.status_code == 200
+    assert seen == [(1500, 2000)]
+    assert body['faces'][0]['box'] == [500, 375, 1000, 750]
+
+
+def test_embeddings_json_and_binary_encodings_agree(client):
+    image = encode_image(make_image(1))
+    response, body = post(client, f'{RECOGNITION}/embeddings', image=image)
+    assert response.status_code == 200
+    embedding = np.array(body['embedding'])
+    assert embedding.shape == (512,)
+    assert np.linalg.norm(embedding) == pytest.approx(1.0, abs=1e-3)
+    assert 0 <= body['quality']['score'] <= 100
+
+    response, body = post(client, f'{RECOGNITION}/embeddings', image=image, embedding_encoding='f32')
+    assert body['embedding_encoding'] == 'f32'
+    np.testing.assert_allclose(decode_embedding(body['embedding'], 'f32'), embedding, atol=1e-6)
+
+    response = client.post(f'{RECOGNITION}/embeddings', json={'image': image},
+                           headers={'Accept': 'application/json; embedding=f16'})
+    np.testing.assert_allclose(decode_embedding(response.get_json()['embedding'], 'f16'), embedding, atol=1e-3)
+
+
+def test_image_can_be_sent_as_raw_body_or_multipart(client):
+    image = make_image(1)
+    _, expected = post(client, f'{RECOGNITION}/embeddings', image=encode_image(image))
+    jpeg = base64.b64decode(encode_image(image))
+
+    response = client.post(f'{RECOGNITION}/embeddings', data=jpeg, content_type='image/jpeg')
+    assert response.status_code == 200
+    np.testing.assert_allclose(response.get_json()['embedding'], expected['embedding'], atol=1e-6)
+
+    response = client.post(f'{RECOGNITION}/embeddings', data={'image': (io.BytesIO(jpeg), 'face.jpg')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    np.testing.assert_allclose(response.get_json()['embedding'], expected['embedding'], atol=1e-6)
+
+
+def test_invalid_image_is_rejected(client):
+    response, body = post(client, f'{RECOGNITION}/embeddings', image='not an image')
+    assert response.status_code == 400
+    assert 'error' in body
+
+    response = client.post(f'{RECOGNITION}/embeddings', data=b'not an image', content_type='image/png')
+    assert response.status_code == 400
+    response, _ = post(client, f'{RECOGNITION}/embeddings')
+    assert response.status_code == 400
+
+
+def test_quality_and_analyze(client):
+    image = encode_image(make_image(2))
+    response, quality = post(client, f'{RECOGNITION}/quality', image=image)
+    assert response.status_code == 200
+    assert 0 <= quality['quality']['score'] <= 100
+
+    response, body = post(client, f'{RECOGNITION}/analyze', image=image, outputs='quality,crop,alignment')
+    assert response.status_code == 200
+    face = body['faces'][0]
+    assert face['quality'] == quality['quality']
+    assert 'embedding' not in face
+    assert face['crop'] and face['aligned']
+
+    response, body = post(client, f'{RECOGNITION}/analyze', image=image, outputs='bogus')
+    assert response.status_code == 400
+
+
+def test_compare_images_and_embeddings(client):
+    rng = np.random.default_rng(0)
+    a, b = unit(rng), unit(rng)
+    response, body = post(client, f'{RECOGNITION}/compare', embedding1=a, embedding2=a)
+    assert response.status_code == 200
+    assert body['distance'] == pytest.approx(0.0, abs=1e-5)
+    assert body['is_same_person']
+
+    response, body = post(client, f'{RECOGNITION}/compare', embedding1=a, embedding2=b, threshold=0.1)
+    assert not body['is_same_person']
+    assert body['distance'] == pytest.approx(1 - np.dot(a, b), abs=1e-5)
+
+    image = encode_image(make_image(6))
+    response, body = post(client, f'{RECOGNITION}/compare', image1=image, image2=image)
+    assert response.status_code == 200
+    assert body['distance'] == pytest.approx(0.0, abs=1e-4)
+
+
+def test_compare_matrix_full_and_thresholded(client):
+    rng = np.random.default_rng(1)
+    embeddings = [unit(rng) for _ in range(4)]
+    response, body = post(client, f'{RECOGNITION}/compare/matrix', embeddings1=embeddings)
+    assert response.status_code == 200
+    distances = np.array(body['distances'])
+    assert body['shape'] == [4, 4]
+    np.testing.assert_allclose(np.diag(distances), 0, atol=1e-5)
+    np.testing.assert_allclose(distances, distances.T, atol=1e-6)
+
+    response, body = post(client, f'{RECOGNITION}/compare/matrix', embeddings1=embeddings,
+                          embeddings2=embeddings[:2], threshold=0.01)
+    assert body['shape'] == [4, 2]
+    assert sorted((pair['i'], pair['j']) for pair in body['pairs']) == [(0, 0), (1, 1)]
+
+    response, _ = post(client, f'{RECOGNITION}/compare/matrix', embeddings1=embeddings, embeddings2=[[1.0, 2.0]])
+    assert response.status_code == 400
+
+
+def test_cluster_groups_near_duplicates(client):
+    rng = np.random.default_rng(2)
+    centers = [np.array(unit(rng)) for _ in range(3)]
+    embeddings = [(center + rng.normal(0, 0.01, 512)).tolist() for center in centers for _ in range(4)]
+    response, body = post(client, f'{RECOGNITION}/cluster', embeddings=embeddings, threshold=0.3)
+    assert response.status_code == 200
+    labels = body['labels']
+    assert body['clusters'] == 3
+    assert [len(set(labels[i:i + 4])) for i in range(0, 12, 4)] == [1, 1, 1]
+
+    # จัดใบหน้าใหม่เข้ากลุ่มเดิมโดยไม่จัดกลุ่มเดิมใหม่
+    response, body = post(client, f'{RECOGNITION}/cluster', embeddings=embeddings[:1],
+                          existing_embeddings=embeddings, existing_labels=labels, threshold=0.3)
+    assert body['labels'] == labels[:1]
+
+
+def test_identify_against_inline_gallery(client):
+    image = encode_image(make_image(3))
+    _, body = post(client, f'{RECOGNITION}/embeddings', image=image)
+    rng = np.random.default_rng(3)
+    gallery = {'ids': ['alice', 'bob', 'carol'], 'embeddings': [unit(rng), body['embedding'], unit(rng)]}
+
+    response, body = post(client, f'{RECOGNITION}/identify', image=image, gallery=gallery, k=2)
+    assert response.status_code == 200
+    face = body['faces'][0]
+    assert face['identity'] == 'bob'
+    assert len(face['candidates']) == 2
+    assert face['candidates'][0]['distance'] == pytest.approx(0.0, abs=1e-4)
+
+    response, _ = post(client, f'{RECOGNITION}/identify', image=image, gallery={'ids': ['a'], 'embeddings': []})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('path', ['/identify', '/cluster', '/gallery/search'])
+@pytest.mark.parametrize('k', [-1, 0, 101, 'x'])
+def test_k_is_range_checked(client, path, k):
+    rng = np.random.default_rng(5)
+    embeddings = [unit(rng) for _ in range(3)]
+    if path == '/identify':
+        data = {'image': encode_image(make_image()), 'gallery': {'ids': ['a', 'b', 'c'], 'embeddings': embeddings}}
+    elif path == '/cluster':
+        data = {'embeddings': embeddings}
+    else:
+        data = {'embedding': embeddings[0]}
+    prefix = '/api/face' if path.startswith('/gallery') else RECOGNITION
+    response, body = post(client, prefix + path, k=k, **data)
+    assert response.status_code == 400
+    assert 'error' in body
+
+
+def test_embeddings_batch_reports_errors_per_image(client):
+    payload = encode_image(make_image(4))
+    _, single = post(client, f'{RECOGNITION}/embeddings', image=payload)
+    response, body = post(client, f'{RECOGNITION}/embeddings/batch', images=[payload, 5, {}, 'garbage', payload])
+    assert response.status_code == 200
+    assert [result['status'] for result in body['results']] == ['success', 'error', 'error', 'error', 'success']
+    assert body['succeeded'] == 2
+    for result in (body['results'][0], body['results'][4]):
+        np.testing.assert_allclose(result['faces'][0]['embedding'], single['embedding'], atol=1e-5)
+
+    response, _ = post(client, f'{RECOGNITION}/embeddings/batch', images=[])
+    assert response.status_code == 400
+
+
+def test_quality_batch_reports_errors_per_image(client):
+    payload = encode_image(make_image(4))
+    response, body = post(client, f'{RECOGNITION}/quality/batch', images=[payload, 'garbage'], feedback=False)
+    assert response.status_code == 200
+    assert [result['status'] for result in body['results']] == ['success', 'error']
+    assert 0 <= body['results'][0]['faces'][0]['quality']['score'] <= 100
+
+
+def test_quality_batch_matches_single_image_quality(client):
+    payloads = [encode_image(make_image(seed, size=(480, 640))) for seed in (6, 7)]
+    response, body = post(client, f'{RECOGNITION}/quality/batch', images=payloads)
+    assert response.status_code == 200
+    for payload, result in zip(payloads, body['results']):
+        _, single = post(client, f'{RECOGNITION}/quality', image=payload)
+        assert result['faces'][0]['quality'] == single['quality']
+
+
+def test_stream_returns_one_line_per_frame_and_summary(client):
+    frames = [{'image': encode_image(make_image(5)), 'timestamp': i * 0.1} for i in range(3)]
+    frames.insert(1, {'image': 'garbage'})
+    body = ''.join(json.dumps(frame) + '\n' for frame in frames)
+    response = client.post(f'{RECOGNITION}/stream?detect_every=2&identify=false', data=body,
+                           content_type='application/x-ndjson')
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+
+    assert len(lines) == len(frames) + 1
+    assert 'error' in lines[1]
+    assert all('error' not in line for line in (lines[0], lines[2], lines[3]))
+    assert lines[-1]['summary']['frames'] == 3
+    assert any(event['event'] == 'track_ended' for event in lines[-1]['events'])
+
+
+def test_stream_requires_ndjson(client):
+    response = client.post(f'{RECOGNITION}/stream', json={'image': encode_image(make_image())})
+    assert response.status_code == 415
+
+
+def test_gallery_add_search_and_remove(client):
+    rng = np.random.default_rng(4)
+    dave, erin = unit(rng), unit(rng)
+    response, body = post(client, f'{GALLERY}/add', user_id='dave', embedding=dave)
+    assert response.status_code == 200
+    assert body['added'] == 1
+    post(client, f'{GALLERY}/add', user_id='erin', embeddings=[erin, erin])
+
+    response, body = post(client, f'{GALLERY}/search', embedding=dave, k=1)
+    assert response.status_code == 200
+    assert body['matches'][0]['user_id'] == 'dave'
+    assert body['matches'][0]['distance'] == pytest.approx(0.0, abs=1e-5)
+
+    response, body = post(client, f'{GALLERY}/search', embeddings=[dave, erin], k=1)
+    assert [matches[0]['user_id'] for matches in body['matches']] == ['dave', 'erin']
+
+    assert client.delete(f'{GALLERY}/users/erin').get_json()['removed'] == 2
+    _, body = post(client, f'{GALLERY}/search', embedding=erin, k=5)
+    assert 'erin' not in [match['user_id'] for match in body['matches']]
+
+    response, _ = post(client, f'{GALLERY}/add', embedding=dave)
+    assert response.status_code == 400
+
+
+def test_busy_model_returns_503_with_retry_after(client, monkeypatch):
+    def busy(self, *args, **kwargs):
+        raise InferenceBusyError('facenet', 2)
+
+    monkeypatch.setattr(FaceAnalyzer, 'analyze_many', busy)
+    response, body = post(client, f'{RECOGNITION}/embeddings/batch', images=[encode_image(make_image())])
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
+    assert body['retry_after'] == 2
+
+
+@pytest.mark.parametrize('path,target', [
+    ('/compare/matrix', 'src.services.face_recognition.FaceRecognition.distance_matrix'),
+    ('/cluster', 'src.services.face_clustering.FaceClusterer.fit'),
+])
+def test_busy_error_after_input_parsing_returns_503(client, monkeypatch, path, target):
+    def busy(self, *args, **kwargs):
+        raise InferenceBusyError('facenet', 3)
+
+    monkeypatch.setattr(target, busy)
+    embeddings = np.random.default_rng(0).normal(size=(3, 8)).tolist()
+    response, body = post(client, f'{RECOGNITION}{path}', embeddings1=embeddings, embeddings=embeddings)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+
+
+def test_unexpected_error_returns_json_500(client, monkeypatch):
+    def broken(self, *args, **kwargs):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(FaceAnalyzer, 'analyze', broken)
+    response, body = post(client, f'{RECOGNITION}/quality', image=encode_image(make_image()))
+    assert response.status_code == 500
+    assert body == {'error': 'boom'}
+
+    assert client.get('/api/does-not-exist').status_code == 404